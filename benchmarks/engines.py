@@ -0,0 +1,132 @@
+# engines.py — random forest vs histogram-based gradient boosting in the training pipeline
+#
+# For each size, synthetic listings (see synthetic_data.py, cached in benchmarks/data/) are
+# filtered like basic_cleaning and split into train and test (modeling.test_size). The
+# train_random_forest inference pipeline is then built for every engine (modeling.engine,
+# with the parameters of modeling.random_forest / modeling.hist_gradient_boosting) and:
+#
+#   preprocess_s  fit_transform of the preprocessor on the train split
+#   fit_s         fit of the model on the transformed train split
+#   predict_s     full pipeline on the test split
+#   latency_ms    full pipeline on a single row (median of --latency-rows calls)
+#   pickle_mb     size of the pickled pipeline (what the mlflow export stores)
+#   compact_mb    size of the compact export (wandb_utils.compact_forest)
+#   mae, r2       on the test split
+#
+#   python benchmarks/engines.py --sizes 20000 1000000
+import argparse
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAIN_DIR = os.path.join(PROJECT_ROOT, "src", "train_random_forest")
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "components"))
+sys.path.insert(0, TRAIN_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+from omegaconf import OmegaConf  # noqa: E402
+from sklearn.metrics import mean_absolute_error, r2_score  # noqa: E402
+from sklearn.model_selection import train_test_split  # noqa: E402
+
+from run import ENGINES, get_inference_pipeline  # noqa: E402
+from scaling import synthetic_input  # noqa: E402
+from wandb_utils.compact_forest import save_compact  # noqa: E402
+from wandb_utils.intermediate import read_table  # noqa: E402
+
+COLUMNS = ["preprocess_s", "fit_s", "predict_s", "latency_ms", "pickle_mb", "compact_mb", "mae", "r2"]
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def run_engine(engine, model_config, cfg, X_train, y_train, X_test, y_test, latency_rows):
+    sk_pipe, _ = get_inference_pipeline(
+        model_config,
+        cfg.modeling.max_tfidf_features,
+        cfg.modeling.text_features,
+        cfg.modeling.hashing_features,
+        cfg.modeling.hashing_idf,
+        engine=engine,
+    )
+    result = {}
+    start = time.perf_counter()
+    Xt_train = sk_pipe["preprocessor"].fit_transform(X_train, y_train)
+    result["preprocess_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sk_pipe.steps[-1][1].fit(Xt_train, y_train)
+    result["fit_s"] = time.perf_counter() - start
+    del Xt_train
+
+    start = time.perf_counter()
+    y_pred = sk_pipe.predict(X_test)
+    result["predict_s"] = time.perf_counter() - start
+
+    latencies = []
+    for i in range(min(latency_rows, len(X_test))):
+        row = X_test.iloc[[i]]
+        start = time.perf_counter()
+        sk_pipe.predict(row)
+        latencies.append(time.perf_counter() - start)
+    result["latency_ms"] = float(np.median(latencies)) * 1000
+
+    result["pickle_mb"] = len(pickle.dumps(sk_pipe, protocol=pickle.HIGHEST_PROTOCOL)) / 2**20
+    with tempfile.TemporaryDirectory() as tmp:
+        result["compact_mb"] = dir_size(save_compact(sk_pipe, os.path.join(tmp, "compact"))) / 2**20
+
+    result["mae"] = mean_absolute_error(y_test, y_pred)
+    result["r2"] = r2_score(y_test, y_pred)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the model engines of train_random_forest")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20_000, 1_000_000], help="Numbers of raw listings")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument(
+        "--n-estimators", type=int, default=None, help="Override modeling.random_forest.n_estimators of config.yaml"
+    )
+    parser.add_argument(
+        "--text-features", choices=["tfidf", "hashing"], default=None, help="Override modeling.text_features"
+    )
+    parser.add_argument("--latency-rows", type=int, default=200, help="Single-row predictions timed")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load(os.path.join(PROJECT_ROOT, "config.yaml"))
+    if args.text_features is not None:
+        cfg.modeling.text_features = args.text_features
+    configs = {}
+    for engine in args.engines:
+        configs[engine] = dict(OmegaConf.to_container(cfg.modeling[engine]))
+        configs[engine]["random_state"] = cfg.modeling.random_seed
+    if args.n_estimators is not None and "random_forest" in configs:
+        configs["random_forest"]["n_estimators"] = args.n_estimators
+
+    results = {}
+    print(f"{'rows':>10} {'engine':<24}" + "".join(f"{c:>13}" for c in COLUMNS))
+    for n_rows in args.sizes:
+        df = read_table(synthetic_input(n_rows, cfg.modeling.random_seed, "parquet"))
+        df = df[df["price"].between(cfg.etl.min_price, cfg.etl.max_price)].reset_index(drop=True)
+        y = df.pop("price")
+        X_train, X_test, y_train, y_test = train_test_split(
+            df, y, test_size=cfg.modeling.test_size, random_state=cfg.modeling.random_seed
+        )
+        del df, y
+        results[str(n_rows)] = {}
+        for engine in args.engines:
+            result = run_engine(
+                engine, configs[engine], cfg, X_train, y_train, X_test, y_test, args.latency_rows
+            )
+            results[str(n_rows)][engine] = result
+            print(f"{n_rows:>10} {engine:<24}" + "".join(f"{result[c]:>13.3f}" for c in COLUMNS), flush=True)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({"configs": configs, "text_features": cfg.modeling.text_features, "sizes": results}, fp, indent=2)
@@ -0,0 +1,43 @@
+# execution_modes.py — wall-clock comparison of main.execution=subprocess vs inprocess
+#
+# Runs the full `python main.py` pipeline (download, basic_cleaning, data_split on the
+# bundled sample) a few times per mode with the step cache disabled and prints the timings.
+#
+#   python benchmarks/execution_modes.py --repeats 3
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_mode(mode: str, repeats: int):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "main.py", f"main.execution={mode}", "main.cache=false"],
+            cwd=PROJECT_ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare subprocess vs in-process step execution")
+    parser.add_argument("--repeats", type=int, default=3, help="Pipeline runs per mode")
+    args = parser.parse_args()
+
+    results = {mode: time_mode(mode, args.repeats) for mode in ("subprocess", "inprocess")}
+
+    print(f"{'mode':<12}{'mean (s)':>10}{'min (s)':>10}")
+    for mode, times in results.items():
+        print(f"{mode:<12}{statistics.mean(times):>10.2f}{min(times):>10.2f}")
+    speedup = statistics.mean(results["subprocess"]) / statistics.mean(results["inprocess"])
+    print(f"in-process speedup: {speedup:.2f}x")
@@ -0,0 +1,124 @@
+# model_export.py — size and load time of the two random forest export formats
+#
+# Fits the train_random_forest inference pipeline (modeling.random_forest of config.yaml)
+# on synthetic listings (see synthetic_data.py), exports it with mlflow.sklearn.save_model
+# and with wandb_utils.compact_forest.save_compact, then for each format reports:
+#
+#   size_mb   size of the export on disk
+#   load_s    time to load it in a fresh Python process (best of --repeats), imports excluded
+#   predict_s time to predict the held-out rows
+#
+# and the largest difference between the predictions of the two loaded models.
+#
+#   python benchmarks/model_export.py --rows 100000
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+TRAIN_DIR = os.path.join(PROJECT_ROOT, "src", "train_random_forest")
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "components"))
+sys.path.insert(0, TRAIN_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+from omegaconf import OmegaConf  # noqa: E402
+
+from synthetic_data import iter_synthetic  # noqa: E402
+from wandb_utils.intermediate import apply_schema  # noqa: E402
+
+# Run in a fresh process: the load is timed after the libraries it needs are imported
+LOAD_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {components!r})
+import mlflow.sklearn, sklearn.ensemble
+from wandb_utils.compact_forest import load_compact
+start = time.perf_counter()
+model = mlflow.sklearn.load_model({path!r}) if {fmt!r} == "mlflow" else load_compact({path!r})
+print(json.dumps({{"load_s": time.perf_counter() - start}}))
+"""
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def load_time(path, fmt, repeats):
+    times = []
+    for _ in range(repeats):
+        script = LOAD_SCRIPT.format(components=os.path.join(PROJECT_ROOT, "components"), path=path, fmt=fmt)
+        out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        times.append(json.loads(out.strip().splitlines()[-1])["load_s"])
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the mlflow and compact random forest exports")
+    parser.add_argument("--rows", type=int, default=100_000, help="Synthetic listings to train on")
+    parser.add_argument("--n-estimators", type=int, default=None, help="Override modeling.random_forest.n_estimators")
+    parser.add_argument(
+        "--text-features", choices=["tfidf", "hashing"], default=None, help="Override modeling.text_features"
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Loads per format (the best is reported)")
+    args = parser.parse_args()
+
+    import mlflow.sklearn
+    from run import get_inference_pipeline
+    from wandb_utils.compact_forest import COMPACT_DIR, load_compact, save_compact
+
+    cfg = OmegaConf.load(os.path.join(PROJECT_ROOT, "config.yaml"))
+    rf_config = dict(OmegaConf.to_container(cfg.modeling.random_forest))
+    rf_config["random_state"] = cfg.modeling.random_seed
+    if args.n_estimators is not None:
+        rf_config["n_estimators"] = args.n_estimators
+    if args.text_features is not None:
+        cfg.modeling.text_features = args.text_features
+
+    df = apply_schema(next(iter_synthetic(args.rows, cfg.modeling.random_seed)))
+    df = df[df["price"].between(cfg.etl.min_price, cfg.etl.max_price)].reset_index(drop=True)
+    y = df.pop("price")
+    n_test = len(df) // 5
+    X_train, y_train, X_test = df.iloc[n_test:], y.iloc[n_test:], df.iloc[:n_test]
+
+    sk_pipe, _ = get_inference_pipeline(
+        rf_config,
+        cfg.modeling.max_tfidf_features,
+        cfg.modeling.text_features,
+        cfg.modeling.hashing_features,
+        cfg.modeling.hashing_idf,
+    )
+    print(f"Fitting on {len(X_train)} rows, {rf_config['n_estimators']} trees of max_depth {rf_config['max_depth']}")
+    sk_pipe.fit(X_train, y_train)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {"mlflow": os.path.join(tmp, "random_forest_dir"), "compact": os.path.join(tmp, COMPACT_DIR)}
+        cwd = os.getcwd()
+        os.chdir(TRAIN_DIR)  # code_paths are relative to the training step
+        try:
+            # cloudpickle: the default of the mlflow version pinned by train_random_forest
+            mlflow.sklearn.save_model(
+                sk_pipe,
+                paths["mlflow"],
+                code_paths=["feature_engineering.py"],
+                serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE,
+            )
+            save_compact(sk_pipe, paths["compact"], code_paths=["feature_engineering.py"])
+        finally:
+            os.chdir(cwd)
+
+        models = {"mlflow": mlflow.sklearn.load_model(paths["mlflow"]), "compact": load_compact(paths["compact"])}
+        predictions = {}
+        print(f"{'format':<10}{'size MB':>10}{'load s':>10}{'predict s':>11}")
+        for fmt, path in paths.items():
+            start = time.perf_counter()
+            predictions[fmt] = models[fmt].predict(X_test)
+            predict_s = time.perf_counter() - start
+            print(f"{fmt:<10}{dir_size(path) / 2**20:>10.1f}{load_time(path, fmt, args.repeats):>10.3f}{predict_s:>11.3f}")
+
+    diff = np.abs(predictions["mlflow"] - predictions["compact"])
+    print(f"Max |prediction difference| on {len(X_test)} rows: {diff.max():.2e} "
+          f"(relative {(diff / np.abs(predictions['mlflow'])).max():.2e})")
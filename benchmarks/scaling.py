@@ -0,0 +1,234 @@
+# scaling.py — how the pipeline scales with the number of listings
+#
+# For each size, synthetic raw data (see synthetic_data.py) is generated once and cached in
+# benchmarks/data/, then the stages run in this process on the data of the previous stage:
+#
+#   basic_cleaning  go() of src/basic_cleaning (read raw file, filter, write + sketch)
+#   data_split      go() of src/data_split (train/val/test split, written to a temp dir)
+#   preprocessing   fit_transform of the train_random_forest preprocessor on the train split
+#   rf_fit          RandomForestRegressor fit on the transformed train split
+#   rf_predict      full inference pipeline (preprocessor + forest) on the test split
+#
+# Each stage records wall time, CPU time (all threads), rows processed and peak RSS (see
+# wandb_utils.instrumentation). The results are written as JSON (one file per run, tagged
+# with the git commit) so runs of different commits can be compared:
+#
+#   python benchmarks/scaling.py --sizes 20000 1000000 --n-estimators 20
+#   python benchmarks/scaling.py --compare benchmarks/results/old.json benchmarks/results/new.json
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "components"))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src", "train_random_forest"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from omegaconf import OmegaConf  # noqa: E402
+from sklearn.ensemble import RandomForestRegressor  # noqa: E402
+from sklearn.pipeline import Pipeline  # noqa: E402
+
+from synthetic_data import write_synthetic  # noqa: E402
+from wandb_utils.artifact_store import STORE_ENV  # noqa: E402
+from wandb_utils.instrumentation import Stage  # noqa: E402
+
+DATA_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "data")
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+DEFAULT_SIZES = [20_000, 1_000_000, 10_000_000]
+
+
+def _load(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def measure(results, stage):
+    """Record the resources used by the body in results[stage]; set .rows_in inside"""
+    with Stage(stage) as record:
+        yield record
+    results[stage] = record.to_dict()
+    print(f"  {stage:<15}{record.wall_s:>9.2f}s wall {record.cpu_s:>9.2f}s cpu "
+          f"{results[stage]['peak_rss_mb']:>9.1f} MB peak")
+
+
+def synthetic_input(n_rows, seed, fmt):
+    """Path of the cached synthetic raw data of this size, generating it if needed"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"synthetic_{n_rows}_{seed}.{fmt}")
+    if not os.path.exists(path):
+        print(f"Generating {n_rows} synthetic listings -> {path}")
+        tmp = path + ".tmp." + fmt
+        write_synthetic(tmp, n_rows, seed)
+        os.replace(tmp, path)
+    return path
+
+
+def run_size(n_rows, cfg, rf_config, fmt, workdir):
+    basic_cleaning = _load("bench_basic_cleaning", os.path.join(PROJECT_ROOT, "src", "basic_cleaning", "run.py"))
+    data_split = _load("bench_data_split", os.path.join(PROJECT_ROOT, "src", "data_split", "run.py"))
+    train = _load("bench_train_random_forest", os.path.join(PROJECT_ROOT, "src", "train_random_forest", "run.py"))
+
+    raw_path = synthetic_input(n_rows, cfg.modeling.random_seed, fmt)
+    print(f"{n_rows} rows")
+    results = {}
+
+    clean_name = f"bench_clean_{n_rows}.{fmt}"
+    with measure(results, "basic_cleaning") as record:
+        clean_df = basic_cleaning.go(
+            input_artifact=raw_path,
+            output_artifact=os.path.join(workdir, clean_name),
+            output_type="clean_sample",
+            output_description="benchmark",
+            min_price=cfg.etl.min_price,
+            max_price=cfg.etl.max_price,
+        )
+        record.rows_in = n_rows
+    split_args = argparse.Namespace(
+        input_artifact=clean_name,
+        test_size=cfg.modeling.test_size,
+        val_size=cfg.modeling.val_size,
+        stratify_by=cfg.modeling.stratify_by,
+        random_seed=cfg.modeling.random_seed,
+    )
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with measure(results, "data_split") as record:
+            train_df, val_df, test_df = data_split.go(split_args, df=clean_df)
+            record.rows_in = len(clean_df)
+    finally:
+        os.chdir(cwd)
+    del clean_df, val_df
+
+    X_train = train_df.drop(columns=["price"])
+    y_train = train_df["price"]
+    X_test = test_df.drop(columns=["price"])
+    del train_df, test_df
+
+    sk_pipe, _ = train.get_inference_pipeline(
+        rf_config,
+        cfg.modeling.max_tfidf_features,
+        cfg.modeling.text_features,
+        cfg.modeling.hashing_features,
+        cfg.modeling.hashing_idf,
+    )
+    preprocessor = sk_pipe["preprocessor"]
+    with measure(results, "preprocessing") as record:
+        Xt_train = preprocessor.fit_transform(X_train, y_train)
+        record.rows_in = len(X_train)
+
+    forest = RandomForestRegressor(**rf_config)
+    with measure(results, "rf_fit") as record:
+        forest.fit(Xt_train, y_train)
+        record.rows_in = len(X_train)
+    del Xt_train
+
+    fitted = Pipeline([("preprocessor", preprocessor), ("random_forest", forest)])
+    with measure(results, "rf_predict") as record:
+        fitted.predict(X_test)
+        record.rows_in = len(X_test)
+
+    for record in results.values():
+        record["rows_per_s"] = round(record["rows_in"] / record["wall_s"], 1) if record["wall_s"] else None
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_ROOT, capture_output=True, text=True
+        ).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path, new_path):
+    """Print new/old ratios of wall time and peak RSS for every size and stage both runs have"""
+    with open(old_path) as fp:
+        old = json.load(fp)
+    with open(new_path) as fp:
+        new = json.load(fp)
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'rows':>10} {'stage':<15}{'old s':>9}{'new s':>9}{'ratio':>8}{'old MB':>9}{'new MB':>9}")
+    for size, stages in new["sizes"].items():
+        for stage, record in stages.items():
+            before = old["sizes"].get(size, {}).get(stage)
+            if before is None:
+                continue
+            ratio = record["wall_s"] / before["wall_s"] if before["wall_s"] else float("nan")
+            print(f"{size:>10} {stage:<15}{before['wall_s']:>9.2f}{record['wall_s']:>9.2f}{ratio:>8.2f}"
+                  f"{before['peak_rss_mb']:>9.1f}{record['peak_rss_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and memory-profile the pipeline stages at several data sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of raw listings")
+    parser.add_argument(
+        "--format", choices=["parquet", "csv"], default="parquet", help="Format of the synthetic raw data"
+    )
+    parser.add_argument(
+        "--n-estimators", type=int, default=None, help="Override modeling.random_forest.n_estimators of config.yaml"
+    )
+    parser.add_argument(
+        "--text-features", choices=["tfidf", "hashing"], default=None, help="Override modeling.text_features"
+    )
+    parser.add_argument("--output", type=str, default=None, help="Results file (default: benchmarks/results/...)")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"), default=None, help="Compare two results files and exit"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    cfg = OmegaConf.load(os.path.join(PROJECT_ROOT, "config.yaml"))
+    rf_config = dict(OmegaConf.to_container(cfg.modeling.random_forest))
+    rf_config["random_state"] = cfg.modeling.random_seed
+    if args.n_estimators is not None:
+        rf_config["n_estimators"] = args.n_estimators
+    if args.text_features is not None:
+        cfg.modeling.text_features = args.text_features
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "format": args.format,
+        "rf_config": rf_config,
+        "text_features": cfg.modeling.text_features,
+        "sizes": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="pipeline_bench_")
+    # basic_cleaning logs its output to the artifact store, where data_split finds it
+    os.environ[STORE_ENV] = os.path.join(workdir, "artifacts")
+    try:
+        for n_rows in args.sizes:
+            report["sizes"][str(n_rows)] = run_size(n_rows, cfg, rf_config, args.format, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"scaling_{report['commit']}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fp:
+        json.dump(report, fp, indent=2)
+    print(f"Results written to {output}")
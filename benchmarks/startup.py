@@ -0,0 +1,110 @@
+# startup.py — import time of every step entry point, checked against a budget
+#
+# Every step runs in a fresh interpreter (an mlflow.run subprocess), so the modules its
+# entry point imports at load time are paid on every step of every run. Each entry point
+# is started with --help (argparse exits right after the module is loaded; main.py only
+# composes its config, data_check imports its pytest modules) and timed, best of --repeats,
+# with `python -X importtime` giving the top-level modules that cost the most:
+#
+#   python benchmarks/startup.py                # table of startup times and heaviest imports
+#   python benchmarks/startup.py --check        # exit 1 when a step exceeds its budget
+#
+# Budgets (seconds) are in startup_budget.json; --budget-scale relaxes them on slow machines.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budget.json")
+
+# step -> (directory, arguments of the interpreter)
+ENTRY_POINTS = {
+    "main": (".", ["main.py", "--cfg", "job"]),
+    "download": ("components/get_data", ["run.py", "--help"]),
+    "basic_cleaning": ("src/basic_cleaning", ["run.py", "--help"]),
+    "data_check": ("src/data_check", ["-c", "import conftest, test_data"]),
+    "data_split": ("src/data_split", ["run.py", "--help"]),
+    "train_val_test_split": ("components/train_val_test_split", ["run.py", "--help"]),
+    "train_random_forest": ("src/train_random_forest", ["run.py", "--help"]),
+    "test_regression_model": ("components/test_regression_model", ["run.py", "--help"]),
+    "serve_model": ("components/serve_model", ["run.py", "--help"]),
+}
+
+
+def parse_importtime(stderr, top):
+    """
+    Heaviest top-level imports from the output of `python -X importtime`
+
+    :param stderr: the stderr of the process
+    :param top: number of modules returned
+    :return: list of (module, cumulative seconds), heaviest first
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nested imports are indented below the module importing them
+        if not name[1:].startswith(" "):
+            modules.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(modules, key=lambda m: -m[1])[:top]
+
+
+def time_entry_point(step, repeats, top):
+    directory, argv = ENTRY_POINTS[step]
+    env = dict(os.environ)
+    paths = [os.path.join(PROJECT_ROOT, "components"), env.get("PYTHONPATH")]
+    env["PYTHONPATH"] = os.pathsep.join(p for p in paths if p)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + argv, cwd=os.path.join(PROJECT_ROOT, directory), env=env, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    profile = subprocess.run(
+        [sys.executable, "-X", "importtime"] + argv, cwd=os.path.join(PROJECT_ROOT, directory), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    return min(times), parse_importtime(profile.stderr, top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup time of the step entry points")
+    parser.add_argument("--steps", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--repeats", type=int, default=3, help="Starts per entry point (the best is reported)")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest imports listed per entry point")
+    parser.add_argument("--check", action="store_true", help="Exit 1 when a step exceeds its budget")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiply every budget (slow machines)")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as fp:
+        budgets = json.load(fp)
+
+    results = {}
+    over = []
+    print(f"{'step':<24}{'startup s':>10}{'budget s':>10}  heaviest imports (cumulative s)")
+    for step in args.steps:
+        startup_s, heaviest = time_entry_point(step, args.repeats, args.top)
+        budget = budgets.get(step)
+        budget = None if budget is None else budget * args.budget_scale
+        if budget is not None and startup_s > budget:
+            over.append(step)
+        results[step] = {"startup_s": round(startup_s, 3), "budget_s": budget, "heaviest": heaviest}
+        print(
+            f"{step:<24}{startup_s:>10.2f}{'-' if budget is None else f'{budget:.2f}':>10}  "
+            + ", ".join(f"{name} {seconds:.2f}" for name, seconds in heaviest)
+            + ("   OVER BUDGET" if step in over else "")
+        )
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+    if args.check and over:
+        print(f"Startup budget exceeded: {', '.join(over)}")
+        sys.exit(1)
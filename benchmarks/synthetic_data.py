@@ -0,0 +1,116 @@
+# synthetic_data.py — synthetic NYC Airbnb listings at any scale
+#
+# Rows are bootstrapped from the bundled raw sample (components/get_data/data/sample1.csv)
+# and perturbed, so the schema checked by data_check's test_column_names and the joint
+# distributions of borough, neighbourhood, room type, location, price, reviews and names
+# are those of the real data, including the price outliers basic_cleaning removes.
+#
+# The output depends only on (n_rows, seed): rows are generated in fixed blocks of
+# BLOCK_SIZE with one random stream per block and written incrementally, so 10M rows
+# never have to fit in memory.
+#
+#   python benchmarks/synthetic_data.py --rows 1000000 --output synthetic_1M.parquet
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "components"))
+
+from wandb_utils.intermediate import CSV_DTYPES, TableWriter  # noqa: E402
+
+SEED_DATA = os.path.join(PROJECT_ROOT, "components", "get_data", "data", "sample1.csv")
+BLOCK_SIZE = 500_000
+
+# Perturbations applied to the bootstrapped rows
+COORD_JITTER_DEG = 0.003  # ~300m
+PRICE_SIGMA = 0.15  # multiplicative log-normal noise
+REVIEW_DATE_SHIFT_DAYS = 60
+HOSTS_PER_LISTING = 0.85  # distinct hosts / listings in the real data
+
+
+def load_seed(path=SEED_DATA):
+    """Raw listings the synthetic rows are bootstrapped from"""
+    seed = pd.read_csv(path, dtype=CSV_DTYPES)
+    seed["last_review"] = pd.to_datetime(seed["last_review"], format="%Y-%m-%d")
+    return seed
+
+
+def generate_block(seed_df, n_rows, first_id, n_hosts, rng):
+    """
+    Generate n_rows synthetic listings
+
+    :param seed_df: real listings (see load_seed)
+    :param n_rows: number of rows to generate
+    :param first_id: id of the first row (ids are consecutive, hence unique across blocks)
+    :param n_hosts: size of the pool host ids are drawn from
+    :param rng: np.random.Generator
+    :return: DataFrame with the raw dataset columns
+    """
+    df = seed_df.iloc[rng.integers(0, len(seed_df), n_rows)].reset_index(drop=True)
+
+    df["id"] = np.arange(first_id, first_id + n_rows, dtype="int64")
+    df["host_id"] = rng.integers(1, n_hosts + 1, n_rows, dtype="int64")
+
+    df["latitude"] += rng.normal(0.0, COORD_JITTER_DEG, n_rows)
+    df["longitude"] += rng.normal(0.0, COORD_JITTER_DEG, n_rows)
+
+    df["price"] = np.round(df["price"] * rng.lognormal(0.0, PRICE_SIGMA, n_rows)).astype("int64")
+
+    # Review counts keep their mean and listings keep having (or not having) reviews; the
+    # review date and rate are missing exactly when there are none, as in the real data
+    seed_reviews = df["number_of_reviews"].to_numpy()
+    has_reviews = (seed_reviews > 0) & df["last_review"].notna().to_numpy()
+    reviews = np.where(has_reviews, 1 + rng.poisson(np.maximum(seed_reviews - 1, 0)), 0).astype("int64")
+    df["number_of_reviews"] = reviews
+
+    last_date = seed_df["last_review"].max()
+    shift = pd.to_timedelta(rng.integers(-REVIEW_DATE_SHIFT_DAYS, REVIEW_DATE_SHIFT_DAYS + 1, n_rows), unit="D")
+    df["last_review"] = (df["last_review"] + shift).clip(upper=last_date).where(has_reviews)
+
+    rate = df["reviews_per_month"] * reviews / np.maximum(seed_reviews, 1)
+    df["reviews_per_month"] = rate.round(2).clip(lower=0.01).where(has_reviews)
+
+    return df
+
+
+def iter_synthetic(n_rows, seed=42, seed_df=None):
+    """
+    Generate n_rows synthetic listings in blocks of at most BLOCK_SIZE rows
+
+    :param n_rows: total number of rows
+    :param seed: random seed
+    :param seed_df: real listings to bootstrap from (default: the bundled sample)
+    :return: iterator of DataFrames
+    """
+    seed_df = load_seed() if seed_df is None else seed_df
+    n_hosts = max(1, int(n_rows * HOSTS_PER_LISTING))
+    for block, first in enumerate(range(0, n_rows, BLOCK_SIZE)):
+        rng = np.random.default_rng([seed, block])
+        yield generate_block(seed_df, min(BLOCK_SIZE, n_rows - first), first + 1, n_hosts, rng)
+
+
+def write_synthetic(path, n_rows, seed=42):
+    """
+    Write n_rows synthetic listings to path (.parquet or .csv)
+
+    :return: number of rows written
+    """
+    with TableWriter(path) as writer:
+        for block in iter_synthetic(n_rows, seed):
+            writer.write(block)
+    return writer.rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic NYC Airbnb listings")
+    parser.add_argument("--rows", type=int, required=True, help="Number of listings to generate")
+    parser.add_argument("--output", type=str, required=True, help="Output file (.parquet or .csv)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    n = write_synthetic(args.output, args.rows, args.seed)
+    print(f"Wrote {n} synthetic listings to {args.output}")
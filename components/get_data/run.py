@@ -8,6 +8,7 @@ import os
 
 import wandb
 
+from wandb_utils.instrumentation import StepMetrics
 from wandb_utils.log_artifact import log_artifact
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
@@ -19,15 +20,19 @@ def go(args):
     run = wandb.init(job_type="download_file")
     run.config.update(args)
 
-    logger.info(f"Returning sample {args.sample}")
-    logger.info(f"Uploading {args.artifact_name} to Weights & Biases")
-    log_artifact(
-        args.artifact_name,
-        args.artifact_type,
-        args.artifact_description,
-        os.path.join("data", args.sample),
-        run,
-    )
+    with StepMetrics("download") as metrics:
+        logger.info(f"Returning sample {args.sample}")
+        logger.info(f"Uploading {args.artifact_name} to Weights & Biases")
+        with metrics.stage("log_artifact"):
+            log_artifact(
+                args.artifact_name,
+                args.artifact_type,
+                args.artifact_description,
+                os.path.join("data", args.sample),
+                run,
+            )
+
+    run.finish()
 
 
 if __name__ == "__main__":
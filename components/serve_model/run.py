@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+"""
+This step serves the exported model over local HTTP, scoring concurrent requests in micro-batches
+
+  POST /predict  body: a listing, a list of listings or {"instances": [...]} -> {"prices": [...]}
+  GET  /metrics  latency percentiles (p50/p99), throughput and batch counters
+  GET  /health   liveness check
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from wandb_utils.artifact_store import default_store
+from wandb_utils.instrumentation import StepMetrics
+from wandb_utils.intermediate import CSV_DTYPES, apply_schema
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logger = logging.getLogger()
+
+
+class ServingStats:
+    """
+    Thread-safe request counters and a rolling window of request latencies
+    """
+
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self.started = time.monotonic()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+
+    def record_request(self, latency_s, n_rows, ok=True):
+        with self._lock:
+            self._latencies.append(latency_s)
+            self.requests += 1
+            self.rows += n_rows
+            self.errors += 0 if ok else 1
+
+    def record_batch(self, n_rows):
+        with self._lock:
+            self.batches += 1
+            self._batch_sizes.append(n_rows)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            batch_sizes = np.array(self._batch_sizes)
+            uptime = time.monotonic() - self.started
+            return {
+                "uptime_s": round(uptime, 3),
+                "requests": self.requests,
+                "rows": self.rows,
+                "batches": self.batches,
+                "errors": self.errors,
+                "requests_per_s": round(self.requests / uptime, 3) if uptime else 0.0,
+                "rows_per_s": round(self.rows / uptime, 3) if uptime else 0.0,
+                "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+                "latency_ms_p99": round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+                "mean_batch_rows": round(float(batch_sizes.mean()), 3) if len(batch_sizes) else None,
+            }
+
+
+class _Pending:
+    def __init__(self, X):
+        self.X = X
+        self.arrival = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Groups the listings of concurrent requests into one predict call.
+
+    A batch is closed when it holds max_batch_size rows or when its oldest request has
+    waited max_latency_ms, whichever comes first, and is scored on a single worker thread.
+    Requests are validated (prepare_fn) before they are queued; if a batch still fails,
+    its requests are scored one by one so the error only reaches the requests causing it.
+    """
+
+    def __init__(self, predict_fn, max_batch_size, max_latency_ms, stats, prepare_fn=None):
+        self.predict_fn = predict_fn
+        self.prepare_fn = prepare_fn or pd.DataFrame.from_records
+        self.max_batch_size = max_batch_size
+        self.max_latency_s = max_latency_ms / 1000.0
+        self.stats = stats
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, records):
+        """Score a list of listing dicts, blocking until their batch has been predicted"""
+        # A malformed request fails here, in its own handler thread, and never joins a batch
+        pending = _Pending(self.prepare_fn(records))
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            n_rows = len(batch[0].X)
+            deadline = batch[0].arrival + self.max_latency_s
+            while n_rows < self.max_batch_size:
+                # Requests that queued up while the previous batch was scored join
+                # immediately, even once the latency budget of the oldest one is spent
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        pending = self._queue.get(timeout=timeout)
+                    else:
+                        pending = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                n_rows += len(pending.X)
+            self._score(batch, n_rows)
+
+    def _predict(self, batch):
+        X = pd.concat([pending.X for pending in batch], ignore_index=True) if len(batch) > 1 else batch[0].X
+        y = np.asarray(self.predict_fn(X), dtype=float)
+        offset = 0
+        for pending in batch:
+            pending.result = y[offset: offset + len(pending.X)].tolist()
+            offset += len(pending.X)
+
+    def _score(self, batch, n_rows):
+        try:
+            self._predict(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                # One bad request must not fail the others: isolate it
+                for pending in batch:
+                    try:
+                        self._predict([pending])
+                    except Exception as error:
+                        pending.error = error
+        self.stats.record_batch(n_rows)
+        for pending in batch:
+            pending.done.set()
+
+
+def make_predict_fn(sk_pipe):
+    """
+    Wrap the pipeline for the MicroBatcher
+
+    :return: (prepare, predict): prepare turns the listing dicts of one request into a
+        DataFrame with the training columns and schema, and raises ValueError when a listing
+        is not an object, lacks one of the columns or has a value of the wrong type;
+        predict scores a concatenation of prepared DataFrames
+    """
+    columns = list(getattr(sk_pipe, "feature_names_in_", []))
+
+    def prepare(records):
+        for i, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise ValueError(f"listing {i} is not a JSON object")
+            missing = [col for col in columns if col not in record]
+            if missing:
+                raise ValueError(f"listing {i} lacks the fields {missing}")
+        X = pd.DataFrame.from_records(records)
+        if columns:
+            X = X.reindex(columns=columns)
+        for col in X.columns:
+            if CSV_DTYPES.get(col) in ("int64", "float64"):
+                X[col] = pd.to_numeric(X[col], errors="raise")
+        return apply_schema(X)
+
+    def predict(X):
+        # Categories appended for unexpected values may differ between requests
+        return sk_pipe.predict(apply_schema(X))
+
+    return prepare, predict
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # bursts of concurrent clients must queue up instead of being reset
+    request_queue_size = 1024
+
+
+def make_handler(batcher, stats):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, stats.snapshot())
+            elif self.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            start = time.monotonic()
+            records = []
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if isinstance(payload, dict):
+                    payload = payload.get("instances", [payload])
+                records = list(payload)
+                prices = batcher.submit(records) if records else []
+            except Exception as e:
+                stats.record_request(time.monotonic() - start, len(records), ok=False)
+                self._send(400, {"error": str(e)})
+                return
+            stats.record_request(time.monotonic() - start, len(records))
+            self._send(200, {"prices": prices})
+
+        def log_message(self, format, *args):
+            # Per-request access logs would dominate the cost of a prediction
+            pass
+
+    return Handler
+
+
+def go(args):
+
+    # A model directory, a model in the local artifact store, or a W&B artifact
+    model_local_path = args.mlflow_model if os.path.isdir(args.mlflow_model) else default_store().find(args.mlflow_model)
+    if model_local_path is None:
+        import wandb
+
+        run = wandb.init(job_type="serve_model")
+        run.config.update(args)
+        logger.info("Downloading model artifact")
+        model_local_path = run.use_artifact(args.mlflow_model).download()
+
+    with StepMetrics("serve_model") as metrics:
+        # The model is loaded once for the lifetime of the server
+        logger.info("Loading model")
+        with metrics.stage("load_model"):
+            import mlflow.sklearn
+
+            sk_pipe = mlflow.sklearn.load_model(model_local_path)
+
+        stats = ServingStats()
+        prepare, predict = make_predict_fn(sk_pipe)
+        batcher = MicroBatcher(predict, args.max_batch_size, args.max_latency_ms, stats, prepare_fn=prepare)
+        server = _Server((args.host, args.port), make_handler(batcher, stats))
+
+        logger.info(
+            f"Serving on http://{args.host}:{args.port} "
+            f"(max_batch_size={args.max_batch_size}, max_latency_ms={args.max_latency_ms})"
+        )
+        try:
+            with metrics.stage("serve") as stage:
+                server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            stage.rows_in = stage.rows_out = metrics.rows_in = metrics.rows_out = stats.rows
+            logger.info(f"Final metrics: {stats.snapshot()}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve the provided model over local HTTP with micro-batching")
+
+    parser.add_argument(
+        "--mlflow_model",
+        type=str,
+        help="Input MLFlow model (W&B artifact or local directory)",
+        required=True
+    )
+
+    parser.add_argument(
+        "--host",
+        type=str,
+        help="Interface to bind to",
+        default="127.0.0.1"
+    )
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="Port to listen on",
+        default=5001
+    )
+
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        help="Maximum number of listings scored in one predict call",
+        default=256
+    )
+
+    parser.add_argument(
+        "--max_latency_ms",
+        type=float,
+        help="Longest time (ms) a request waits for other requests to join its batch",
+        default=5.0
+    )
+
+    args = parser.parse_args()
+
+    go(args)
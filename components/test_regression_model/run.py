@@ -4,12 +4,14 @@ This step takes the best model, tagged with the "prod" tag, and tests it against
 """
 import argparse
 import logging
+import os
 import wandb
-import mlflow
-import pandas as pd
-from sklearn.metrics import mean_absolute_error
 
+from wandb_utils.artifact_store import default_store
+from wandb_utils.compact_forest import COMPACT_DIR, META_FILE, load_compact
+from wandb_utils.instrumentation import StepMetrics
 from wandb_utils.log_artifact import log_artifact
+from wandb_utils.intermediate import fetch_table, read_table
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
@@ -21,26 +23,47 @@ def go(args):
     run = wandb.init(job_type="test_model")
     run.config.update(args)
 
-    logger.info("Downloading artifacts")
-    # Download input artifact. This will also log that this script is using this
-    # particular version of the artifact
-    model_local_path = run.use_artifact(args.mlflow_model).download()
-
-    # Download test dataset
-    test_dataset_path = run.use_artifact(args.test_dataset).file()
-
-    # Read test dataset
-    X_test = pd.read_csv(test_dataset_path)
-    y_test = X_test.pop("price")
-
-    logger.info("Loading model and performing inference on test set")
-    sk_pipe = mlflow.sklearn.load_model(model_local_path)
-    y_pred = sk_pipe.predict(X_test)
-
-    logger.info("Scoring")
-    r_squared = sk_pipe.score(X_test, y_test)
-
-    mae = mean_absolute_error(y_test, y_pred)
+    with StepMetrics("test_regression_model") as metrics:
+        logger.info("Downloading artifacts")
+        # The model from the local artifact store, or downloaded from W&B (which also logs
+        # that this script is using this particular version of the artifact)
+        model_local_path = default_store().find(args.mlflow_model) or run.use_artifact(args.mlflow_model).download()
+
+        # Download test dataset
+        test_dataset_path = fetch_table(run, args.test_dataset)
+
+        # Read test dataset
+        with metrics.stage("read") as stage:
+            X_test = read_table(test_dataset_path)
+            y_test = X_test.pop("price")
+            stage.rows_out = len(X_test)
+        metrics.rows_in = len(X_test)
+
+        logger.info("Loading model and performing inference on test set")
+        with metrics.stage("load_model"):
+            model_format = args.model_format
+            if model_format == "auto":
+                has_compact = os.path.exists(os.path.join(model_local_path, COMPACT_DIR, META_FILE))
+                model_format = "compact" if has_compact else "mlflow"
+            logger.info(f"Loading the {model_format} export")
+            if model_format == "compact":
+                sk_pipe = load_compact(model_local_path)
+            else:
+                import mlflow.sklearn  # slow to import: only for this format
+
+                sk_pipe = mlflow.sklearn.load_model(model_local_path)
+        with metrics.stage("predict", rows_in=len(X_test)) as stage:
+            y_pred = sk_pipe.predict(X_test)
+            stage.rows_out = len(y_pred)
+
+        logger.info("Scoring")
+        with metrics.stage("score", rows_in=len(X_test)):
+            from sklearn.metrics import mean_absolute_error
+
+            r_squared = sk_pipe.score(X_test, y_test)
+
+            mae = mean_absolute_error(y_test, y_pred)
+        metrics.rows_out = len(y_pred)
 
     logger.info(f"Score: {r_squared}")
     logger.info(f"MAE: {mae}")
@@ -68,6 +91,16 @@ if __name__ == "__main__":
         required=True
     )
 
+    parser.add_argument(
+        "--model_format",
+        type=str,
+        help="Export to load: mlflow (pickled pipeline), compact (flat tree arrays, faster to load), "
+        "or auto (compact when the model has it)",
+        choices=["auto", "mlflow", "compact"],
+        default="auto",
+        required=False
+    )
+
     args = parser.parse_args()
 
     go(args)
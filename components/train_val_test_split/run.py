@@ -3,12 +3,20 @@
 This script splits the provided dataframe in test and remainder
 """
 import argparse
+import contextlib
 import logging
+import os
+import numpy as np
 import pandas as pd
 import wandb
 import tempfile
-from sklearn.model_selection import train_test_split
+from wandb_utils.instrumentation import StepMetrics
 from wandb_utils.log_artifact import log_artifact
+from wandb_utils.hash_split import SPLIT_CODES, assign_splits
+from wandb_utils.intermediate import (
+    FORMATS, SPLIT_SUFFIX, TableWriter, fetch_table, format_of, iter_table, pin_artifact, read_table,
+    write_split_index, write_table,
+)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
 logger = logging.getLogger()
@@ -19,35 +27,124 @@ def go(args):
     run = wandb.init(job_type="train_val_test_split")
     run.config.update(args)
 
-    # Download input artifact. This will also note that this script is using this
-    # particular version of the artifact
-    logger.info(f"Fetching artifact {args.input}")
-    artifact_local_path = run.use_artifact(args.input).file()
-
-    df = pd.read_csv(artifact_local_path)
-
-    logger.info("Splitting trainval and test")
-    trainval, test = train_test_split(
-        df,
-        test_size=args.test_size,
-        random_state=args.random_seed,
-        stratify=df[args.stratify_by] if args.stratify_by != 'none' else None,
+    with StepMetrics("train_val_test_split") as metrics, tempfile.TemporaryDirectory() as tmp_dir:
+        # Fetch the input artifact (from the local artifact store, or from W&B, which also
+        # notes that this script is using this particular version of the artifact)
+        logger.info(f"Fetching artifact {args.input}")
+        artifact_local_path = fetch_table(run, args.input, directory=tmp_dir)
+        # Split indexes refer to the exact version split, not to e.g. :latest
+        source_artifact = pin_artifact(run, args.input)
+
+        # Outputs keep the intermediate format of the input (.parquet or .csv), or are split
+        # references to the input (row index + <name>.split.json, one directory per split)
+        ext = SPLIT_SUFFIX if args.output_mode == "index" else FORMATS[format_of(artifact_local_path)]
+        paths = {k: os.path.join(tmp_dir, f"{k}_data{ext}") for k in ("trainval", "test")}
+
+        if args.split_mode == "hash":
+            logger.info("Assigning rows to trainval and test by a hash of id")
+            rows = stream_hash_split(artifact_local_path, paths, args, metrics, source_artifact)
+        else:
+            with metrics.stage("read") as stage:
+                df = read_table(artifact_local_path).reset_index(drop=True)
+                stage.rows_out = len(df)
+            source_rows = len(df)
+
+            logger.info("Splitting trainval and test")
+            from sklearn.model_selection import train_test_split  # slow to import: only for this mode
+
+            with metrics.stage("split", rows_in=len(df)) as stage:
+                trainval, test = train_test_split(
+                    df,
+                    test_size=args.test_size,
+                    random_state=args.random_seed,
+                    stratify=df[args.stratify_by] if args.stratify_by != 'none' else None,
+                )
+                stage.rows_out = len(trainval) + len(test)
+
+            rows = {}
+            for df, k in zip([trainval, test], ['trainval', 'test']):
+                with metrics.stage("write", rows_in=len(df)):
+                    if args.output_mode == "index":
+                        write_index(df.index, paths[k], artifact_local_path, source_rows, source_artifact)
+                    else:
+                        write_table(df, paths[k])
+                rows[k] = len(df)
+        metrics.rows_in = metrics.rows_out = sum(rows.values())
+
+        # Save to output files
+        for k, path in paths.items():
+            logger.info(f"Uploading {k}_data{ext} dataset ({rows[k]} rows)")
+            with metrics.stage("log_artifact"):
+                log_artifact(
+                    f"{k}_data{ext}",
+                    f"{k}_data",
+                    f"{k} split of dataset",
+                    split_dir(path) if args.output_mode == "index" else path,
+                    run,
+                )
+
+
+def split_dir(path):
+    # Directory of a split reference and its .idx.npy: <dir>/<split>_data/<split>_data.split.json
+    return os.path.join(os.path.dirname(path), os.path.basename(path)[: -len(SPLIT_SUFFIX)])
+
+
+def write_index(positions, path, input_path, source_rows, source_artifact):
+    """
+    Write a split as the row positions in the input artifact, in a directory of its own so
+    it can be logged as one artifact (the reference and its .idx.npy)
+
+    :param source_artifact: pinned version of the input artifact, e.g. "clean_sample.parquet:v2"
+    """
+    os.makedirs(split_dir(path), exist_ok=True)
+    return write_split_index(
+        positions, os.path.join(split_dir(path), os.path.basename(path)), input_path, source_rows,
+        source_artifact=source_artifact,
     )
 
-    # Save to output files
-    for df, k in zip([trainval, test], ['trainval', 'test']):
-        logger.info(f"Uploading {k}_data.csv dataset")
-        with tempfile.NamedTemporaryFile("w") as fp:
-
-            df.to_csv(fp.name, index=False)
 
-            log_artifact(
-                f"{k}_data.csv",
-                f"{k}_data",
-                f"{k} split of dataset",
-                fp.name,
-                run,
-            )
+def stream_hash_split(input_path, paths, args, metrics, source_artifact):
+    """
+    Split the input in one pass over chunks of args.chunksize rows: a row goes to test when
+    the seeded hash of its id falls below test_size, so listings keep their split when the
+    dataset is refreshed (not stratified: args.stratify_by is ignored)
+    """
+    if not 0 < args.test_size < 1:
+        raise ValueError(f"split_mode=hash needs test_size as a fraction, got {args.test_size}")
+    read, split, write = metrics.stage("read"), metrics.stage("split"), metrics.stage("write")
+    rows = {k: 0 for k in paths}
+    positions = {k: [] for k in paths}
+    offset = 0
+    chunks = iter_table(input_path, args.chunksize)
+    index_mode = args.output_mode == "index"
+    with contextlib.ExitStack() as stack:
+        writers = {} if index_mode else {k: stack.enter_context(TableWriter(p)) for k, p in paths.items()}
+        while True:
+            with read:
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            read.add_rows(rows_out=len(chunk))
+            with split:
+                is_test = assign_splits(chunk, args.random_seed, args.test_size) == SPLIT_CODES["test"]
+            split.add_rows(rows_in=len(chunk), rows_out=len(chunk))
+            with write:
+                for k, in_split in (("trainval", ~is_test), ("test", is_test)):
+                    if index_mode:
+                        positions[k].append(offset + np.flatnonzero(in_split))
+                    else:
+                        writers[k].write(chunk[in_split])
+                    rows[k] += int(in_split.sum())
+            write.add_rows(rows_in=len(chunk))
+            offset += len(chunk)
+        with write:
+            for writer in writers.values():
+                writer.close()
+            if index_mode:
+                for k, path in paths.items():
+                    index = np.concatenate(positions[k]) if positions[k] else np.empty(0, dtype=np.int64)
+                    write_index(index, path, input_path, offset, source_artifact)
+    return rows
 
 
 if __name__ == "__main__":
@@ -64,7 +161,32 @@ if __name__ == "__main__":
     )
 
     parser.add_argument(
-        "--stratify_by", type=str, help="Column to use for stratification", default='none', required=False
+        "--stratify_by", type=str, help="Column to use for stratification (random mode only)", default='none',
+        required=False
+    )
+
+    parser.add_argument(
+        "--split_mode",
+        type=str,
+        help="random: train_test_split of the loaded frame; hash: assign rows by a seeded hash of id "
+        "in one streaming pass (stable across data refreshes; not stratified)",
+        choices=["random", "hash"],
+        default="random",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--chunksize", type=int, help="Rows per chunk in hash mode", default=1_000_000, required=False
+    )
+
+    parser.add_argument(
+        "--output_mode",
+        type=str,
+        help="table: log a copy of every split; index: log the row positions of every split in the input "
+        "plus a reference to the input artifact (<split>_data.split.json)",
+        choices=["table", "index"],
+        default="table",
+        required=False,
     )
 
     args = parser.parse_args()
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process locking
+    fcntl = None
+
+from wandb_utils.file_digest import file_digest
+
+
+# Local, content-addressed store of the artifacts the pipeline steps pass to each other,
+# used to resolve "name:version" / "name:latest" without wandb.init. Layout (under root):
+#   objects/<sha[:2]>/<sha>/<file name>  contents, stored once; the same content logged under
+#                                        another file name is a hardlink in the same directory
+#   trees/<digest>/                      directory artifacts, built from hardlinks to objects
+#   index/<name>.json                    versions of an artifact and its aliases ("latest", ...)
+# A lookup reads the index file of one name, whatever the number of artifacts and versions.
+# Logging the content of the latest version again does not create a version.
+# main.py points the steps at the store of the run through $PIPELINE_ARTIFACT_STORE (inherited
+# by the mlflow.run subprocesses); otherwise artifacts/ in the project root is used.
+STORE_ENV = "PIPELINE_ARTIFACT_STORE"
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "artifacts")
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:  # other file system, or no hardlinks
+        shutil.copyfile(src, dst)
+
+
+def parse_spec(spec):
+    """
+    Split an artifact reference into its name and version or alias
+
+    :param spec: e.g. "clean_sample.parquet:latest", "clean_sample.parquet:v3" or "clean_sample.parquet"
+    :return: (name, version or alias), the alias defaulting to "latest"
+    """
+    name, _, version = str(spec).partition(":")
+    return name, version or "latest"
+
+
+class ArtifactStore:
+    """
+    Versioned artifacts (files or directories) stored by content
+
+        store = ArtifactStore("artifacts")
+        store.put("clean_sample.parquet", "clean_sample.parquet", artifact_type="clean_data")
+        path = store.find("clean_sample.parquet:latest")  # None when it was never logged
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+
+    def _index_path(self, name):
+        return os.path.join(self.root, "index", quote(name, safe="") + ".json")
+
+    def _object_dir(self, sha):
+        return os.path.join(self.root, "objects", sha[:2], sha)
+
+    def _read_index(self, name):
+        try:
+            with open(self._index_path(name)) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def _add_object(self, path, file_name):
+        # Store the content of path as objects/<sha>/<file_name>; returns the sha
+        sha = file_digest(path)
+        object_dir = self._object_dir(sha)
+        dst = os.path.join(object_dir, file_name)
+        if os.path.exists(dst):
+            return sha
+        os.makedirs(object_dir, exist_ok=True)
+        tmp = os.path.join(object_dir, f".{file_name}.tmp.{os.getpid()}.{threading.get_ident()}")
+        existing = [n for n in os.listdir(object_dir) if not n.startswith(".")]
+        if existing:
+            _link_or_copy(os.path.join(object_dir, existing[0]), tmp)
+        else:
+            shutil.copyfile(path, tmp)
+            os.chmod(tmp, 0o444)
+        os.replace(tmp, dst)
+        return sha
+
+    def put(self, name, path, artifact_type=None, description=None, aliases=("latest",), default_aliases=()):
+        """
+        Log a file or a directory as a new version of an artifact (or return the latest
+        version when its content is the same)
+
+        :param name: artifact name (e.g. "clean_sample.parquet")
+        :param path: file, or directory (all its files are stored)
+        :param artifact_type: e.g. "clean_data"
+        :param description: a brief description of the artifact
+        :param aliases: aliases moved to this version
+        :param default_aliases: aliases set to this version only when the artifact does not
+            have them yet (e.g. "reference": the first version logged stays the reference of
+            the drift checks until the alias is moved with alias())
+        :return: version record (dict with "name", "version", "digest", "files", ...)
+        """
+        if os.path.isdir(path):
+            files = {}
+            for root, _, names in os.walk(path):
+                for file_name in sorted(names):
+                    rel = os.path.relpath(os.path.join(root, file_name), path)
+                    files[rel] = self._add_object(os.path.join(root, file_name), os.path.basename(rel))
+            digest = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+        else:
+            files = {os.path.basename(path): self._add_object(path, os.path.basename(path))}
+            digest = next(iter(files.values()))
+
+        with self._lock, self._name_lock(name):
+            index = self._read_index(name) or {"name": name, "aliases": {}, "versions": []}
+            latest = index["aliases"].get("latest")
+            record = index["versions"][int(latest[1:])] if latest else None
+            if record is None or record["digest"] != digest:
+                record = {
+                    "name": name,
+                    "version": f"v{len(index['versions'])}",
+                    "digest": digest,
+                    "is_dir": os.path.isdir(path),
+                    "files": files,
+                    "type": artifact_type,
+                    "description": description,
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                index["versions"].append(record)
+            for alias in set(aliases) | {"latest"}:
+                index["aliases"][alias] = record["version"]
+            for alias in default_aliases:
+                index["aliases"].setdefault(alias, record["version"])
+            self._write_index(name, index)
+        return record
+
+    def alias(self, spec, alias):
+        """
+        Point an alias (e.g. "reference") at a version
+
+        :param spec: "name:version" or "name:alias"
+        :param alias: alias to set
+        :return: version record
+        """
+        record = self.lookup(spec)
+        if record is None:
+            raise FileNotFoundError(f"Artifact {spec} is not in the store {self.root}")
+        with self._lock, self._name_lock(record["name"]):
+            index = self._read_index(record["name"])
+            index["aliases"][alias] = record["version"]
+            self._write_index(record["name"], index)
+        return record
+
+    def lookup(self, spec):
+        """
+        Version record of an artifact reference
+
+        :param spec: "name", "name:latest", "name:v<n>" or "name:<alias>"
+        :return: version record, or None when the store does not have it
+        """
+        name, version = parse_spec(spec)
+        index = self._read_index(name)
+        if index is None:
+            return None
+        version = index["aliases"].get(version, version)
+        if not (version.startswith("v") and version[1:].isdigit()) or int(version[1:]) >= len(index["versions"]):
+            return None
+        return index["versions"][int(version[1:])]
+
+    def versions(self, name):
+        """
+        :param name: artifact name
+        :return: list of version records, oldest first
+        """
+        index = self._read_index(name)
+        return index["versions"] if index else []
+
+    def find(self, spec):
+        """
+        Local path of an artifact: the stored file (read-only, nothing is copied), or a
+        directory of hardlinks for a directory artifact
+
+        :param spec: see lookup()
+        :return: path, or None when the store does not have it
+        """
+        record = self.lookup(spec)
+        if record is None:
+            return None
+        if not record["is_dir"]:
+            file_name, sha = next(iter(record["files"].items()))
+            return os.path.join(self._object_dir(sha), file_name)
+
+        tree = os.path.join(self.root, "trees", record["digest"])
+        if not os.path.isdir(tree):
+            tmp = f"{tree}.tmp.{os.getpid()}.{threading.get_ident()}"
+            for rel, sha in record["files"].items():
+                os.makedirs(os.path.dirname(os.path.join(tmp, rel)), exist_ok=True)
+                _link_or_copy(os.path.join(self._object_dir(sha), os.path.basename(rel)), os.path.join(tmp, rel))
+            try:
+                os.rename(tmp, tree)
+            except OSError:  # built by another process meanwhile
+                shutil.rmtree(tmp, ignore_errors=True)
+        return tree
+
+    def _write_index(self, name, index):
+        path = self._index_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w") as fp:
+            json.dump(index, fp, indent=2)
+        os.replace(tmp, path)
+
+    def _name_lock(self, name):
+        return _FileLock(self._index_path(name)[: -len(".json")] + ".lock")
+
+
+class _FileLock:
+    # Exclusive inter-process lock held while the index of a name is updated
+    def __init__(self, path):
+        self.path = path
+        self._fp = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fp = open(self.path, "w")
+            fcntl.flock(self._fp, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._fp is not None:
+            fcntl.flock(self._fp, fcntl.LOCK_UN)
+            self._fp.close()
+            self._fp = None
+
+
+def default_store():
+    """
+    The store of the current pipeline run ($PIPELINE_ARTIFACT_STORE, or artifacts/ in the
+    project root)
+
+    :return: ArtifactStore
+    """
+    return ArtifactStore(os.environ.get(STORE_ENV) or DEFAULT_ROOT)
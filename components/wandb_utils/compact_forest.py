@@ -0,0 +1,243 @@
+import json
+import os
+import pickle
+import shutil
+import sys
+
+import numpy as np
+
+
+# Compact export of a fitted (preprocessor, tree ensemble) pipeline, as an alternative to
+# pickling the whole pipeline. The model is a RandomForestRegressor (prediction: mean of the
+# trees) or a HistGradientBoostingRegressor (baseline + sum of the trees). The nodes of all
+# the trees are concatenated into flat arrays in compact dtypes, one .npy file each, loaded
+# memory-mapped:
+#   children_left, children_right  int32, global node index (a leaf points to itself)
+#   feature                        int32
+#   threshold                      float32 for a forest, rounded down (see _float32_threshold);
+#                                  float64 for gradient boosting, which compares float64 features
+#   value                          float32, prediction of the node
+#   missing_go_to_left             uint8, where missing values go (scikit-learn >= 1.3)
+#   roots                          int32, root node of every tree
+# Only the small fitted preprocessor is pickled. Loading takes a few milliseconds whatever
+# the size of the ensemble, and predictions match the model's to float32 precision.
+COMPACT_DIR = "compact"
+META_FILE = "forest.json"
+PREPROCESSOR_FILE = "preprocessor.pkl"
+CODE_DIR = "code"
+NODE_DTYPES = {
+    "children_left": np.int32,
+    "children_right": np.int32,
+    "feature": np.int32,
+    "threshold": np.float32,
+    "value": np.float32,
+    "missing_go_to_left": np.uint8,
+    "roots": np.int32,
+}
+
+# Rows of a sparse input (e.g. hashed text features) densified at a time for prediction
+SPARSE_BLOCK_ROWS = 65536
+
+
+def _float32_threshold(threshold):
+    # Trees compare float32 features with float64 thresholds: x <= t. Rounding t down to
+    # the largest float32 <= t gives the same decision for every float32 x
+    rounded = threshold.astype(np.float32)
+    too_high = rounded.astype(np.float64) > threshold
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def _forest_trees(forest):
+    # Per tree: (children_left, children_right, feature, threshold, value, missing_go_to_left,
+    # max_depth), with -1 children for leaves
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        missing = getattr(tree, "missing_go_to_left", None)
+        yield (
+            tree.children_left, tree.children_right, tree.feature, tree.threshold, tree.value[:, 0, 0],
+            np.zeros(tree.node_count) if missing is None else missing, tree.max_depth,
+        )
+
+
+def _boosting_trees(model):
+    # Same as _forest_trees, for the predictors of a HistGradientBoostingRegressor
+    for predictors in model._predictors:
+        nodes = predictors[0].nodes
+        if nodes["is_categorical"].any():
+            raise ValueError("Categorical splits cannot be exported in the compact format")
+        is_leaf = nodes["is_leaf"].astype(bool)
+        left, right = nodes["left"].astype(np.int64), nodes["right"].astype(np.int64)  # uint32
+        yield (
+            np.where(is_leaf, -1, left), np.where(is_leaf, -1, right), nodes["feature_idx"],
+            nodes["num_threshold"], nodes["value"], nodes["missing_go_to_left"], int(nodes["depth"].max()),
+        )
+
+
+def _ensemble(model):
+    # (trees, meta of the aggregation) of a supported model
+    if hasattr(model, "estimators_"):
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be exported in the compact format")
+        return _forest_trees(model), {"aggregate": "mean", "baseline": 0.0, "threshold_dtype": "float32"}
+    if hasattr(model, "_predictors"):
+        if type(model._loss.link).__name__ != "IdentityLink":
+            raise ValueError(f"Only an identity link can be exported in the compact format, not {model.loss!r}")
+        baseline = float(np.ravel(model._baseline_prediction)[0])
+        return _boosting_trees(model), {"aggregate": "sum", "baseline": baseline, "threshold_dtype": "float64"}
+    raise ValueError(f"{type(model).__name__} cannot be exported in the compact format")
+
+
+def save_compact(pipe, path, code_paths=()):
+    """
+    Export a fitted Pipeline with a "preprocessor" step followed by the model (a
+    RandomForestRegressor or a HistGradientBoostingRegressor)
+
+    :param pipe: fitted sklearn Pipeline
+    :param path: destination directory (replaced if it exists)
+    :param code_paths: modules the pickled preprocessor needs (e.g. feature_engineering.py),
+        copied next to it and importable when loading
+    :return: path
+    """
+    model = pipe.steps[-1][1]
+    trees, aggregation = _ensemble(model)
+
+    arrays = {name: [] for name in NODE_DTYPES}
+    offset = 0
+    max_depth = 0
+    for children_left, children_right, feature, threshold, value, missing, depth in trees:
+        node_count = len(children_left)
+        nodes = np.arange(node_count)
+        is_leaf = children_left == -1
+        arrays["children_left"].append(np.where(is_leaf, nodes, children_left) + offset)
+        arrays["children_right"].append(np.where(is_leaf, nodes, children_right) + offset)
+        arrays["feature"].append(np.where(is_leaf, 0, feature))
+        arrays["threshold"].append(np.where(is_leaf, np.inf, threshold))
+        arrays["value"].append(value)
+        arrays["missing_go_to_left"].append(missing)
+        arrays["roots"].append([offset])
+        offset += node_count
+        max_depth = max(max_depth, int(depth))
+
+    if offset >= np.iinfo(np.int32).max:
+        raise ValueError(f"The forest has too many nodes ({offset}) for int32 node indices")
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    for name, parts in arrays.items():
+        array = np.concatenate(parts)
+        dtype = NODE_DTYPES[name]
+        if name == "threshold" and aggregation["threshold_dtype"] == "float32":
+            array = _float32_threshold(array.astype(np.float64))
+        elif name == "threshold":
+            dtype = np.float64
+        np.save(os.path.join(path, f"{name}.npy"), array.astype(dtype))
+
+    meta = {
+        "n_trees": len(arrays["roots"]),
+        "n_nodes": int(offset),
+        "n_features": int(model.n_features_in_),
+        "max_depth": max_depth,
+        **aggregation,
+    }
+    with open(os.path.join(path, META_FILE), "w") as fp:
+        json.dump(meta, fp, indent=2)
+
+    if code_paths:
+        os.makedirs(os.path.join(path, CODE_DIR))
+        for code_path in code_paths:
+            shutil.copy(code_path, os.path.join(path, CODE_DIR))
+    with open(os.path.join(path, PREPROCESSOR_FILE), "wb") as fp:
+        pickle.dump(pipe["preprocessor"], fp, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+class CompactForest:
+    """
+    Tree ensemble regressor predicting from the flat node arrays written by save_compact
+    """
+
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, META_FILE)) as fp:
+            self.meta = json.load(fp)
+        mode = "r" if mmap else None
+        for name in NODE_DTYPES:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode))
+
+    def predict(self, X):
+        """
+        Mean (forest) or baseline + sum (gradient boosting) of the leaf values reached in
+        every tree (trees are traversed one at a time, all the samples at once)
+
+        :param X: array-like or sparse matrix of shape (n_samples, n_features)
+        :return: np.ndarray of float64
+        """
+        sparse = hasattr(X, "toarray")
+        X = X.tocsr() if sparse else np.asarray(X, dtype=self.threshold.dtype)
+        if len(X.shape) != 2 or X.shape[1] != self.meta["n_features"]:
+            raise ValueError(f"Expected {self.meta['n_features']} features, got shape {X.shape}")
+        if sparse:
+            blocks = range(0, X.shape[0], SPARSE_BLOCK_ROWS)
+            return np.concatenate(
+                [self._predict_dense(X[i: i + SPARSE_BLOCK_ROWS].toarray()) for i in blocks] or [np.empty(0)]
+            )
+        return self._predict_dense(X)
+
+    def _predict_dense(self, X):
+        X = np.asarray(X, dtype=self.threshold.dtype)
+        has_missing = bool(np.isnan(X).any())
+        rows = np.arange(len(X))
+        y = np.zeros(len(X), dtype=np.float64)
+        for root in np.asarray(self.roots):
+            node = np.full(len(X), root, dtype=np.int32)
+            # Leaves point to themselves, so max_depth steps bring every sample to its leaf
+            for _ in range(self.meta["max_depth"]):
+                x = X[rows, self.feature[node]]
+                go_left = x <= self.threshold[node]
+                if has_missing:
+                    go_left |= np.isnan(x) & (self.missing_go_to_left[node] == 1)
+                node = np.where(go_left, self.children_left[node], self.children_right[node])
+            y += self.value[node]
+        # Exports written before gradient boosting was supported are forests
+        if self.meta.get("aggregate", "mean") == "sum":
+            return y + self.meta["baseline"]
+        return y / len(self.roots)
+
+
+class CompactPipeline:
+    """
+    Fitted preprocessor followed by a CompactForest, with the predict/score interface of
+    the exported Pipeline
+    """
+
+    def __init__(self, preprocessor, forest):
+        self.preprocessor = preprocessor
+        self.forest = forest
+
+    def predict(self, X):
+        return self.forest.predict(self.preprocessor.transform(X))
+
+    def score(self, X, y):
+        from sklearn.metrics import r2_score
+
+        return r2_score(y, self.predict(X))
+
+
+def load_compact(path, mmap=True):
+    """
+    Load a pipeline written by save_compact
+
+    :param path: the directory given to save_compact, or a model directory holding it in
+        a COMPACT_DIR subdirectory
+    :param mmap: memory-map the node arrays instead of reading them
+    :return: CompactPipeline
+    """
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        path = os.path.join(path, COMPACT_DIR)
+    code_dir = os.path.join(path, CODE_DIR)
+    if os.path.isdir(code_dir) and code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+    with open(os.path.join(path, PREPROCESSOR_FILE), "rb") as fp:
+        preprocessor = pickle.load(fp)
+    return CompactPipeline(preprocessor, CompactForest(path, mmap=mmap))
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from wandb_utils.file_digest import DigestMemo
+
+
+# On-disk cache of transformed feature matrices (and of the fitted preprocessor that
+# produced them), so a training run whose data and preprocessing did not change skips
+# the preprocessing. Layout (under root):
+#   <key>/manifest.json     matrices stored, their kind (dense/csr), shape and size
+#   <key>/<name>.npy        dense matrix, or <name>.data/.indices/.indptr.npy for CSR
+#   <key>/preprocessor.pkl  the fitted preprocessor
+#   file_hashes.json        digests of the data files memoized by (size, mtime)
+# Matrices are loaded memory-mapped. When the cache grows beyond max_bytes, the least
+# recently used entries are removed (the mtime of a manifest is its last use).
+MANIFEST = "manifest.json"
+PREPROCESSOR_FILE = "preprocessor.pkl"
+
+
+class FeatureCache:
+    """
+    Transformed train/validation matrices keyed by the data and the preprocessing
+
+        cache = FeatureCache("feature_cache", max_bytes=2 * 2**30)
+        key = cache.key([data_path], {"max_tfidf_features": 5, ...}, code_paths=["run.py"])
+        entry = cache.load(key)
+        if entry is None:
+            ... fit the preprocessor, transform ...
+            cache.store(key, {"train": Xt_train, "val": Xt_val}, preprocessor)
+    """
+
+    def __init__(self, root, max_bytes=2 * 2**30):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._memo = DigestMemo(os.path.join(root, "file_hashes.json"))
+
+    def key(self, data_paths, params, code_paths=()):
+        """
+        Cache key of a preprocessing run
+
+        :param data_paths: files the matrices are computed from (their content is hashed)
+        :param params: preprocessing and split parameters
+        :param code_paths: source files of the preprocessing (their content is hashed)
+        :return: hex digest
+        """
+        payload = {
+            "data": [self._memo.digest(p) for p in data_paths],
+            "params": {k: str(v) for k, v in sorted(params.items())},
+            "code": {os.path.basename(p): self._memo.digest(p) for p in code_paths},
+        }
+        self._memo.save()
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def load(self, key):
+        """
+        Memory-mapped matrices and fitted preprocessor of an entry
+
+        :param key: see key()
+        :return: (dict of name -> np.memmap or scipy CSR matrix, preprocessor), or None on a miss
+        """
+        entry = os.path.join(self.root, key)
+        manifest_path = os.path.join(entry, MANIFEST)
+        if not os.path.exists(manifest_path):
+            print(f"[feature cache] MISS (key {key[:12]})")
+            return None
+        with open(manifest_path) as fp:
+            manifest = json.load(fp)
+
+        matrices = {}
+        for name, info in manifest["matrices"].items():
+            path = os.path.join(entry, name)
+            if info["kind"] == "csr":
+                parts = [np.load(f"{path}.{part}.npy", mmap_mode="r") for part in ("data", "indices", "indptr")]
+                matrices[name] = sp.csr_matrix(tuple(parts), shape=tuple(info["shape"]), copy=False)
+            else:
+                matrices[name] = np.load(f"{path}.npy", mmap_mode="r")
+        with open(os.path.join(entry, PREPROCESSOR_FILE), "rb") as fp:
+            preprocessor = pickle.load(fp)
+
+        os.utime(manifest_path)  # most recently used
+        print(f"[feature cache] HIT  (key {key[:12]}) {', '.join(manifest['matrices'])}")
+        return matrices, preprocessor
+
+    def store(self, key, matrices, preprocessor):
+        """
+        Save the matrices (dense arrays or scipy sparse matrices) and the fitted preprocessor,
+        then evict least recently used entries beyond max_bytes
+
+        :param key: see key()
+        :param matrices: dict of name -> matrix
+        :param preprocessor: fitted preprocessor
+        :return: path of the entry
+        """
+        entry = os.path.join(self.root, key)
+        tmp = f"{entry}.tmp.{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        manifest = {"key": key, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "matrices": {}}
+        for name, matrix in matrices.items():
+            path = os.path.join(tmp, name)
+            if sp.issparse(matrix):
+                matrix = sp.csr_matrix(matrix)
+                for part in ("data", "indices", "indptr"):
+                    np.save(f"{path}.{part}.npy", getattr(matrix, part))
+                kind = "csr"
+            else:
+                np.save(f"{path}.npy", np.asarray(matrix))
+                kind = "dense"
+            manifest["matrices"][name] = {"kind": kind, "shape": list(matrix.shape)}
+        with open(os.path.join(tmp, PREPROCESSOR_FILE), "wb") as fp:
+            pickle.dump(preprocessor, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        manifest["bytes"] = _dir_size(tmp)
+        with open(os.path.join(tmp, MANIFEST), "w") as fp:
+            json.dump(manifest, fp, indent=2)
+
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        print(f"[feature cache] stored {manifest['bytes'] / 2**20:.1f} MB (key {key[:12]})")
+        self.evict(keep=key)
+        return entry
+
+    def entries(self):
+        """
+        Complete entries, least recently used first
+
+        :return: list of (key, last use timestamp, bytes)
+        """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for key in os.listdir(self.root):
+            manifest_path = os.path.join(self.root, key, MANIFEST)
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as fp:
+                    size = json.load(fp)["bytes"]
+                entries.append((key, os.stat(manifest_path).st_mtime, size))
+        return sorted(entries, key=lambda e: e[1])
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits in max_bytes
+
+        :param keep: key never removed (the entry just stored)
+        :return: list of removed keys
+        """
+        entries = self.entries()
+        total = sum(size for _, _, size in entries)
+        removed = []
+        for key, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+            print(f"[feature cache] evicted {size / 2**20:.1f} MB (key {key[:12]})")
+        return removed
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import threading
+
+
+# Content digests of files, shared by the step cache (step_cache.py), the feature cache and
+# the artifact store. DigestMemo keeps the digests in a JSON file keyed by absolute path and
+# memoized by (size, mtime), so the caches do not re-read unchanged inputs on every run.
+_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """
+    SHA-256 of the content of a file, read in blocks
+
+    :param path: file path
+    :return: hex digest
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DigestMemo:
+    """
+    File digests memoized by (size, mtime) in a JSON file
+
+        memo = DigestMemo(".step_cache/file_hashes.json")
+        digest = memo.digest("clean_sample.csv")  # re-read only when the file changed
+        memo.save()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        # digests may be requested from several threads (steps scheduled concurrently)
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as fp:
+                self._entries = json.load(fp)
+
+    def digest(self, path):
+        """
+        :param path: file path
+        :return: hex SHA-256 of its content
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            memo = self._entries.get(path)
+            if memo is not None and memo["stamp"] == stamp:
+                return memo["sha256"]
+        digest = file_digest(path)
+        with self._lock:
+            self._entries[path] = {"stamp": stamp, "sha256": digest}
+        return digest
+
+    def save(self):
+        """Write the memo (atomically: other processes may be reading it)"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+        with self._lock:
+            with open(tmp, "w") as fp:
+                json.dump(self._entries, fp)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
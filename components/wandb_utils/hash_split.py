@@ -0,0 +1,64 @@
+import numpy as np
+
+
+# Deterministic train/val/test assignment from a hash of the listing id. A row's split
+# depends only on its id and the seed, never on the other rows, so:
+#   - the split can be computed chunk by chunk in one pass over data larger than memory
+#   - a listing stays in the same split when the dataset is refreshed (even when its other
+#     columns change), so metrics on "test" remain comparable over time
+# The split is not stratified: every group (e.g. neighbourhood_group) gets test_size /
+# val_size of its rows up to sampling noise only. Exact per-group proportions would need
+# cut-offs computed from all the rows of the group, which moves listings between splits
+# when the data is refreshed.
+SPLIT_CODES = {"train": 0, "val": 1, "test": 2}
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def splitmix64(x):
+    """
+    SplitMix64 finalizer, vectorized (wrapping uint64 arithmetic)
+
+    :param x: array-like of integers
+    :return: np.ndarray of uint64 hashes
+    """
+    z = np.asarray(x).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        z = (z + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+        z = ((z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASK64
+        z = ((z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASK64
+    return z ^ (z >> np.uint64(31))
+
+
+def hash_fraction(ids, seed):
+    """
+    Uniform number in [0, 1) per row, determined by (id, seed)
+
+    :param ids: integer listing ids
+    :param seed: random seed; a different seed gives an independent assignment
+    :return: np.ndarray of float64
+    """
+    h = splitmix64(np.asarray(ids, dtype=np.int64).view(np.uint64) ^ splitmix64(np.uint64(seed)))
+    # top 53 bits -> exactly representable double in [0, 1)
+    return (h >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def assign_splits(df, seed, test_size, val_size=0.0, id_column="id"):
+    """
+    Split code of every row (see SPLIT_CODES): test if the row's hash fraction is below
+    test_size, else val if below test_size + val_size, else train
+
+    :param df: DataFrame (or one chunk of it) with id_column
+    :param seed: random seed
+    :param test_size: fraction of rows in test
+    :param val_size: fraction of rows in val (0 for a train/test split)
+    :param id_column: column holding the stable row identifier
+    :return: np.ndarray of int8 codes
+    """
+    if not (0 <= test_size and 0 <= val_size and test_size + val_size <= 1):
+        raise ValueError(f"Invalid split sizes test_size={test_size}, val_size={val_size}")
+    u = hash_fraction(df[id_column].to_numpy(), seed)
+    codes = np.full(len(df), SPLIT_CODES["train"], dtype=np.int8)
+    codes[u < test_size + val_size] = SPLIT_CODES["val"]
+    codes[u < test_size] = SPLIT_CODES["test"]
+    return codes
@@ -0,0 +1,230 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+
+# Every pipeline step records its wall time, CPU time, peak memory and row counts, for the
+# whole step and for its sub-stages (read, filter, write, fit, predict, ...), and writes
+# them as JSON to $PIPELINE_METRICS_DIR/<step>.json. main.py sets the variable (it is
+# inherited by the mlflow.run subprocesses) and aggregates the files into the end-of-run
+# report; when it is not set, nothing is written.
+METRICS_DIR_ENV = "PIPELINE_METRICS_DIR"
+
+# How often the resident set size is sampled while a stage runs
+RSS_SAMPLE_INTERVAL_S = 0.01
+
+
+def cpu_seconds():
+    """
+    CPU time of this process (all threads) and of its terminated child processes
+
+    :return: seconds
+    """
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+def rss_bytes():
+    """
+    Current resident set size of this process
+
+    :return: bytes (the lifetime peak where the current value is not available)
+    """
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # not Linux
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class _PeakRSS(threading.Thread):
+
+    def __init__(self):
+        super().__init__(name="peak-rss", daemon=True)
+        self.start_rss = self.peak = rss_bytes()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(RSS_SAMPLE_INTERVAL_S):
+            self.peak = max(self.peak, rss_bytes())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+class Stage:
+    """
+    Resources used by one stage, measured while its context is active.
+
+    Entering the same stage again (e.g. once per chunk) adds to its times and row counts
+    and keeps the highest peak. Set rows_in / rows_out inside the context, or pass rows_in
+    when creating the stage.
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.peak_rss_bytes = 0
+        self.rss_growth_bytes = 0
+        self._sampler = None
+
+    def __enter__(self):
+        self._sampler = _PeakRSS()
+        self._sampler.start()
+        self._wall = time.perf_counter()
+        self._cpu = cpu_seconds()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_s += time.perf_counter() - self._wall
+        self.cpu_s += cpu_seconds() - self._cpu
+        self._sampler.stop()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, self._sampler.peak)
+        self.rss_growth_bytes = max(self.rss_growth_bytes, self._sampler.peak - self._sampler.start_rss)
+        self._sampler = None
+        self.calls += 1
+
+    def add_rows(self, rows_in=None, rows_out=None):
+        """Add to the row counts (for stages entered once per chunk)"""
+        if rows_in is not None:
+            self.rows_in = (self.rows_in or 0) + int(rows_in)
+        if rows_out is not None:
+            self.rows_out = (self.rows_out or 0) + int(rows_out)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "wall_s": round(self.wall_s, 4),
+            "cpu_s": round(self.cpu_s, 4),
+            "peak_rss_mb": round(self.peak_rss_bytes / 2**20, 1),
+            "rss_growth_mb": round(self.rss_growth_bytes / 2**20, 1),
+            "rows_in": None if self.rows_in is None else int(self.rows_in),
+            "rows_out": None if self.rows_out is None else int(self.rows_out),
+        }
+
+
+class StepMetrics(Stage):
+    """
+    Metrics of a whole pipeline step and of its sub-stages.
+
+        with StepMetrics("basic_cleaning") as metrics:
+            with metrics.stage("read") as stage:
+                df = read_table(path)
+                stage.rows_out = len(df)
+            ...
+
+    On exit (also when the step fails) the metrics are written to
+    <output_dir>/<step>.json, output_dir defaulting to $PIPELINE_METRICS_DIR.
+    """
+
+    def __init__(self, step, output_dir=None):
+        super().__init__(step)
+        self.output_dir = output_dir or os.environ.get(METRICS_DIR_ENV)
+        self.stages = {}
+        self.status = "running"
+
+    def stage(self, name, rows_in=None):
+        """
+        Sub-stage of the step (the same Stage is returned for the same name)
+
+        :param name: e.g. "read", "filter", "write", "fit", "predict"
+        :param rows_in: rows entering the stage, if known upfront
+        :return: Stage, to be used as a context manager
+        """
+        if name not in self.stages:
+            self.stages[name] = Stage(name)
+        stage = self.stages[name]
+        stage.add_rows(rows_in=rows_in)
+        return stage
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        self.status = "ok" if exc_type is None else "failed"
+        self.write()
+
+    def to_dict(self):
+        record = super().to_dict()
+        record.pop("name")
+        return {
+            "step": self.name,
+            "status": self.status,
+            "pid": os.getpid(),
+            **record,
+            "stages": [stage.to_dict() for stage in self.stages.values()],
+        }
+
+    def write(self):
+        """
+        Write the metrics to <output_dir>/<step>.json (no-op without an output_dir)
+
+        :return: path of the file, or None
+        """
+        if not self.output_dir:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.name}.json")
+        with open(path, "w") as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+        return path
+
+
+def load_metrics(metrics_dir):
+    """
+    Read the step metrics written to metrics_dir
+
+    :param metrics_dir: directory of <step>.json files
+    :return: dict of step name -> metrics dict
+    """
+    records = {}
+    if not os.path.isdir(metrics_dir):
+        return records
+    for name in sorted(os.listdir(metrics_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(metrics_dir, name)) as fp:
+                record = json.load(fp)
+            if "step" in record:
+                records[record["step"]] = record
+    return records
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def format_report(steps):
+    """
+    Text table of the steps of a run and of their sub-stages
+
+    :param steps: list of dicts with "step", "status" and optionally "elapsed_s" (time seen
+        by the caller, including process startup), plus the metrics of the step (see
+        StepMetrics.to_dict) when it reported them
+    :return: str
+    """
+    lines = [
+        f"{'step / stage':<28}{'status':<9}{'elapsed s':>10}{'wall s':>9}{'cpu s':>9}{'peak MB':>10}"
+        f"{'rows in':>11}{'rows out':>11}"
+    ]
+    for step in steps:
+        lines.append(
+            f"{step['step']:<28}{step['status']:<9}{_fmt(step.get('elapsed_s'), '.2f'):>10}"
+            f"{_fmt(step.get('wall_s'), '.2f'):>9}"
+            f"{_fmt(step.get('cpu_s'), '.2f'):>9}{_fmt(step.get('peak_rss_mb'), '.1f'):>10}"
+            f"{_fmt(step.get('rows_in'), 'd'):>11}{_fmt(step.get('rows_out'), 'd'):>11}"
+        )
+        for stage in step.get("stages", []):
+            lines.append(
+                f"{'  ' + stage['name']:<28}{'':<9}{'':>10}{stage['wall_s']:>9.2f}{stage['cpu_s']:>9.2f}"
+                f"{stage['peak_rss_mb']:>10.1f}{_fmt(stage['rows_in'], 'd'):>11}{_fmt(stage['rows_out'], 'd'):>11}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,473 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from wandb_utils.artifact_store import default_store, parse_spec
+
+
+# Fixed schema for the NYC Airbnb intermediate tables. Every step that reads or writes
+# cleaned/split data goes through read_table/write_table so the types survive each hop
+# instead of being re-inferred from text.
+CATEGORIES = {
+    "neighbourhood_group": ["Bronx", "Brooklyn", "Manhattan", "Queens", "Staten Island"],
+    "room_type": ["Entire home/apt", "Private room", "Shared room"],
+}
+FLOAT32_COLUMNS = ["latitude", "longitude"]
+DATE_COLUMNS = ["last_review"]
+DATE_FORMAT = "%Y-%m-%d"
+
+# dtypes pinned when parsing CSV, so that every chunk of a streamed read gets the same
+# types as a whole-file read (e.g. an all-missing host_name chunk stays a string column).
+# The integer columns are required: a missing value fails the read instead of silently
+# turning the column into floats for some chunks only.
+CSV_DTYPES = {
+    "id": "int64",
+    "name": str,
+    "host_id": "int64",
+    "host_name": str,
+    "neighbourhood_group": str,
+    "neighbourhood": str,
+    "latitude": "float64",
+    "longitude": "float64",
+    "room_type": str,
+    "price": "int64",
+    "minimum_nights": "int64",
+    "number_of_reviews": "int64",
+    "last_review": str,
+    "reviews_per_month": "float64",
+    "calculated_host_listings_count": "int64",
+    "availability_365": "int64",
+}
+
+# Parquet files are written in row groups of this many rows, whatever the size of the
+# frames handed to the writer, so streamed and whole-frame writes produce the same file
+ROW_GROUP_SIZE = 100_000
+
+# format name -> file suffix
+FORMATS = {
+    "parquet": ".parquet",
+    "csv": ".csv",
+}
+DEFAULT_FORMAT = "parquet"
+
+# A split can be stored as the row positions of its rows in the source table (<name>.idx.npy)
+# plus a small reference to that table (<name>.split.json) instead of a copy of the rows.
+# read_table accepts the reference and loads only the rows of the split.
+SPLIT_SUFFIX = ".split.json"
+INDEX_SUFFIX = ".idx.npy"
+
+
+def format_of(path):
+    """
+    Return the intermediate format of a path from its suffix
+
+    :param path: file name or path (an optional ":version" suffix is ignored)
+    :return: one of FORMATS
+    """
+    suffix = os.path.splitext(str(path).split(":")[0])[1].lower()
+    for fmt, ext in FORMATS.items():
+        if suffix == ext:
+            return fmt
+    raise ValueError(f"Unsupported intermediate format for {path!r} (expected one of {list(FORMATS.values())})")
+
+
+def with_format(path, fmt):
+    """
+    Replace the suffix of path with the one of the given format
+
+    :param path: file name or path
+    :param fmt: one of FORMATS
+    :return: the new path
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown intermediate format {fmt!r} (expected one of {list(FORMATS)})")
+    return os.path.splitext(str(path))[0] + FORMATS[fmt]
+
+
+def apply_schema(df):
+    """
+    Coerce the known columns of df to the fixed schema (missing columns are skipped)
+
+    :param df: input DataFrame
+    :return: DataFrame with categorical, datetime and float32 columns
+    """
+    df = df.copy(deep=False)  # columns are replaced, never modified in place
+    for col, categories in CATEGORIES.items():
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Keep the fixed categories first so codes are stable; unexpected values are
+            # appended rather than silently turned into NaN
+            extra = sorted(set(df[col].dropna().unique()) - set(categories))
+            df[col] = df[col].astype(pd.CategoricalDtype(categories + extra))
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format=DATE_FORMAT)
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns and df[col].dtype != "float32":
+            df[col] = df[col].astype("float32")
+    return df
+
+
+def read_table(path, columns=None):
+    """
+    Read an intermediate table (Parquet or CSV, from the suffix) with the fixed schema
+
+    :param path: file to read, or a split reference (see read_split)
+    :param columns: optional subset of columns to load
+    :return: DataFrame
+    """
+    if is_split_reference(path):
+        return read_split(path, columns)
+    fmt = format_of(path)
+    if fmt == "parquet":
+        df = pd.read_parquet(path, columns=columns, engine="pyarrow")
+    else:
+        df = pd.read_csv(path, usecols=columns, dtype=CSV_DTYPES)
+    return apply_schema(df)
+
+
+def iter_table(path, chunksize, columns=None):
+    """
+    Read an intermediate table in chunks of at most chunksize rows, with the fixed schema
+
+    :param path: file to read (Parquet or CSV, from the suffix), or a split reference (its
+        rows are then read in the order of the source table, see iter_split)
+    :param chunksize: maximum number of rows per chunk
+    :param columns: optional subset of columns to load
+    :return: iterator of DataFrames
+    """
+    if is_split_reference(path):
+        yield from iter_split(path, chunksize, columns)
+        return
+    fmt = format_of(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield apply_schema(batch.to_pandas())
+    else:
+        with pd.read_csv(path, usecols=columns, dtype=CSV_DTYPES, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield apply_schema(chunk)
+
+
+def count_rows(path):
+    """
+    Number of rows of an intermediate table, without loading it when possible (Parquet
+    metadata, length of a split index; a CSV is streamed)
+
+    :param path: file (Parquet or CSV), or a split reference
+    :return: int
+    """
+    if is_split_reference(path):
+        return len(np.load(load_split_reference(path)["index"], mmap_mode="r"))
+    if format_of(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    # (a listing name may hold a quoted line break: lines are not counted)
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=1_000_000))
+
+
+class TableWriter:
+    """
+    Incremental writer for an intermediate table (Parquet or CSV, from the suffix).
+
+    Frames passed to write() are appended in order; Parquet rows are regrouped into
+    ROW_GROUP_SIZE row groups, so the output does not depend on how the rows were batched.
+    Use as a context manager, or call close() when done (closing again is a no-op).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fmt = format_of(path)
+        self.rows = 0
+        self._started = False
+        self._closed = False
+        self._writer = None
+        self._pending = []
+        self._pending_rows = 0
+
+    def write(self, df):
+        df = apply_schema(df)
+        if self.fmt == "csv":
+            df.to_csv(
+                self.path,
+                mode="a" if self._started else "w",
+                header=not self._started,
+                index=False,
+                date_format=DATE_FORMAT,
+            )
+        else:
+            self._pending.append(df)
+            self._pending_rows += len(df)
+            while self._pending_rows >= ROW_GROUP_SIZE:
+                self._flush(ROW_GROUP_SIZE)
+        self.rows += len(df)
+        self._started = True
+
+    def _flush(self, n_rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pending = apply_schema(pd.concat(self._pending, ignore_index=True)) if len(self._pending) > 1 else self._pending[0]
+        group, rest = pending.iloc[:n_rows], pending.iloc[n_rows:]
+        table = pa.Table.from_pandas(group, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self._pending = [rest] if len(rest) else []
+        self._pending_rows = len(rest)
+
+    def close(self):
+        if self._closed:
+            return
+        if not self._started:
+            raise ValueError(f"Nothing was written to {self.path}")
+        if self.fmt == "parquet":
+            # the last (partial) row group; also creates the file if every frame was empty
+            if self._pending_rows or self._writer is None:
+                self._flush(self._pending_rows)
+            self._writer.close()
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._writer is not None:
+            self._writer.close()
+
+
+def write_table(df, path):
+    """
+    Write an intermediate table (Parquet or CSV, from the suffix) with the fixed schema
+
+    :param df: DataFrame to write
+    :param path: destination file
+    :return: None
+    """
+    with TableWriter(path) as writer:
+        writer.write(df)
+
+
+def is_split_reference(path):
+    """
+    Whether path is a split reference written by write_split_index
+
+    :param path: file name or path (an optional ":version" suffix is ignored)
+    :return: bool
+    """
+    return str(path).split(":")[0].endswith(SPLIT_SUFFIX)
+
+
+def write_split_index(positions, reference_path, source_path, source_rows, source_artifact=None):
+    """
+    Store a split as the positions of its rows in source_path: <name>.idx.npy next to the
+    reference <name>.split.json. Paths are recorded relative to the reference.
+
+    :param positions: row positions (0-based, in the order of the split) in the source table
+    :param reference_path: destination, ending with SPLIT_SUFFIX
+    :param source_path: the table the positions refer to
+    :param source_rows: number of rows of the source table (checked when reading)
+    :param source_artifact: optional W&B artifact of the source table (see fetch_table)
+    :return: reference_path
+    """
+    if not is_split_reference(reference_path):
+        raise ValueError(f"A split reference must end with {SPLIT_SUFFIX}: {reference_path!r}")
+    reference_path = os.path.abspath(reference_path)
+    index_path = reference_path[: -len(SPLIT_SUFFIX)] + INDEX_SUFFIX
+    positions = np.asarray(positions, dtype=np.int64)
+    np.save(index_path, positions)
+
+    reference = {
+        "source": os.path.relpath(os.path.abspath(source_path), os.path.dirname(reference_path)),
+        "source_rows": int(source_rows),
+        "source_artifact": source_artifact,
+        "index": os.path.basename(index_path),
+        "rows": int(len(positions)),
+    }
+    with open(reference_path, "w") as fp:
+        json.dump(reference, fp, indent=2)
+    return reference_path
+
+
+def load_split_reference(reference_path):
+    """
+    Read a split reference, with its "source" and "index" resolved to absolute paths
+
+    :param reference_path: <name>.split.json
+    :return: dict
+    """
+    with open(reference_path) as fp:
+        reference = json.load(fp)
+    root = os.path.dirname(os.path.abspath(reference_path))
+    for key in ("source", "index"):
+        reference[key] = os.path.normpath(os.path.join(root, reference[key]))
+    return reference
+
+
+def read_split(reference_path, columns=None):
+    """
+    Load the rows of a split from its source table, with the fixed schema.
+
+    The row index is memory-mapped; for a Parquet source only the row groups holding rows
+    of the split are read (from a memory-mapped file).
+
+    :param reference_path: <name>.split.json written by write_split_index
+    :param columns: optional subset of columns to load
+    :return: DataFrame with the rows in the order of the split
+    """
+    reference = load_split_reference(reference_path)
+    index = np.load(reference["index"], mmap_mode="r")
+    source = reference["source"]
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Source table {source} of split {reference_path} not found")
+
+    if format_of(source) == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(source, memory_map=True)
+        _check_source_rows(reference, parquet_file.metadata.num_rows, reference_path)
+        sizes = np.array([parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)])
+        starts = np.concatenate([[0], np.cumsum(sizes)])
+        group_of = np.searchsorted(starts, index, side="right") - 1
+        groups = np.unique(group_of)
+        table = parquet_file.read_row_groups(groups.tolist(), columns=columns)
+        # first row of each selected row group within `table`
+        offsets = np.zeros(len(sizes), dtype=np.int64)
+        offsets[groups] = np.concatenate([[0], np.cumsum(sizes[groups])[:-1]])
+        df = table.take(pa.array(index - starts[group_of] + offsets[group_of])).to_pandas()
+    else:
+        df = pd.read_csv(source, usecols=columns, dtype=CSV_DTYPES)
+        _check_source_rows(reference, len(df), reference_path)
+        df = df.iloc[np.asarray(index)].reset_index(drop=True)
+    return apply_schema(df)
+
+
+def iter_split(reference_path, chunksize, columns=None):
+    """
+    Read the rows of a split in chunks of at most chunksize rows, in the order of the source
+    table (not of the split): the source is streamed once, a Parquet row group at a time,
+    and only the row groups holding rows of the split are read.
+
+    :param reference_path: <name>.split.json written by write_split_index
+    :param chunksize: maximum number of rows per chunk
+    :param columns: optional subset of columns to load
+    :return: iterator of DataFrames
+    """
+    reference = load_split_reference(reference_path)
+    positions = np.sort(np.load(reference["index"], mmap_mode="r"))
+    source = reference["source"]
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Source table {source} of split {reference_path} not found")
+
+    def select(df, start):
+        # rows of the split among the source rows [start, start + len(df))
+        lo, hi = np.searchsorted(positions, [start, start + len(df)])
+        rows = df.iloc[positions[lo:hi] - start].reset_index(drop=True)
+        for i in range(0, len(rows), chunksize):
+            yield apply_schema(rows.iloc[i: i + chunksize].reset_index(drop=True))
+
+    if format_of(source) == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(source, memory_map=True)
+        _check_source_rows(reference, parquet_file.metadata.num_rows, reference_path)
+        start = 0
+        for group in range(parquet_file.num_row_groups):
+            size = parquet_file.metadata.row_group(group).num_rows
+            lo, hi = np.searchsorted(positions, [start, start + size])
+            if hi > lo:
+                yield from select(parquet_file.read_row_group(group, columns=columns).to_pandas(), start)
+            start += size
+    else:
+        start = 0
+        with pd.read_csv(source, usecols=columns, dtype=CSV_DTYPES, chunksize=max(chunksize, 1)) as reader:
+            for chunk in reader:
+                yield from select(chunk, start)
+                start += len(chunk)
+        _check_source_rows(reference, start, reference_path)
+
+
+def _check_source_rows(reference, n_rows, reference_path):
+    if n_rows != reference["source_rows"]:
+        raise ValueError(
+            f"Split {reference_path} indexes a table of {reference['source_rows']} rows, "
+            f"but {reference['source']} has {n_rows}: the source changed since the split"
+        )
+
+
+def fetch_table(wandb_run, artifact_name, store=None, directory=None):
+    """
+    Local path of a logged table, to pass to read_table
+
+    The table comes from the local artifact store when it has it (see artifact_store),
+    from W&B otherwise. For a split reference, the artifact (reference and row index) is
+    fetched, then the source table from its source_artifact when it is not available locally.
+
+    :param wandb_run: current Weights & Biases run (only used when the store misses)
+    :param artifact_name: e.g. "trainval_data.parquet:latest" or "trainval_data.split.json:latest"
+    :param store: ArtifactStore (default: artifact_store.default_store())
+    :param directory: where the resolved split reference is written (default: a temporary
+        directory removed when the process exits)
+    :return: path
+    """
+    store = store or default_store()
+
+    def fetch(name, download=False):
+        local_path = store.find(name)
+        if local_path is not None:
+            return local_path
+        if wandb_run is None:
+            raise FileNotFoundError(f"Artifact {name} is not in the artifact store {store.root}")
+        artifact = wandb_run.use_artifact(name)
+        return artifact.download() if download else artifact.file()
+
+    if not is_split_reference(artifact_name):
+        return fetch(artifact_name)
+
+    root = fetch(artifact_name, download=True)
+    if os.path.isdir(root):
+        name = [n for n in sorted(os.listdir(root)) if n.endswith(SPLIT_SUFFIX)][0]
+    else:
+        root, name = os.path.split(root)
+    reference = load_split_reference(os.path.join(root, name))
+    if not os.path.exists(reference["source"]) and reference.get("source_artifact"):
+        reference["source"] = fetch(reference["source_artifact"])
+
+    # The fetched artifact is left untouched: the resolved reference (absolute paths) is a copy
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="split_")
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    resolved = os.path.join(directory, name)
+    with open(resolved, "w") as fp:
+        json.dump(reference, fp, indent=2)
+    return resolved
+
+
+def pin_artifact(wandb_run, artifact_name, store=None):
+    """
+    Exact version of an artifact reference, so that what refers to it (e.g. the
+    source_artifact of a split index) keeps resolving to the same content when newer
+    versions are logged
+
+    :param wandb_run: current Weights & Biases run (only used when the store misses)
+    :param artifact_name: e.g. "clean_sample.parquet:latest"
+    :param store: ArtifactStore (default: artifact_store.default_store())
+    :return: e.g. "clean_sample.parquet:v2"
+    """
+    store = store or default_store()
+    record = store.lookup(artifact_name)
+    if record is not None:
+        return f"{record['name']}:{record['version']}"
+    if wandb_run is None:
+        raise FileNotFoundError(f"Artifact {artifact_name} is not in the artifact store {store.root}")
+    return f"{parse_spec(artifact_name)[0]}:{wandb_run.use_artifact(artifact_name).version}"
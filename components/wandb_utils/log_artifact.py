@@ -1,28 +1,39 @@
+import os
+
 import wandb
-import mlflow
+
+from wandb_utils.artifact_store import default_store
 
 
-def log_artifact(artifact_name, artifact_type, artifact_description, filename, wandb_run):
+def log_artifact(artifact_name, artifact_type, artifact_description, filename, wandb_run, metadata=None):
     """
-    Log the provided filename as an artifact in W&B, and add the artifact path to the MLFlow run
-    so it can be retrieved by subsequent steps in a pipeline
+    Log the provided filename as an artifact in W&B and in the local artifact store (see
+    artifact_store), so it can be retrieved by subsequent steps in a pipeline without W&B
 
     :param artifact_name: name for the artifact
     :param artifact_type: type for the artifact (just a string like "raw_data", "clean_data" and so on)
     :param artifact_description: a brief description of the artifact
-    :param filename: local filename for the artifact
+    :param filename: local filename for the artifact (a directory adds all of its files)
     :param wandb_run: current Weights & Biases run
-    :return: None
+    :param metadata: optional dict attached to the W&B artifact
+    :return: version record of the artifact in the local store
     """
     # Log to W&B
     artifact = wandb.Artifact(
         artifact_name,
         type=artifact_type,
         description=artifact_description,
+        metadata=metadata,
     )
-    artifact.add_file(filename)
+    if os.path.isdir(filename):
+        artifact.add_dir(filename)
+    else:
+        artifact.add_file(filename)
     wandb_run.log_artifact(artifact)
     # We need to call this .wait() method before we can use the
     # version below. This will wait until the artifact is loaded into W&B and a
     # version is assigned
 # artifact.wait() # skipped in offline mode
+
+    # Log to the local store, where the next steps look for their inputs first
+    return default_store().put(artifact_name, filename, artifact_type, artifact_description)
@@ -0,0 +1,147 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# Compact, mergeable summary of the distributions of a dataset, used by the drift checks
+# in data_check instead of the full reference data. Bin edges are fixed, so sketches of
+# different datasets (or of different chunks of one dataset) are directly comparable
+# and can be added together. The outer edges are open so no value is dropped.
+CATEGORICAL_COLUMNS = ["neighbourhood_group", "room_type"]
+HISTOGRAM_EDGES = {
+    "price": [-np.inf] + list(np.arange(0, 1010, 10)) + [np.inf],
+    "minimum_nights": [-np.inf, 1, 2, 3, 4, 5, 6, 7, 8, 15, 30, 31, 60, 90, 180, 365, np.inf],
+    "latitude": [-np.inf] + list(np.round(np.arange(40.3, 41.21, 0.02), 2)) + [np.inf],
+    "longitude": [-np.inf] + list(np.round(np.arange(-74.3, -73.49, 0.02), 2)) + [np.inf],
+}
+SKETCH_COLUMNS = CATEGORICAL_COLUMNS + list(HISTOGRAM_EDGES)
+SKETCH_SUFFIX = ".sketch.json"
+
+
+def sketch_path(path):
+    """
+    Path of the sketch stored next to a data file
+
+    :param path: data file (e.g. clean_sample.parquet)
+    :return: e.g. clean_sample.parquet.sketch.json
+    """
+    return str(path) + SKETCH_SUFFIX
+
+
+def empty_sketch():
+    """
+    Sketch of an empty dataset
+
+    :return: dict with "n_rows", "categorical" counts and "histograms" (edges, counts, missing)
+    """
+    return {
+        "n_rows": 0,
+        "categorical": {col: {} for col in CATEGORICAL_COLUMNS},
+        "histograms": {
+            col: {"edges": list(edges), "counts": [0] * (len(edges) - 1), "missing": 0}
+            for col, edges in HISTOGRAM_EDGES.items()
+        },
+    }
+
+
+def update_sketch(sketch, df):
+    """
+    Add the rows of df (a full dataset or one chunk of it) to sketch, in place
+
+    :param sketch: sketch to update
+    :param df: DataFrame with (a subset of) SKETCH_COLUMNS
+    :return: the updated sketch
+    """
+    sketch["n_rows"] += int(len(df))
+    for col in CATEGORICAL_COLUMNS:
+        if col not in df.columns:
+            continue
+        counts = sketch["categorical"][col]
+        for value, count in df[col].value_counts(dropna=True).items():
+            if count > 0:
+                counts[str(value)] = counts.get(str(value), 0) + int(count)
+    for col, edges in HISTOGRAM_EDGES.items():
+        if col not in df.columns:
+            continue
+        hist = sketch["histograms"][col]
+        values = df[col].to_numpy(dtype=float)
+        missing = ~np.isfinite(values)
+        # right-open bins [edge_i, edge_i+1), like np.histogram without its closed last bin
+        idx = np.searchsorted(edges, values[~missing], side="right") - 1
+        hist["counts"] = (np.asarray(hist["counts"]) + np.bincount(idx, minlength=len(edges) - 1)).tolist()
+        hist["missing"] += int(missing.sum())
+    return sketch
+
+
+def merge_sketches(sketches):
+    """
+    Sketch of the union of the (disjoint) datasets summarized by sketches
+
+    :param sketches: iterable of sketches
+    :return: merged sketch
+    """
+    merged = empty_sketch()
+    for sketch in sketches:
+        merged["n_rows"] += sketch["n_rows"]
+        for col, counts in sketch["categorical"].items():
+            for value, count in counts.items():
+                merged["categorical"][col][value] = merged["categorical"][col].get(value, 0) + count
+        for col, hist in sketch["histograms"].items():
+            target = merged["histograms"][col]
+            target["counts"] = (np.asarray(target["counts"]) + np.asarray(hist["counts"])).tolist()
+            target["missing"] += hist["missing"]
+    return merged
+
+
+def save_sketch(sketch, path):
+    """
+    Write a sketch as JSON (the open outer bin edges are stored as null)
+
+    :param sketch: sketch to save
+    :param path: destination file
+    :return: None
+    """
+    encoded = dict(sketch)
+    encoded["histograms"] = {
+        col: {**hist, "edges": [None if np.isinf(e) else float(e) for e in hist["edges"]]}
+        for col, hist in sketch["histograms"].items()
+    }
+    with open(path, "w") as fp:
+        json.dump(encoded, fp, indent=1)
+
+
+def load_sketch(path):
+    """
+    Read a sketch written by save_sketch
+
+    :param path: sketch file
+    :return: sketch
+    """
+    with open(path) as fp:
+        sketch = json.load(fp)
+    for hist in sketch["histograms"].values():
+        edges = hist["edges"]
+        hist["edges"] = [(-np.inf if i == 0 else np.inf) if e is None else e for i, e in enumerate(edges)]
+    return sketch
+
+
+def categorical_distribution(sketch, col):
+    """
+    Normalized frequencies of a categorical column, sorted by value
+
+    :return: pd.Series
+    """
+    counts = pd.Series(sketch["categorical"][col], dtype=float).sort_index()
+    return counts / counts.sum()
+
+
+def histogram_distribution(sketch, col, smoothing=0.5):
+    """
+    Normalized bin frequencies of a numeric column, with additive smoothing so that a bin
+    that is empty in one dataset does not make the KL divergence infinite
+
+    :return: np.ndarray
+    """
+    counts = np.asarray(sketch["histograms"][col]["counts"], dtype=float) + smoothing
+    return counts / counts.sum()
@@ -0,0 +1,310 @@
+# process_pool_launcher.py — Hydra launcher running the jobs of a multirun in parallel
+#
+#   python main.py -m hydra/launcher=process_pool etl.min_price=10,20,50 etl.max_price=300,350
+#
+# Every job runs in its own forked process, up to the smallest of:
+#   hydra.launcher.max_workers                      (null: the CPU count)
+#   CPU count // hydra.launcher.cpus_per_job
+#   hydra.launcher.memory_gb // memory_per_job_gb   (memory_gb null: available memory)
+# jobs at a time. A job works in a private copy of the project (<sweep dir>/workspaces/<num>),
+# so the files the steps write (cleaned data, splits, metrics) do not collide, while the
+# step cache of the project root is shared: a step whose inputs and parameters are the same
+# in every job (e.g. download) runs in one job and is restored from the cache by the others.
+# The output of a job goes to <sweep dir>/logs/<num>.out. When all the jobs are done, the
+# status, time and row counts of their steps (from their pipeline_report.json) are written
+# to <sweep dir>/summary.csv and printed.
+import csv
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import shutil
+import sys
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from hydra.core.config_store import ConfigStore
+from hydra.core.utils import JobReturn, JobStatus, configure_log, filter_overrides, run_job, setup_globals
+from hydra.plugins.launcher import Launcher
+from hydra.types import HydraContext, TaskFunction
+from omegaconf import DictConfig, OmegaConf, open_dict
+
+log = logging.getLogger(__name__)
+
+# Read by main.py: the project copy a job works in, and the CPUs its steps may use
+WORKSPACE_ENV = "PIPELINE_WORKSPACE"
+CPUS_ENV = "PIPELINE_CPUS"
+# Thread pools of the numerical libraries, capped at cpus_per_job
+THREAD_ENVS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "LOKY_MAX_CPU_COUNT")
+# Not copied into job workspaces: VCS data, caches and the outputs of previous runs
+WORKSPACE_IGNORE = (
+    ".git", ".step_cache", "artifacts", "multirun", "outputs", "mlruns", "wandb", "metrics", "feature_cache",
+    "__pycache__", ".pytest_cache", "benchmarks", "docs", "images",
+)
+SUMMARY_FILE = "summary.csv"
+
+
+@dataclass
+class ProcessPoolLauncherConf:
+    _target_: str = "hydra_plugins.process_pool_launcher.process_pool_launcher.ProcessPoolLauncher"
+    # Jobs running at the same time (null: the CPU count), further limited by the budgets below
+    max_workers: Optional[int] = None
+    # CPUs given to every job (main.max_workers and the thread pools of its steps are capped to it)
+    cpus_per_job: int = 1
+    # Memory the jobs may use together (null: the memory available when the sweep starts)
+    memory_gb: Optional[float] = None
+    memory_per_job_gb: float = 1.0
+    # Keep the project copy of every job in <sweep dir>/workspaces (removed by default)
+    keep_workspaces: bool = False
+
+
+ConfigStore.instance().store(
+    group="hydra/launcher", name="process_pool", node=ProcessPoolLauncherConf, provider="process_pool_launcher"
+)
+
+
+def available_memory_gb() -> Optional[float]:
+    """MemAvailable of /proc/meminfo in GB (None where it is not available)."""
+    try:
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 2**20
+    except OSError:
+        pass
+    return None
+
+
+def _picklable(exc: BaseException) -> BaseException:
+    try:
+        pickle.dumps(exc)
+        return exc
+    except Exception:
+        return RuntimeError(repr(exc))
+
+
+def _job_process(conn, launcher: "ProcessPoolLauncher", idx: int, overrides: Sequence[str]) -> None:
+    # Entry point of a forked job process: sends back (JobReturn, info) or an exception.
+    # The output of the job (and of the mlflow.run subprocesses of its steps) goes to its log
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(os.path.join(launcher.sweep_dir, "logs", f"{idx}.out"), "w") as out:
+        os.dup2(out.fileno(), 1)
+        os.dup2(out.fileno(), 2)
+    try:
+        result = launcher.run_one(idx, overrides)
+    except BaseException as e:
+        result = RuntimeError(f"{e!r}\n{traceback.format_exc()}")
+    try:
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+class ProcessPoolLauncher(Launcher):
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cpus_per_job: int = 1,
+        memory_gb: Optional[float] = None,
+        memory_per_job_gb: float = 1.0,
+        keep_workspaces: bool = False,
+    ) -> None:
+        self.max_workers = max_workers
+        self.cpus_per_job = max(1, int(cpus_per_job))
+        self.memory_gb = memory_gb
+        self.memory_per_job_gb = memory_per_job_gb
+        self.keep_workspaces = keep_workspaces
+        self.config: Optional[DictConfig] = None
+        self.task_function: Optional[TaskFunction] = None
+        self.hydra_context: Optional[HydraContext] = None
+        self.sweep_dir: Optional[str] = None
+        self.project_root: Optional[str] = None
+
+    def setup(self, *, hydra_context: HydraContext, task_function: TaskFunction, config: DictConfig) -> None:
+        self.config = config
+        self.hydra_context = hydra_context
+        self.task_function = task_function
+
+    def workers(self, n_jobs: int) -> int:
+        """Jobs run at the same time under the CPU and memory budgets."""
+        cpus = os.cpu_count() or 1
+        limits = [n_jobs, self.max_workers or cpus, cpus // self.cpus_per_job]
+        memory_gb = self.memory_gb if self.memory_gb is not None else available_memory_gb()
+        if memory_gb is not None and self.memory_per_job_gb:
+            limits.append(int(memory_gb // self.memory_per_job_gb))
+        return max(1, min(limits))
+
+    def launch(self, job_overrides: Sequence[Sequence[str]], initial_job_idx: int) -> Sequence[JobReturn]:
+        setup_globals()
+        assert self.config is not None
+        assert self.hydra_context is not None
+        assert self.task_function is not None
+
+        configure_log(self.config.hydra.hydra_logging, self.config.hydra.verbose)
+        self.sweep_dir = os.path.abspath(str(self.config.hydra.sweep.dir))
+        self.project_root = os.path.abspath(str(self.config.hydra.runtime.cwd))
+        os.makedirs(os.path.join(self.sweep_dir, "logs"), exist_ok=True)
+
+        jobs = [(initial_job_idx + i, list(overrides)) for i, overrides in enumerate(job_overrides)]
+        workers = self.workers(len(jobs))
+        log.info(
+            f"ProcessPoolLauncher: {len(jobs)} job(s), {workers} at a time "
+            f"({self.cpus_per_job} CPU(s) each), sweep output dir: {self.sweep_dir}"
+        )
+        if "fork" in multiprocessing.get_all_start_methods():
+            results = self._run_forked(jobs, workers)
+        else:
+            # Jobs are started by forking (the task function is not picklable)
+            log.warning("ProcessPoolLauncher: fork is not available here, running the jobs one at a time")
+            results = {idx: self.run_one(idx, overrides) for idx, overrides in jobs}
+
+        returns, infos = [], []
+        for idx, overrides in jobs:
+            ret, info = results[idx]
+            returns.append(ret)
+            infos.append({"job": idx, "overrides": overrides, "status": ret.status, **info})
+        if not self.keep_workspaces:
+            shutil.rmtree(os.path.join(self.sweep_dir, "workspaces"), ignore_errors=True)
+        self._write_summary(infos)
+        return returns
+
+    def _run_forked(self, jobs, workers: int) -> Dict[int, Any]:
+        ctx = multiprocessing.get_context("fork")
+        pending = list(jobs)
+        running = {}  # result connection -> (idx, overrides, process, start)
+        results = {}
+        while pending or running:
+            # a fresh process per job: steps imported in-process do not leak between jobs
+            while pending and len(running) < workers:
+                idx, overrides = pending.pop(0)
+                log.info(f"\t#{idx} : {' '.join(filter_overrides(overrides))}")
+                receiver, sender = ctx.Pipe(duplex=False)
+                process = ctx.Process(target=_job_process, args=(sender, self, idx, overrides))
+                process.start()
+                sender.close()
+                running[receiver] = (idx, overrides, process, time.perf_counter())
+
+            for receiver in multiprocessing.connection.wait(list(running)):
+                idx, overrides, process, start = running.pop(receiver)
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    result = RuntimeError("the job process died without a result (killed? out of memory?)")
+                receiver.close()
+                process.join()
+                if isinstance(result, BaseException):
+                    # the job failed before or after run_job (e.g. while copying its workspace)
+                    result = (
+                        JobReturn(overrides=overrides, status=JobStatus.FAILED, _return_value=result),
+                        {"wall_s": round(time.perf_counter() - start, 3), "report": None},
+                    )
+                results[idx] = result
+                log.info(f"\t#{idx} : {result[0].status.name.lower()} ({result[1]['wall_s']:.1f}s)")
+        return results
+
+    def run_one(self, idx: int, overrides: Sequence[str]):
+        """Run one job in this process (a forked one, normally). Returns (JobReturn, info)."""
+        assert self.hydra_context is not None and self.config is not None and self.task_function is not None
+        start = time.perf_counter()
+
+        workspace = os.path.join(self.sweep_dir, "workspaces", str(idx))
+        shutil.rmtree(workspace, ignore_errors=True)
+        shutil.copytree(self.project_root, workspace, symlinks=True, ignore=self._ignore)
+        environ = dict(os.environ)
+        os.environ[WORKSPACE_ENV] = workspace
+        for name in (CPUS_ENV,) + THREAD_ENVS:
+            os.environ[name] = str(self.cpus_per_job)
+        try:
+            ret = self._run_job(idx, overrides)
+        finally:
+            # only matters when the jobs run in this process (no fork)
+            os.environ.clear()
+            os.environ.update(environ)
+
+        report = self._job_report(ret, workspace)
+        if not self.keep_workspaces:
+            shutil.rmtree(workspace, ignore_errors=True)
+        return ret, {"wall_s": round(time.perf_counter() - start, 3), "report": report}
+
+    def _run_job(self, idx: int, overrides: Sequence[str]) -> JobReturn:
+        sweep_config = self.hydra_context.config_loader.load_sweep_config(self.config, list(overrides))
+        with open_dict(sweep_config):
+            sweep_config.hydra.job.id = idx
+            sweep_config.hydra.job.num = idx
+        ret = run_job(
+            hydra_context=self.hydra_context,
+            task_function=self.task_function,
+            config=sweep_config,
+            job_dir_key="hydra.sweep.dir",
+            job_subdir_key="hydra.sweep.subdir",
+        )
+        if ret.status == JobStatus.FAILED:
+            ret._return_value = _picklable(ret._return_value)
+        return ret
+
+    def _ignore(self, directory: str, names: List[str]) -> List[str]:
+        # never copy the sweep dir into the workspaces it holds, whatever its name
+        ignored = []
+        for name in names:
+            path = os.path.abspath(os.path.join(directory, name))
+            if name in WORKSPACE_IGNORE or os.path.commonpath([path, self.sweep_dir]) == path:
+                ignored.append(name)
+        return ignored
+
+    @staticmethod
+    def _job_report(ret: JobReturn, workspace: str) -> Optional[dict]:
+        # pipeline_report.json written by main.py, also copied to the output dir of the job
+        metrics_dir = OmegaConf.select(ret.cfg, "main.metrics_dir", default="metrics") if ret.cfg else "metrics"
+        path = os.path.join(workspace, str(metrics_dir), "pipeline_report.json")
+        if not os.path.exists(path):
+            return None
+        if ret.hydra_cfg is not None:
+            shutil.copy(path, os.path.join(str(ret.hydra_cfg.hydra.runtime.output_dir), "pipeline_report.json"))
+        with open(path) as fp:
+            return json.load(fp)
+
+    def _write_summary(self, infos: List[dict]) -> None:
+        steps = []
+        for info in infos:
+            for step in (info["report"] or {}).get("steps", []):
+                if step["step"] not in steps:
+                    steps.append(step["step"])
+
+        rows = []
+        for info in infos:
+            row = {
+                "job": info["job"],
+                "overrides": " ".join(filter_overrides(info["overrides"])),
+                "status": info["status"].name.lower(),
+                "wall_s": info["wall_s"],
+            }
+            by_step = {s["step"]: s for s in (info["report"] or {}).get("steps", [])}
+            for name in steps:
+                step = by_step.get(name, {})
+                row[name] = step.get("status", "")
+                row[f"{name}_s"] = step.get("elapsed_s", "")
+                row[f"{name}_rows_out"] = step.get("rows_out", "")
+            rows.append(row)
+
+        path = os.path.join(self.sweep_dir, SUMMARY_FILE)
+        with open(path, "w", newline="") as fp:
+            writer = csv.DictWriter(fp, fieldnames=list(rows[0]) if rows else ["job"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+        # one line per job: the status and elapsed time of every step
+        lines = [f"{'job':<5}{'status':<11}{'wall s':>8}  " + "".join(f"{name:<22}" for name in steps) + "overrides"]
+        for row in rows:
+            cells = ""
+            for name in steps:
+                elapsed = row[f"{name}_s"]
+                cell = f"{row[name]} {elapsed:.1f}s" if elapsed != "" and row[name] else row[name] or "-"
+                cells += f"{cell:<22}"
+            lines.append(f"{row['job']:<5}{row['status']:<11}{row['wall_s']:>8.1f}  {cells}{row['overrides']}")
+        print("\n".join(lines))
+        print(f"Sweep summary written to {path}")
@@ -1,25 +1,43 @@
+import argparse
+import contextlib
+import importlib.util
+import json
 import os
 import sys
-import mlflow
+import time
 import hydra
 from omegaconf import DictConfig, OmegaConf
 from hydra.utils import get_original_cwd
 
 from utils import seed_everything
+from step_cache import StepCache
+from scheduler import DagScheduler, Step
 seed_everything(42)
 
+# Set by the process_pool multirun launcher (hydra_plugins/process_pool_launcher): the
+# private copy of the project a job writes its outputs to, and the CPUs it may use
+WORKSPACE_ENV = "PIPELINE_WORKSPACE"
+CPUS_ENV = "PIPELINE_CPUS"
+
 def _set_env():
     os.environ["WANDB_MODE"] = "offline"
     os.environ["WANDB_SILENT"] = "true"
-    components_abs = os.path.join(get_original_cwd(), "components")
+    components_abs = os.path.join(_project_root(), "components")
     os.environ["PYTHONPATH"] = (
         (os.environ.get("PYTHONPATH", "") + (os.pathsep if os.environ.get("PYTHONPATH") else ""))
         + components_abs
     )
+    # in-process steps import wandb_utils directly
+    if components_abs not in sys.path:
+        sys.path.insert(0, components_abs)
+
+def _project_root() -> str:
+    """The project root, or the job's workspace when a multirun launcher isolates jobs."""
+    return os.environ.get(WORKSPACE_ENV) or get_original_cwd()
 
 def _abs_path(rel_path: str) -> str:
     """Path relative to the project root (not Hydra's run dir)."""
-    return os.path.join(get_original_cwd(), rel_path)
+    return os.path.join(_project_root(), rel_path)
 
 def _parse_steps(cfg: DictConfig):
     steps = cfg.get("main", {}).get("steps", "all")
@@ -28,7 +46,7 @@ def _parse_steps(cfg: DictConfig):
     if isinstance(steps, str):
         steps = steps.strip()
     if steps in ("all", ""):
-        return ["download", "basic_cleaning", "data_split"]
+        return ["download", "basic_cleaning", "data_check", "data_split"]
     return [s.strip() for s in steps.split(",") if s.strip()]
 
 def _get(cfg: DictConfig, path: str, default=None):
@@ -40,6 +58,145 @@ def _get(cfg: DictConfig, path: str, default=None):
     except Exception:
         return default
 
+def _make_cache(cfg: DictConfig):
+    """Build the step cache from `main.cache*` settings (None when caching is disabled)."""
+    if not _get(cfg, "main.cache", True):
+        return None
+    # the cache stays in the real project root, so isolated multirun jobs share it
+    cache = StepCache(os.path.join(get_original_cwd(), _get(cfg, "main.cache_dir", ".step_cache")), _project_root())
+
+    invalidate = str(_get(cfg, "main.invalidate_cache", "") or "").strip()
+    if invalidate == "all":
+        cache.invalidate()
+    elif invalidate:
+        cache.invalidate([s.strip() for s in invalidate.split(",") if s.strip()])
+    return cache
+
+def _prepare_metrics_dir(cfg: DictConfig) -> str:
+    """
+    Point every step (in-process or mlflow.run subprocess) at `main.metrics_dir` through
+    PIPELINE_METRICS_DIR, after removing the metrics of the previous run.
+    """
+    from wandb_utils.instrumentation import METRICS_DIR_ENV
+
+    metrics_dir = _abs_path(_get(cfg, "main.metrics_dir", "metrics"))
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".json"):
+            os.remove(os.path.join(metrics_dir, name))
+    os.environ[METRICS_DIR_ENV] = metrics_dir
+    return metrics_dir
+
+def _prepare_artifact_store(cfg: DictConfig):
+    """
+    Point every step (in-process or mlflow.run subprocess) at the local artifact store
+    `main.artifact_store` through PIPELINE_ARTIFACT_STORE; steps log their outputs there
+    and resolve their inputs from it.
+    """
+    from wandb_utils.artifact_store import STORE_ENV, ArtifactStore
+
+    root = _abs_path(_get(cfg, "main.artifact_store", "artifacts"))
+    os.environ[STORE_ENV] = root
+    return ArtifactStore(root)
+
+def _metrics_report(metrics_dir: str, runs: list, wall_s: float) -> str:
+    """Merge what main saw of each step with the metrics the step reported; write and format the report."""
+    from wandb_utils.instrumentation import format_report, load_metrics
+
+    reported = load_metrics(metrics_dir)
+    steps = []
+    for record in runs:
+        step_metrics = {k: v for k, v in reported.get(record["step"], {}).items() if k not in ("step", "status")}
+        steps.append({**record, **step_metrics})
+
+    report = {"wall_s": round(wall_s, 3), "steps": steps}
+    with open(os.path.join(metrics_dir, "pipeline_report.json"), "w") as fp:
+        json.dump(report, fp, indent=2)
+    return format_report(steps) + f"\nPipeline wall time: {wall_s:.2f}s"
+
+def _load_step(project_dir: str):
+    """Import a step's run.py as a module so its go() can be called in this process."""
+    name = "step_" + os.path.basename(project_dir)
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(project_dir, "run.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+def _run_pytest(parameters: dict):
+    """Run the data_check test session in this process (from the step directory), like its MLproject command."""
+    import pytest
+
+    args = ["-q", "-p", "no:cacheprovider"]
+    for name, value in parameters.items():
+        args += [f"--{name}", str(value)]
+    exit_code = pytest.main(["."] + args)
+    if exit_code != 0:
+        raise RuntimeError(f"data_check tests failed (pytest exit code {int(exit_code)})")
+
+@contextlib.contextmanager
+def _working_dir(path: str):
+    """Run in `path` like mlflow.run does, then go back (Hydra's run dir)."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def _run_step(cache, step: str, project_dir: str, parameters: dict, inputs, outputs, inprocess=None, runs=None,
+              store=None, artifacts=None):
+    """
+    Run one MLflow step, or restore its outputs from the cache when nothing it depends on changed.
+    `inputs`/`outputs` are paths relative to the project root.
+
+    `artifacts` ({name: path relative to the project root}) are the files the step logs to
+    the artifact `store`; a step restored from the cache did not log them, so they are
+    logged here (a no-op when the store already has that content as the latest version).
+
+    When `inprocess` is given (a callable invoking the step's go()), it is called from the
+    step directory instead of launching `mlflow.run`, and its return value is handed back
+    so in-memory results can feed the next step. Returns None otherwise.
+
+    When `runs` is given, {"step", "status" (ok|cached|failed), "elapsed_s"} is appended to it.
+    """
+    record = {"step": step, "status": "failed"}
+    if runs is not None:
+        runs.append(record)
+    start = time.perf_counter()
+    try:
+        with contextlib.ExitStack() as stack:
+            key = None
+            if cache is not None:
+                source_dirs = [os.path.relpath(project_dir, _project_root()), "components/wandb_utils"]
+                key = cache.key(step, parameters, source_dirs, inputs)
+                # concurrent runs (multirun jobs) needing the same entry wait for the one computing it
+                stack.enter_context(cache.lock(step, key))
+                if cache.restore(step, key):
+                    for name, rel in (artifacts or {}).items():
+                        # like basic_cleaning, the first sketch logged is the drift reference
+                        default_aliases = ("reference",) if name.endswith(".sketch.json") else ()
+                        store.put(name, _abs_path(rel), default_aliases=default_aliases)
+                    record["status"] = "cached"
+                    return None
+
+            result = None
+            if inprocess is not None:
+                with _working_dir(project_dir):
+                    result = inprocess()
+            else:
+                import mlflow  # only subprocess execution needs it (slow to import)
+
+                mlflow.run(project_dir, entry_point="main", env_manager="local", parameters=parameters)
+
+            if cache is not None:
+                cache.store(step, key, outputs, parameters)
+            record["status"] = "ok"
+            return result
+    finally:
+        record["elapsed_s"] = round(time.perf_counter() - start, 3)
+
 @hydra.main(version_base=None, config_path=".", config_name="config")
 def go(config: DictConfig):
     """
@@ -47,7 +204,13 @@ def go(config: DictConfig):
       - config.yaml in project root
       - components/get_data
       - src/basic_cleaning
+      - src/data_check
       - src/data_split
+
+    Each active step is declared with the artifacts it reads and writes; the scheduler
+    runs a step as soon as the steps producing its inputs have succeeded, up to
+    `main.max_workers` steps at a time (e.g. data_check and data_split both start once
+    basic_cleaning is done).
     """
     _set_env()
     print("Resolved config:\n", OmegaConf.to_yaml(config))
@@ -55,35 +218,75 @@ def go(config: DictConfig):
     active_steps = _parse_steps(config)
     print("Active steps:", active_steps)
 
+    cache = _make_cache(config)
+    store = _prepare_artifact_store(config)
+
+    # Every step writes its wall/CPU time, peak memory and row counts to metrics_dir
+    metrics_dir = _prepare_metrics_dir(config)
+    runs = []
+
+    # "subprocess" (default): one isolated `mlflow.run` per step.
+    # "inprocess": import each step's go() and pass DataFrames between steps in memory.
+    execution = _get(config, "main.execution", "subprocess")
+    if execution not in ("subprocess", "inprocess"):
+        raise ValueError(f"main.execution must be 'subprocess' or 'inprocess', got {execution!r}")
+    inprocess = execution == "inprocess"
+    print("Execution mode:", execution)
+
+    # steps are CPU-bound: running more of them than there are cores only adds contention
+    cpus = int(os.environ.get(CPUS_ENV) or 0) or os.cpu_count() or 1
+    max_workers = min(int(_get(config, "main.max_workers", 1)), cpus)
+    if inprocess and max_workers > 1:
+        # in-process steps run from their own directory (os.chdir is process-wide)
+        print("In-process execution runs one step at a time (main.max_workers ignored)")
+        max_workers = 1
+
     # Absolute paths to each MLflow project
     comp_get_data   = _abs_path("components/get_data")
     comp_cleaning   = _abs_path("src/basic_cleaning")
+    comp_data_check = _abs_path("src/data_check")
     comp_data_split = _abs_path("src/data_split")
 
+    # Intermediate tables (cleaned data, splits) are written as Parquet by default; "csv" keeps the old files
+    fmt = _get(config, "etl.intermediate_format", "parquet")
+    ext = {"parquet": ".parquet", "csv": ".csv"}[fmt]
+    clean_name = f"clean_sample{ext}"
+    clean_sketch = f"{clean_name}.sketch.json"
+
     # Read sample once and propagate as artifact name
     sample = _get(config, "etl.sample", "sample1.csv")
     artifact_name = sample  # ensure the artifact we log/consume matches the chosen sample
 
+    steps = []
+
     # -----------------------
     # Step 1 — Download data
     # -----------------------
     if "download" in active_steps:
         print(f"[download] sample={sample}")
-        try:
-            _ = mlflow.run(
+        download_params = {
+            "sample": sample,
+            "artifact_name": artifact_name,  # <- was hardcoded before
+            "artifact_type": "raw_data",
+            "artifact_description": "Raw file as downloaded",
+        }
+        steps.append(Step(
+            "download",
+            lambda results: _run_step(
+                cache,
+                "download",
                 comp_get_data,
-                entry_point="main",
-                env_manager="local",
-                parameters={
-                    "sample": sample,
-                    "artifact_name": artifact_name,  # <- was hardcoded before
-                    "artifact_type": "raw_data",
-                    "artifact_description": "Raw file as downloaded",
-                },
-            )
-        except Exception as e:
-            print("[download] FAILED:", e, file=sys.stderr)
-            raise
+                parameters=download_params,
+                inputs=[f"components/get_data/data/{sample}"],
+                outputs=[],  # only logged to W&B and to the artifact store
+                inprocess=(lambda: _load_step(comp_get_data).go(argparse.Namespace(**download_params)))
+                if inprocess else None,
+                runs=runs,
+                store=store,
+                artifacts={artifact_name: f"components/get_data/data/{sample}"},
+            ),
+            outputs=[artifact_name],
+        ))
 
     # ----------------------------
     # Step 2 — Basic data cleaning
@@ -91,51 +294,130 @@ def go(config: DictConfig):
     if "basic_cleaning" in active_steps:
         min_price = _get(config, "etl.min_price", 10)
         max_price = _get(config, "etl.max_price", 350)
-        print(f"[basic_cleaning] min_price={min_price}, max_price={max_price}")
-        try:
-            _ = mlflow.run(
+        chunksize = _get(config, "etl.chunksize", 0)
+        print(f"[basic_cleaning] min_price={min_price}, max_price={max_price}, chunksize={chunksize}")
+        cleaning_params = {
+            "input_artifact": f"{artifact_name}:latest",  # <- now follows selected sample
+            "output_artifact": clean_name,
+            "output_type": "clean_data",
+            "output_description": "Data after basic cleaning",
+            "min_price": min_price,
+            "max_price": max_price,
+            "chunksize": chunksize,
+        }
+        steps.append(Step(
+            "basic_cleaning",
+            lambda results: _run_step(
+                cache,
+                "basic_cleaning",
                 comp_cleaning,
-                entry_point="main",
-                env_manager="local",
-                parameters={
-                    "input_artifact": f"{artifact_name}:latest",  # <- now follows selected sample
-                    "output_artifact": "clean_sample.csv",
-                    "output_type": "clean_data",
-                    "output_description": "Data after basic cleaning",
-                    "min_price": min_price,
-                    "max_price": max_price,
-                },
-            )
-        except Exception as e:
-            print("[basic_cleaning] FAILED:", e, file=sys.stderr)
-            raise
+                parameters=cleaning_params,
+                # the stored raw data, and every file _resolve_input_path may fall back to
+                inputs=[f"components/get_data/data/{sample}", "src/basic_cleaning/sample.csv", "sample.csv"],
+                outputs=[
+                    f"src/basic_cleaning/{clean_name}",
+                    # distribution sketch used as drift-check reference
+                    f"src/basic_cleaning/{clean_sketch}",
+                ],
+                inprocess=(lambda: _load_step(comp_cleaning).go(**cleaning_params)) if inprocess else None,
+                runs=runs,
+                store=store,
+                artifacts={name: f"src/basic_cleaning/{name}" for name in (clean_name, clean_sketch)},
+            ),
+            inputs=[artifact_name],
+            outputs=[clean_name, clean_sketch],
+        ))
+
+    # ---------------------------------
+    # Step 3 — Check the cleaned data
+    # ---------------------------------
+    if "data_check" in active_steps:
+        print(f"[data_check] kl_threshold={_get(config, 'data_check.kl_threshold', 0.2)}, "
+              f"numeric_kl_threshold={_get(config, 'data_check.numeric_kl_threshold', 0.1)}")
+        check_params = {
+            "csv": f"{clean_name}:latest",
+            "ref": f"{clean_sketch}:reference",
+            "kl_threshold": _get(config, "data_check.kl_threshold", 0.2),
+            "numeric_kl_threshold": _get(config, "data_check.numeric_kl_threshold", 0.1),
+            "min_price": _get(config, "etl.min_price", 10),
+            "max_price": _get(config, "etl.max_price", 350),
+            "workers": _get(config, "data_check.workers", 1),
+        }
+        steps.append(Step(
+            "data_check",
+            lambda results: _run_step(
+                cache,
+                "data_check",
+                comp_data_check,
+                parameters=check_params,
+                inputs=[f"src/basic_cleaning/{clean_name}", f"src/basic_cleaning/{clean_sketch}"],
+                outputs=[],  # the step passes or fails
+                inprocess=(lambda: _run_pytest(check_params)) if inprocess else None,
+                runs=runs,
+            ),
+            inputs=[clean_name, clean_sketch],
+        ))
 
     # -------------------------
-    # Step 3 — Split the data
+    # Step 4 — Split the data
     # -------------------------
     if "data_split" in active_steps:
         test_size   = _get(config, "modeling.test_size", 0.2)
         val_size    = _get(config, "modeling.val_size", 0.2)
         random_seed = _get(config, "modeling.random_seed", 42)
         stratify_by = _get(config, "modeling.stratify_by", "neighbourhood_group")
-        print(f"[data_split] test_size={test_size}, val_size={val_size}, stratify_by={stratify_by}")
-        try:
-            _ = mlflow.run(
+        split_mode  = _get(config, "modeling.split_mode", "random")
+        split_output = _get(config, "modeling.split_output", "table")
+        print(f"[data_split] test_size={test_size}, val_size={val_size}, stratify_by={stratify_by}, "
+              f"split_mode={split_mode}, split_output={split_output}")
+        # index: every split is a row index into the cleaned data plus a .split.json reference
+        split_files = [".idx.npy", ".split.json"] if split_output == "index" else [ext]
+        split_params = {
+            "input_artifact": f"{clean_name}:latest",
+            "test_size": test_size,
+            "val_size": val_size,
+            "stratify_by": stratify_by,
+            "random_seed": random_seed,
+            "split_mode": split_mode,
+            "chunksize": _get(config, "etl.chunksize", 0),
+            "output_mode": split_output,
+        }
+        steps.append(Step(
+            "data_split",
+            lambda results: _run_step(
+                cache,
+                "data_split",
                 comp_data_split,
-                entry_point="main",
-                env_manager="local",
-                parameters={
-                    "input_artifact": "clean_sample.csv:latest",
-                    "test_size": test_size,
-                    "val_size": val_size,
-                    "stratify_by": stratify_by,
-                    "random_seed": random_seed,
-                },
-            )
-        except Exception as e:
-            print("[data_split] FAILED:", e, file=sys.stderr)
-            raise
+                parameters=split_params,
+                inputs=[f"src/basic_cleaning/{clean_name}"],
+                outputs=[f"src/data_split/outputs/{k}{f}" for k in ("train", "val", "test") for f in split_files],
+                # in-process, the cleaned DataFrame is handed over in memory
+                inprocess=(lambda: _load_step(comp_data_split).go(
+                    argparse.Namespace(**split_params), df=results.get("basic_cleaning")
+                )) if inprocess else None,
+                runs=runs,
+            ),
+            inputs=[clean_name],
+            outputs=[f"{k}{f}" for k in ("train", "val", "test") for f in split_files],
+        ))
+
+    scheduler = DagScheduler(steps, max_workers=max_workers)
+    print(f"Running {len(steps)} step(s), up to {scheduler.max_workers} at a time")
+    start = time.perf_counter()
+    status = scheduler.run()
+    wall_s = time.perf_counter() - start
+
+    # steps that did not run because an upstream step failed are reported too
+    by_step = {record["step"]: record for record in runs}
+    runs = [by_step.get(name, {"step": name, "status": status[name]}) for name in scheduler.order]
+
+    if cache is not None:
+        print(cache.report())
+    print(_metrics_report(metrics_dir, runs, wall_s))
 
+    failed = scheduler.failed()
+    if failed:
+        raise RuntimeError(f"Pipeline failed: step(s) {failed} failed; downstream steps were skipped")
     print("Pipeline finished successfully ✅")
 
 if __name__ == "__main__":
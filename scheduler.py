@@ -0,0 +1,118 @@
+# scheduler.py — run pipeline steps as a DAG of the artifacts they read and write
+import concurrent.futures
+import traceback
+
+
+class Step:
+    """
+    A pipeline step, declared by the artifacts it reads and writes.
+
+    Args:
+        name: step name (e.g. "basic_cleaning")
+        run: callable taking the dict of results of the finished steps (step name ->
+             return value of its run) and returning this step's result
+        inputs: artifact names the step consumes
+        outputs: artifact names the step produces
+    """
+
+    def __init__(self, name: str, run, inputs=(), outputs=()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+
+class DagScheduler:
+    """
+    Runs steps as soon as the steps producing their inputs have succeeded, at most
+    `max_workers` at a time.
+
+    A step depends on the steps (among those given) that produce one of its inputs; inputs
+    nobody produces are expected to exist already. When a step fails, every step
+    downstream of it is skipped, while independent branches keep running.
+
+    Statuses: pending, running, ok, failed, skipped (an upstream step failed).
+    """
+
+    def __init__(self, steps, max_workers: int = 1):
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"Step {step.name!r} is declared twice")
+            self.steps[step.name] = step
+        self.max_workers = max(1, int(max_workers))
+        self.dependencies = self._dependencies()
+        self.order = self._topological_order()
+        self.status = {name: "pending" for name in self.order}
+        self.errors = {}
+        self.results = {}
+
+    def _dependencies(self):
+        producers = {}
+        for step in self.steps.values():
+            for artifact in step.outputs:
+                if artifact in producers:
+                    raise ValueError(
+                        f"Artifact {artifact!r} is produced by both {producers[artifact]!r} and {step.name!r}"
+                    )
+                producers[artifact] = step.name
+        return {
+            step.name: sorted({producers[a] for a in step.inputs if a in producers} - {step.name})
+            for step in self.steps.values()
+        }
+
+    def _topological_order(self):
+        # Kahn's algorithm, keeping the declaration order among independent steps
+        remaining = {name: set(deps) for name, deps in self.dependencies.items()}
+        order = []
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependency cycle among steps {sorted(remaining)}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    def run(self) -> dict:
+        """
+        Run every step (failures are recorded, not raised).
+
+        Returns:
+            dict of step name -> final status
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while True:
+                # self.order is topological, so one pass propagates skips transitively
+                for name in self.order:
+                    if self.status[name] != "pending":
+                        continue
+                    upstream = [self.status[d] for d in self.dependencies[name]]
+                    if any(s in ("failed", "skipped") for s in upstream):
+                        self.status[name] = "skipped"
+                    elif all(s == "ok" for s in upstream) and len(running) < self.max_workers:
+                        self.status[name] = "running"
+                        print(f"[scheduler] starting {name}")
+                        running[pool.submit(self.steps[name].run, dict(self.results))] = name
+
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                        self.status[name] = "ok"
+                        print(f"[scheduler] {name} finished")
+                    except Exception as e:
+                        self.status[name] = "failed"
+                        self.errors[name] = e
+                        print(f"[{name}] FAILED: {e}")
+                        traceback.print_exception(type(e), e, e.__traceback__)
+        return dict(self.status)
+
+    def failed(self):
+        return [name for name in self.order if self.status[name] == "failed"]
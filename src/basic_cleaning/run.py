@@ -1,11 +1,17 @@
 """
 Basic cleaning step.
 
-- Reads the input CSV (artifact name or local file).
-- Filters rows by price range.
+- Reads the input CSV (artifact from the local artifact store, or local file).
+- Filters rows by price range (optionally streaming the input in fixed-size chunks).
 - Removes rows outside the NYC lat/lon bounding box.
-- Saves the cleaned CSV as the specified output artifact.
-- Also writes a copy to the project root so downstream steps can read it locally.
+- Saves the cleaned table as the specified output artifact, in the intermediate
+  format given by its suffix (.parquet or .csv, see wandb_utils.intermediate).
+- Saves a distribution sketch of the cleaned data next to it (<output>.sketch.json),
+  used as the reference by the data_check drift tests.
+- Logs both to the local artifact store (see wandb_utils.artifact_store), where the
+  downstream steps resolve them.
+- Records wall/CPU time, peak memory and row counts of its read, filter and write
+  stages (see wandb_utils.instrumentation).
 
 Run via MLflow entry point with parameters in MLproject.
 """
@@ -15,6 +21,11 @@ import os
 from pathlib import Path
 import pandas as pd
 
+from wandb_utils.artifact_store import default_store
+from wandb_utils.instrumentation import StepMetrics
+from wandb_utils.intermediate import TableWriter, iter_table, read_table, write_table
+from wandb_utils.sketch import empty_sketch, save_sketch, sketch_path, update_sketch
+
 
 # ---- NYC bounding box (approx) ----
 LAT_MIN, LAT_MAX = 40.3, 41.2
@@ -32,12 +43,17 @@ def _resolve_input_path(input_artifact: str) -> Path:
     Returns:
         Path: existing path to a CSV file
     """
-    # 1) Direct filename from the artifact (strip possible :version)
+    # 1) The artifact in the local store (logged by the download step)
+    stored = default_store().find(input_artifact)
+    if stored is not None:
+        return Path(stored)
+
+    # 2) Direct filename from the artifact (strip possible :version)
     candidate = Path(input_artifact.split(":")[0])
     if candidate.exists():
         return candidate
 
-    # 2) Common fallbacks when running offline / local
+    # 3) Common fallbacks when running offline / local
     here = Path(__file__).resolve().parent
     for p in [
         here / "sample.csv",
@@ -59,28 +75,120 @@ def go(
     output_description: str,
     min_price: float,
     max_price: float,
-) -> None:
+    df: pd.DataFrame = None,
+    chunksize: int = 0,
+) -> pd.DataFrame:
     """
     Clean the dataset.
 
     Args:
         input_artifact (str): Input CSV artifact name or local filename.
-        output_artifact (str): Output CSV filename to write (e.g., clean_sample.csv).
+        output_artifact (str): Output filename to write (e.g., clean_sample.parquet or clean_sample.csv).
         output_type (str): Artifact type (kept for compatibility/logging).
         output_description (str): Description (kept for compatibility/logging).
         min_price (float): Minimum allowed price (inclusive).
         max_price (float): Maximum allowed price (inclusive).
+        df (pd.DataFrame, optional): Already-loaded input (in-process execution); when given,
+            input_artifact is not read.
+        chunksize (int, optional): When > 0, stream the input in chunks of this many rows and
+            append each filtered chunk to the output. The output file is identical to the
+            in-memory path.
+
+    Returns:
+        pd.DataFrame: the cleaned data (None in streaming mode)
+    """
+    out_path = Path(output_artifact)
+    counts = {"rows": 0, "price": 0, "nyc": 0, "nyc_skipped": False}
+    sketch = empty_sketch()
+
+    with StepMetrics("basic_cleaning") as metrics:
+        if df is None and chunksize:
+            # ---- Streaming: filter fixed-size chunks and append them to the output ----
+            # Peak memory is bounded by the chunk size instead of the input size.
+            print(f"Reading input in chunks of {chunksize} rows: {input_artifact}")
+            input_path = _resolve_input_path(input_artifact)
+            chunks = iter_table(input_path, chunksize)
+            read, filtering, writing = metrics.stage("read"), metrics.stage("filter"), metrics.stage("write")
+            with TableWriter(out_path) as writer:
+                while True:
+                    with read:
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    read.add_rows(rows_out=len(chunk))
+                    with filtering:
+                        kept_chunk = _apply_filters(chunk, min_price, max_price, counts)
+                        update_sketch(sketch, kept_chunk)
+                    filtering.add_rows(rows_in=len(chunk), rows_out=len(kept_chunk))
+                    with writing:
+                        writer.write(kept_chunk)
+                    writing.add_rows(rows_in=len(kept_chunk))
+                with writing:
+                    writer.close()
+        else:
+            if df is None:
+                print(f"Reading input: {input_artifact}")
+                with metrics.stage("read") as stage:
+                    input_path = _resolve_input_path(input_artifact)
+                    df = read_table(input_path)
+                    stage.rows_out = len(df)
+            with metrics.stage("filter", rows_in=len(df)) as stage:
+                df = _apply_filters(df, min_price, max_price, counts)
+                update_sketch(sketch, df)
+                stage.rows_out = len(df)
+            with metrics.stage("write", rows_in=len(df)):
+                write_table(df, out_path)
+
+        with metrics.stage("write"):
+            save_sketch(sketch, sketch_path(out_path))
+        metrics.rows_in = counts["rows"]
+        metrics.rows_out = metrics.stages["filter"].rows_out or 0
+
+    kept = counts["rows"] - counts["price"]
+    print(f"Price filter [{min_price}, {max_price}] removed {counts['price']} rows (kept {kept}).")
+    if not counts["nyc_skipped"]:
+        print(f"NYC boundary filter removed {counts['nyc']} rows (kept {kept - counts['nyc']}).")
+    else:
+        print("Warning: 'latitude'/'longitude' columns not found; skipping NYC boundary filter.")
+    print(f"Wrote cleaned data to {out_path} (distribution sketch: {sketch_path(out_path)})")
+
+    # Downstream steps (running from their own directories) resolve the cleaned data and
+    # its sketch through the artifact store
+    store = default_store()
+    for path, artifact_type, description, default_aliases in (
+        (out_path, output_type, output_description, ()),
+        # The first sketch logged is the reference of the drift checks (data_check)
+        (Path(sketch_path(out_path)), "data_sketch", f"Distribution sketch of {out_path.name}", ("reference",)),
+    ):
+        record = store.put(path.name, path, artifact_type, description, default_aliases=default_aliases)
+        print(f"Logged {record['name']}:{record['version']} to the artifact store {store.root}")
+    reference = store.lookup(f"{sketch_path(out_path.name)}:reference")
+    print(f"Drift reference: {reference['name']}:{reference['version']}")
+
+    return df
+
+
+def _apply_filters(df: pd.DataFrame, min_price: float, max_price: float, counts: dict) -> pd.DataFrame:
     """
-    print(f"Reading input: {input_artifact}")
-    input_path = _resolve_input_path(input_artifact)
-    df = pd.read_csv(input_path)
+    Apply the price range and NYC boundary filters, adding the removed row counts to `counts`.
+
+    Args:
+        df (pd.DataFrame): Data (or one chunk of it) to filter.
+        min_price (float): Minimum allowed price (inclusive).
+        max_price (float): Maximum allowed price (inclusive).
+        counts (dict): Running totals {"rows", "price", "nyc"}, plus "nyc_skipped", set to
+            True when the latitude/longitude columns are missing (the NYC filter is skipped).
+
+    Returns:
+        pd.DataFrame: the filtered rows
+    """
+    counts["rows"] += len(df)
 
     # ---- Price range filter ----
     before = len(df)
     if "price" in df.columns:
         df = df[df["price"].between(min_price, max_price, inclusive="both")]
-    after = len(df)
-    print(f"Price filter [{min_price}, {max_price}] removed {before - after} rows (kept {after}).")
+    counts["price"] += before - len(df)
 
     # ---- NYC boundary filter (new for v1.0.1) ----
     if {"latitude", "longitude"}.issubset(df.columns):
@@ -89,34 +197,24 @@ def go(
             df["latitude"].between(LAT_MIN, LAT_MAX, inclusive="both")
             & df["longitude"].between(LON_MIN, LON_MAX, inclusive="both")
         ]
-        after = len(df)
-        print(f"NYC boundary filter removed {before - after} rows (kept {after}).")
+        counts["nyc"] += before - len(df)
     else:
-        print("Warning: 'latitude'/'longitude' columns not found; skipping NYC boundary filter.")
+        counts["nyc_skipped"] = True
 
-    # ---- Save outputs ----
-    out_path = Path(output_artifact)
-    df.to_csv(out_path, index=False)
-    print(f"Wrote cleaned data to {out_path}")
-
-    # Also write a copy to the project root so downstream steps (running in temp dirs)
-    # can reliably read '../../clean_sample.csv' as used in data_split.
-    proj_root_copy = Path(__file__).resolve().parents[2] / out_path.name
-    try:
-        df.to_csv(proj_root_copy, index=False)
-        print(f"Copied cleaned data to project root: {proj_root_copy}")
-    except Exception as e:
-        print(f"Note: could not copy cleaned data to project root: {e}")
+    return df
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Basic data cleaning with NYC boundary filter.")
     parser.add_argument("--input_artifact", type=str, required=True, help="Input CSV (artifact or file)")
-    parser.add_argument("--output_artifact", type=str, required=True, help="Output CSV filename")
+    parser.add_argument("--output_artifact", type=str, required=True, help="Output filename (.parquet or .csv)")
     parser.add_argument("--output_type", type=str, required=True, help="Artifact type (kept for compatibility)")
     parser.add_argument("--output_description", type=str, required=True, help="Description (kept for compatibility)")
     parser.add_argument("--min_price", type=float, required=True, help="Minimum allowed price")
     parser.add_argument("--max_price", type=float, required=True, help="Maximum allowed price")
+    parser.add_argument(
+        "--chunksize", type=int, default=0, help="Rows per chunk for streaming mode (0 = load the whole file)"
+    )
     args = parser.parse_args()
 
     go(
@@ -126,4 +224,5 @@ if __name__ == "__main__":
         output_description=args.output_description,
         min_price=args.min_price,
         max_price=args.max_price,
+        chunksize=args.chunksize,
     )
@@ -0,0 +1,105 @@
+"""
+Single-pass statistics engine for the data checks.
+
+The dataset is scanned once, reading only the columns the checks need, and every
+statistic the tests assert on is computed in that pass, including the distribution
+sketch the drift tests compare with the reference sketch. Statistics of separate
+chunks (or Parquet row groups processed by separate workers) are merged, so the scan
+can be split across processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from wandb_utils.intermediate import format_of, iter_table
+from wandb_utils.sketch import SKETCH_COLUMNS, empty_sketch, merge_sketches, update_sketch
+
+
+# Columns needed by the checks (the full header is read separately for test_column_names)
+STAT_COLUMNS = list(dict.fromkeys(["neighbourhood_group", "latitude", "longitude", "price"] + SKETCH_COLUMNS))
+
+# Properties in and around NYC
+LON_MIN, LON_MAX = -74.25, -73.50
+LAT_MIN, LAT_MAX = 40.5, 41.2
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+
+def read_columns(path: str) -> list:
+    """Column names of the dataset, in order, without loading any rows."""
+    if format_of(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        return list(pq.read_schema(path).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def partial_stats(df: pd.DataFrame) -> dict:
+    """Statistics of one chunk of the dataset (see merge_stats)."""
+    price = df["price"]
+    in_bounds = df["longitude"].between(LON_MIN, LON_MAX) & df["latitude"].between(LAT_MIN, LAT_MAX)
+    return {
+        "n_rows": int(len(df)),
+        "out_of_bounds": int((~in_bounds).sum()),
+        "price_missing": int(price.isna().sum()),
+        "price_min": float(price.min()) if price.notna().any() else np.inf,
+        "price_max": float(price.max()) if price.notna().any() else -np.inf,
+        "sketch": update_sketch(empty_sketch(), df),
+    }
+
+
+def merge_stats(parts) -> dict:
+    """Combine the statistics of disjoint chunks into the statistics of their union."""
+    merged = {
+        "n_rows": 0,
+        "out_of_bounds": 0,
+        "price_missing": 0,
+        "price_min": np.inf,
+        "price_max": -np.inf,
+    }
+    parts = list(parts)
+    for part in parts:
+        for key in ("n_rows", "out_of_bounds", "price_missing"):
+            merged[key] += part[key]
+        merged["price_min"] = min(merged["price_min"], part["price_min"])
+        merged["price_max"] = max(merged["price_max"], part["price_max"])
+    merged["sketch"] = merge_sketches(part["sketch"] for part in parts)
+    return merged
+
+
+def _row_group_stats(path: str, row_groups: list) -> dict:
+    import pyarrow.parquet as pq
+
+    table = pq.ParquetFile(path).read_row_groups(row_groups, columns=STAT_COLUMNS)
+    return partial_stats(table.to_pandas())
+
+
+def compute_stats(path: str, chunksize: int = DEFAULT_CHUNKSIZE, workers: int = 1) -> dict:
+    """
+    Compute every statistic used by the data checks in one pass over the dataset.
+
+    Args:
+        path: dataset file (Parquet or CSV)
+        chunksize: rows per chunk when scanning sequentially
+        workers: with a Parquet file and workers > 1, row groups are scanned in parallel
+
+    Returns:
+        dict with "columns", "n_rows", "out_of_bounds", "price_missing", "price_min",
+        "price_max" and "sketch" (categorical counts and fixed-bin histograms, see
+        wandb_utils.sketch)
+    """
+    if workers > 1 and format_of(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        n_groups = pq.ParquetFile(path).num_row_groups
+        batches = [list(b) for b in np.array_split(np.arange(n_groups), min(workers, n_groups)) if len(b)]
+        with ProcessPoolExecutor(max_workers=len(batches)) as pool:
+            parts = list(pool.map(_row_group_stats, [path] * len(batches), batches))
+    else:
+        parts = [partial_stats(chunk) for chunk in iter_table(path, chunksize, columns=STAT_COLUMNS)]
+
+    stats = merge_stats(parts)
+    stats["columns"] = read_columns(path)
+    return stats
+
@@ -1,46 +1,96 @@
+import os
+
 import pytest
-import pandas as pd
-import wandb
+
+from check_engine import compute_stats
+from wandb_utils.artifact_store import default_store, parse_spec
+from wandb_utils.instrumentation import StepMetrics
+from wandb_utils.sketch import SKETCH_SUFFIX, load_sketch, sketch_path
+
+
+def _artifact_file(request, artifact):
+    # The artifact from the local store (no W&B run needed), or from W&B when the store
+    # does not have it. A reference is never replaced by another version: comparing the
+    # data with its own latest version would always pass.
+    store = default_store()
+    local_path = store.find(artifact)
+    if local_path is not None:
+        return local_path
+    name, version = parse_spec(artifact)
+    if store.versions(name) and version not in ("latest", ""):
+        pytest.fail(
+            f"{name} has no version {version!r} in the artifact store {store.root} "
+            f"(tag one with ArtifactStore.alias, e.g. alias('{name}:v0', '{version}'))"
+        )
+    return request.getfixturevalue("run").use_artifact(artifact).file()
 
 
 def pytest_addoption(parser):
     parser.addoption("--csv", action="store")
     parser.addoption("--ref", action="store")
     parser.addoption("--kl_threshold", action="store")
+    parser.addoption("--numeric_kl_threshold", action="store")
     parser.addoption("--min_price", action="store")
     parser.addoption("--max_price", action="store")
+    parser.addoption("--workers", action="store", default="1")
 
 
 @pytest.fixture(scope='session')
-def data(request):
-    run = wandb.init(job_type="data_tests", resume=True)
-
-    # Download input artifact. This will also note that this script is using this
-    # particular version of the artifact
-    data_path = run.use_artifact(request.config.option.csv).file()
+def run():
+    # A single W&B run for the whole session, started only for artifacts the store does not have
+    import wandb
 
-    if data_path is None:
-        pytest.fail("You must provide the --csv option on the command line")
+    return wandb.init(job_type="data_tests", resume=True)
 
-    df = pd.read_csv(data_path)
 
-    return df
+@pytest.fixture(scope='session')
+def metrics():
+    # Resources used by the session (written when it ends)
+    with StepMetrics("data_check") as step_metrics:
+        yield step_metrics
 
 
 @pytest.fixture(scope='session')
-def ref_data(request):
-    run = wandb.init(job_type="data_tests", resume=True)
+def workers(request):
+    return int(request.config.option.workers)
+
 
-    # Download input artifact. This will also note that this script is using this
-    # particular version of the artifact
-    data_path = run.use_artifact(request.config.option.ref).file()
+@pytest.fixture(scope='session')
+def data_stats(request, workers, metrics):
+    # Resolve the input artifact (local store first, W&B otherwise)
+    data_path = _artifact_file(request, request.config.option.csv)
 
     if data_path is None:
-        pytest.fail("You must provide the --ref option on the command line")
+        pytest.fail("You must provide the --csv option on the command line")
 
-    df = pd.read_csv(data_path)
+    # Every statistic the tests need, computed in a single pass over the data
+    with metrics.stage("data_stats") as stage:
+        stats = compute_stats(data_path, workers=workers)
+        stage.rows_in = stats["n_rows"]
+    metrics.rows_in = stats["n_rows"]
+    return stats
 
-    return df
+
+@pytest.fixture(scope='session')
+def ref_sketch(request, workers, metrics):
+    # The drift tests only need the distribution sketch of the reference. Pass the sketch
+    # artifact (e.g. clean_sample.parquet.sketch.json, written by basic_cleaning) to avoid
+    # downloading the reference data at all.
+    ref_path = _artifact_file(request, request.config.option.ref)
+
+    if ref_path is None:
+        pytest.fail("You must provide the --ref option on the command line")
+
+    with metrics.stage("ref_sketch") as stage:
+        if ref_path.endswith(SKETCH_SUFFIX):
+            sketch = load_sketch(ref_path)
+        elif os.path.exists(sketch_path(ref_path)):
+            sketch = load_sketch(sketch_path(ref_path))
+        else:
+            # Reference data without a sketch: summarize it (one pass)
+            sketch = compute_stats(ref_path, workers=workers)["sketch"]
+        stage.rows_in = sketch["n_rows"]
+    return sketch
 
 
 @pytest.fixture(scope='session')
@@ -52,6 +102,15 @@ def kl_threshold(request):
 
     return float(kl_threshold)
 
+@pytest.fixture(scope='session')
+def numeric_kl_threshold(request):
+    numeric_kl_threshold = request.config.option.numeric_kl_threshold
+
+    if numeric_kl_threshold is None:
+        pytest.fail("You must provide a threshold for the KL test of the numeric columns")
+
+    return float(numeric_kl_threshold)
+
 @pytest.fixture(scope='session')
 def min_price(request):
     min_price = request.config.option.min_price
@@ -1,13 +1,26 @@
-import pandas as pd
 import numpy as np
-import scipy.stats
+import pytest
+from scipy.special import rel_entr
 
+from wandb_utils.sketch import HISTOGRAM_EDGES, categorical_distribution, histogram_distribution
 
-def test_column_names(data: pd.DataFrame) -> None:
+
+# All tests assert against statistics precomputed in one pass over the data
+# (see check_engine.compute_stats), so none of them scans the dataset again.
+
+
+def _kl_divergence(p, q):
+    # scipy.stats.entropy(p, q, base=2), without importing all of scipy.stats
+    p = np.asarray(p, dtype=float) / np.sum(p)
+    q = np.asarray(q, dtype=float) / np.sum(q)
+    return np.sum(rel_entr(p, q)) / np.log(2)
+
+
+def test_column_names(data_stats: dict) -> None:
     """Test if the DataFrame has the expected column names.
     
     Args:
-        data: Input DataFrame to test
+        data_stats: Precomputed statistics of the input data
     """
     expected_colums = [
         "id",
@@ -28,51 +41,49 @@ def test_column_names(data: pd.DataFrame) -> None:
         "availability_365",
     ]
 
-    these_columns = data.columns.values
+    these_columns = data_stats["columns"]
 
     # This also enforces the same order
     assert list(expected_colums) == list(these_columns)
 
 
-def test_neighborhood_names(data: pd.DataFrame) -> None:
+def test_neighborhood_names(data_stats: dict) -> None:
     """Test if neighborhood names are within expected values.
     
     Args:
-        data: Input DataFrame to test
+        data_stats: Precomputed statistics of the input data
     """
     known_names = ["Bronx", "Brooklyn", "Manhattan", "Queens", "Staten Island"]
 
-    neigh = set(data['neighbourhood_group'].unique())
+    neigh = set(data_stats["sketch"]["categorical"]["neighbourhood_group"])
 
     # Unordered check
     assert set(known_names) == set(neigh)
 
 
-def test_proper_boundaries(data: pd.DataFrame):
+def test_proper_boundaries(data_stats: dict):
     """
     Test proper longitude and latitude boundaries for properties in and around NYC
     """
-    idx = data['longitude'].between(-74.25, -73.50) & data['latitude'].between(40.5, 41.2)
-
-    assert np.sum(~idx) == 0
+    # Rows outside LON_MIN..LON_MAX / LAT_MIN..LAT_MAX (check_engine) are counted in the pass
+    assert data_stats["out_of_bounds"] == 0
 
 
-def test_similar_neigh_distrib(data: pd.DataFrame, ref_data: pd.DataFrame, kl_threshold: float) -> None:
+def test_similar_neigh_distrib(data_stats: dict, ref_sketch: dict, kl_threshold: float) -> None:
     """
     Apply a threshold on the KL divergence to detect if the distribution of the new data is
     significantly different than that of the reference dataset
     
     Args:
-        data: Current dataset to test
-        ref_data: Reference dataset to compare against
+        data_stats: Precomputed statistics of the current dataset
+        ref_sketch: Distribution sketch of the reference dataset
         kl_threshold: Maximum allowed KL divergence threshold
         
     Raises:
         AssertionError: If KL divergence exceeds the threshold
     """
-    # Use newer pandas value_counts with normalize=True for probability distribution
-    dist1 = data['neighbourhood_group'].value_counts(normalize=True).sort_index()
-    dist2 = ref_data['neighbourhood_group'].value_counts(normalize=True).sort_index()
+    dist1 = categorical_distribution(data_stats["sketch"], "neighbourhood_group")
+    dist2 = categorical_distribution(ref_sketch, "neighbourhood_group")
     
     # Ensure distributions sum to 1 and have matching indices
     assert np.isclose(dist1.sum(), 1.0)
@@ -80,21 +91,41 @@ def test_similar_neigh_distrib(data: pd.DataFrame, ref_data: pd.DataFrame, kl_th
     assert dist1.index.equals(dist2.index)
 
     # Calculate KL divergence with improved numerical stability
-    kl_div = scipy.stats.entropy(dist1, dist2, base=2)
+    kl_div = _kl_divergence(dist1, dist2)
     assert np.isfinite(kl_div) and kl_div < kl_threshold
 
 
+@pytest.mark.parametrize("column", list(HISTOGRAM_EDGES))
+def test_similar_numeric_distrib(data_stats: dict, ref_sketch: dict, numeric_kl_threshold: float,
+                                 column: str) -> None:
+    """
+    Apply the numeric KL threshold to the fixed-bin histograms of the numeric columns
+    (price, minimum_nights, latitude, longitude)
+
+    Args:
+        data_stats: Precomputed statistics of the current dataset
+        ref_sketch: Distribution sketch of the reference dataset
+        numeric_kl_threshold: Maximum allowed KL divergence between the histograms
+        column: Numeric column to compare
+    """
+    dist1 = histogram_distribution(data_stats["sketch"], column)
+    dist2 = histogram_distribution(ref_sketch, column)
+
+    kl_div = _kl_divergence(dist1, dist2)
+    assert np.isfinite(kl_div) and kl_div < numeric_kl_threshold
+
+
 ########################################################
 # Implement here test_row_count and test_price_range   #
 ########################################################
 
 
-def test_row_count(data):
+def test_row_count(data_stats):
     # Dataset size should be reasonable
-    assert 15000 < data.shape[0] < 1_000_000
+    assert 15000 < data_stats["n_rows"] < 1_000_000
 
 
-def test_price_range(data, min_price, max_price):
+def test_price_range(data_stats, min_price, max_price):
     # All prices should fall within the configured bounds
-    assert data["price"].between(10,350).all()
-
+    assert data_stats["price_missing"] == 0
+    assert min_price <= data_stats["price_min"] and data_stats["price_max"] <= max_price
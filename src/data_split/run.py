@@ -1,15 +1,31 @@
 import argparse
+import contextlib
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 import os
 
-def go(args):
-    # Load cleaned data
-    df = pd.read_csv(os.path.join(os.path.dirname(__file__), "../../clean_sample.csv"))
+from wandb_utils.artifact_store import default_store
+from wandb_utils.hash_split import SPLIT_CODES, assign_splits
+from wandb_utils.instrumentation import StepMetrics
+from wandb_utils.intermediate import (
+    FORMATS, SPLIT_SUFFIX, TableWriter, format_of, iter_table, read_table, write_split_index, write_table,
+)
 
+SPLIT_MODES = ("random", "hash")
+# table: a copy of the rows of every split; index: row positions in the input (see write_split_index)
+OUTPUT_MODES = ("table", "index")
 
 
-    # Split data
+def hash_split(df, args):
+    # Each row goes to train/val/test by a hash of its id (stable across data refreshes;
+    # stratify_by is ignored)
+    codes = assign_splits(df, args.random_seed, args.test_size, args.val_size)
+    return tuple(df[codes == SPLIT_CODES[k]] for k in ("train", "val", "test"))
+
+
+def random_split(df, args):
+    from sklearn.model_selection import train_test_split  # slow to import: only for this mode
+
     train_df, temp_df = train_test_split(
         df,
         test_size=args.test_size + args.val_size,
@@ -23,22 +39,148 @@ def go(args):
         random_state=args.random_seed,
         stratify=temp_df[args.stratify_by] if args.stratify_by in df.columns else None,
     )
+    return train_df, val_df, test_df
+
+
+def write_split_indexes(positions, input_path, source_rows, source_artifact):
+    for k in ("train", "val", "test"):
+        write_split_index(
+            positions[k], f"outputs/{k}{SPLIT_SUFFIX}", input_path, source_rows, source_artifact=source_artifact
+        )
+
+
+def stream_hash_split(input_path, ext, args, chunksize, metrics, output_mode="table", source_artifact=None):
+    # One pass over the input: every chunk is split and appended to the three outputs,
+    # which are identical to those of an in-memory hash split
+    read, split, write = metrics.stage("read"), metrics.stage("split"), metrics.stage("write")
+    chunks = iter_table(input_path, chunksize)
+    rows = {k: 0 for k in SPLIT_CODES}
+    positions = {k: [] for k in SPLIT_CODES}
+    offset = 0
+    with contextlib.ExitStack() as stack:
+        writers = {}
+        if output_mode == "table":
+            writers = {k: stack.enter_context(TableWriter(f"outputs/{k}{ext}")) for k in SPLIT_CODES}
+        while True:
+            with read:
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            read.add_rows(rows_out=len(chunk))
+            with split:
+                codes = assign_splits(chunk, args.random_seed, args.test_size, args.val_size)
+            split.add_rows(rows_in=len(chunk), rows_out=len(chunk))
+            with write:
+                for k, code in SPLIT_CODES.items():
+                    in_split = codes == code
+                    if output_mode == "table":
+                        writers[k].write(chunk[in_split])
+                    else:
+                        positions[k].append(offset + np.flatnonzero(in_split))
+                    rows[k] += int(in_split.sum())
+            write.add_rows(rows_in=len(chunk))
+            offset += len(chunk)
+        with write:
+            for writer in writers.values():
+                writer.close()
+            if output_mode == "index":
+                write_split_indexes(
+                    {k: np.concatenate(p) if p else np.empty(0, dtype=np.int64) for k, p in positions.items()},
+                    input_path, offset, source_artifact,
+                )
+    return rows
+
+
+def go(args, df=None):
+    # Splits are written in the same intermediate format as the input (.parquet or .csv)
+    input_name = args.input_artifact.split(":")[0]
+    ext = FORMATS[format_of(input_name)]
+    # The cleaned data from the artifact store (or, outside of the pipeline, the file of
+    # that name in the project root). Split indexes refer to the exact version used.
+    store = default_store()
+    record = store.lookup(args.input_artifact)
+    if record is not None:
+        input_path = store.find(args.input_artifact)
+        source_artifact = f"{input_name}:{record['version']}"
+    else:
+        input_path = os.path.join(os.path.dirname(__file__), "../..", input_name)
+        source_artifact = args.input_artifact
+
+    split_mode = getattr(args, "split_mode", "random")
+    if split_mode not in SPLIT_MODES:
+        raise ValueError(f"split_mode must be one of {SPLIT_MODES}, got {split_mode!r}")
+    chunksize = getattr(args, "chunksize", 0)
+    output_mode = getattr(args, "output_mode", "table")
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"output_mode must be one of {OUTPUT_MODES}, got {output_mode!r}")
 
-    # Save splits
-    os.makedirs("outputs", exist_ok=True)
-    train_df.to_csv("outputs/train.csv", index=False)
-    val_df.to_csv("outputs/val.csv", index=False)
-    test_df.to_csv("outputs/test.csv", index=False)
+    with StepMetrics("data_split") as metrics:
+        os.makedirs("outputs", exist_ok=True)
+
+        if split_mode == "hash" and df is None and chunksize:
+            # Streaming: peak memory is bounded by the chunk size instead of the input size
+            rows = stream_hash_split(input_path, ext, args, chunksize, metrics, output_mode, source_artifact)
+            metrics.rows_in = metrics.rows_out = sum(rows.values())
+            print(f"Split rows {rows} (hash of id, chunks of {chunksize} rows)")
+            print("✅ Data successfully split and saved in outputs/")
+            return None
+
+        # Load cleaned data (unless it was handed over in memory by main.py)
+        if df is None:
+            with metrics.stage("read") as stage:
+                df = read_table(input_path)
+                stage.rows_out = len(df)
+        metrics.rows_in = len(df)
+        if output_mode == "index":
+            # The index of every split is then the position of its rows in the input
+            df = df.reset_index(drop=True)
+
+        # Split data
+        with metrics.stage("split", rows_in=len(df)) as stage:
+            if split_mode == "hash":
+                train_df, val_df, test_df = hash_split(df, args)
+            else:
+                train_df, val_df, test_df = random_split(df, args)
+            stage.rows_out = len(train_df) + len(val_df) + len(test_df)
+
+        # Save splits
+        with metrics.stage("write", rows_in=len(train_df) + len(val_df) + len(test_df)):
+            if output_mode == "index":
+                positions = {"train": train_df.index, "val": val_df.index, "test": test_df.index}
+                write_split_indexes(positions, input_path, len(df), source_artifact)
+            else:
+                write_table(train_df, f"outputs/train{ext}")
+                write_table(val_df, f"outputs/val{ext}")
+                write_table(test_df, f"outputs/test{ext}")
+        metrics.rows_out = len(train_df) + len(val_df) + len(test_df)
 
     print("✅ Data successfully split and saved in outputs/")
 
+    return train_df, val_df, test_df
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_artifact", type=str, required=True)
     parser.add_argument("--test_size", type=float, default=0.2)
     parser.add_argument("--val_size", type=float, default=0.2)
-    parser.add_argument("--stratify_by", type=str, default="neighbourhood_group")
+    parser.add_argument(
+        "--stratify_by", type=str, default="neighbourhood_group", help="Random mode: column to stratify by"
+    )
     parser.add_argument("--random_seed", type=int, default=42)
+    parser.add_argument(
+        "--split_mode", type=str, default="random", choices=SPLIT_MODES,
+        help="random: stratified train_test_split of the loaded frame; "
+        "hash: assign rows by a seeded hash of id (stable across data refreshes; not stratified, "
+        "stratify_by is ignored)",
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=0, help="Hash mode: stream the input in chunks of this many rows (0 = load it all)"
+    )
+    parser.add_argument(
+        "--output_mode", type=str, default="table", choices=OUTPUT_MODES,
+        help="table: write a copy of every split; index: write the row positions of every split in the input "
+        "(outputs/<split>.idx.npy) plus a reference to the input (outputs/<split>.split.json)",
+    )
     args = parser.parse_args()
 
     go(args)
@@ -1,11 +1,230 @@
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
 
 
-def delta_date_feature(dates):
+class DeltaDateTransformer(BaseEstimator, TransformerMixin):
     """
-    Given a 2d array containing dates (in any format recognized by pd.to_datetime), it returns the delta in days
-    between each date and the most recent date in its column
+    Turns date columns into the number of days between each date and a reference date.
+
+    The reference date of each column is the most recent date seen at fit time and is stored
+    in the fitted transformer (reference_dates_), so the feature of a listing does not depend
+    on the other rows it is scored with. Dates can be datetime64 columns or strings in the
+    fixed `date_format`; missing dates are replaced by `fill_value` (an old date, meaning no
+    recent review).
+    """
+
+    def __init__(self, date_format="%Y-%m-%d", fill_value="2010-01-01"):
+        self.date_format = date_format
+        self.fill_value = fill_value
+
+    def _to_days(self, X):
+        frame = X if isinstance(X, pd.DataFrame) else pd.DataFrame(np.asarray(X).reshape(len(X), -1))
+        fill = np.datetime64(self.fill_value, "D")
+        columns = []
+        for _, col in frame.items():
+            if not pd.api.types.is_datetime64_any_dtype(col):
+                col = pd.to_datetime(col, format=self.date_format)
+            days = col.to_numpy(dtype="datetime64[D]")
+            columns.append(np.where(np.isnat(days), fill, days))
+        return np.column_stack(columns)
+
+    def fit(self, X, y=None):
+        days = self._to_days(X)
+        self.n_features_in_ = days.shape[1]
+        self.reference_dates_ = days.max(axis=0)
+        return self
+
+    def transform(self, X):
+        days = self._to_days(X)
+        return (self.reference_dates_ - days).astype(np.int64)
+
+
+class HashedTextTransformer(BaseEstimator, TransformerMixin):
+    """
+    Hashed word n-gram counts of a text column, optionally IDF-weighted, as a sparse matrix.
+
+    There is no vocabulary: the column of an n-gram is a hash of it (HashingVectorizer), so
+    fitting only learns the IDF weights (n_features floats, when use_idf is set) and the
+    fitted transformer stays small whatever the number of distinct words. Rows are hashed
+    independently, in chunks of chunk_size rows, in parallel when n_jobs != 1; the output
+    stays a CSR matrix throughout. Missing texts are treated as empty.
+    """
+
+    def __init__(self, n_features=1024, ngram_range=(1, 1), use_idf=True, stop_words="english",
+                 chunk_size=100_000, n_jobs=1):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.use_idf = use_idf
+        self.stop_words = stop_words
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def _hasher(self):
+        return HashingVectorizer(
+            n_features=self.n_features,
+            ngram_range=tuple(self.ngram_range),
+            stop_words=self.stop_words,
+            alternate_sign=False,
+            # with IDF weights, rows are normalized after weighting
+            norm=None if self.use_idf else "l2",
+        )
+
+    def _hash(self, X):
+        column = X.iloc[:, 0] if isinstance(X, pd.DataFrame) else pd.Series(np.asarray(X).reshape(len(X), -1)[:, 0])
+        texts = column.fillna("").astype(str).to_numpy()
+        hasher = self._hasher()
+        chunks = [texts[i: i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)] or [texts]
+        if self.n_jobs == 1 or len(chunks) == 1:
+            parts = [hasher.transform(chunk) for chunk in chunks]
+        else:
+            parts = Parallel(n_jobs=self.n_jobs)(delayed(hasher.transform)(chunk) for chunk in chunks)
+        return sp.vstack(parts, format="csr")
+
+    def fit(self, X, y=None):
+        self.fit_transform(X, y)
+        return self
+
+    def fit_transform(self, X, y=None):
+        # hashes the rows once (TransformerMixin.fit_transform would hash them twice)
+        counts = self._hash(X)
+        self.n_features_in_ = 1
+        if not self.use_idf:
+            return counts
+        self.tfidf_ = TfidfTransformer()
+        return self.tfidf_.fit_transform(counts)
+
+    def transform(self, X):
+        counts = self._hash(X)
+        return self.tfidf_.transform(counts) if self.use_idf else counts
+
+
+class SpatialNeighbourhoodTransformer(BaseEstimator, TransformerMixin):
     """
-    date_sanitized = pd.DataFrame(dates).apply(pd.to_datetime)
-    return date_sanitized.apply(lambda d: (d.max() -d).dt.days, axis=0).to_numpy()
+    Features of the neighbourhood of a listing, from the training listings around it.
+
+    Takes the latitude and longitude columns (degrees), projected to kilometres around the
+    mean training latitude, and returns, for every radius r of radii_km, the number of
+    training listings in the square of side ~2r centred on the listing, then the median price
+    of its n_neighbors nearest training listings and the distance (km) to the farthest of them.
+    Counts come from a summed-area table over a grid of grid_km cells (four lookups per
+    listing and radius, whatever the density); neighbours from a KD-tree queried in batches
+    of chunk_size rows (n_jobs threads). No pairwise distances are computed.
+
+    fit_transform leaves every training listing out of its own neighbourhood, so its price
+    does not leak into its features. Missing coordinates are replaced by the training
+    median. The fitted transformer only keeps the coordinates and prices of the training
+    listings (float32): the grid and the KD-tree are rebuilt from them after unpickling.
+    """
+
+    # Largest grid (cells per side); the cells grow beyond it for very spread-out data
+    MAX_GRID_CELLS = 4096
+
+    def __init__(self, radii_km=(0.5, 1.0), n_neighbors=10, grid_km=0.05, chunk_size=100_000, n_jobs=1):
+        self.radii_km = radii_km
+        self.n_neighbors = n_neighbors
+        self.grid_km = grid_km
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def _to_km(self, X):
+        coords = np.asarray(X, dtype=np.float64).reshape(len(X), 2)
+        missing = np.isnan(coords)
+        if missing.any():
+            coords = np.where(missing, self.fill_coords_, coords)
+        return np.column_stack([
+            (coords[:, 0] - self.origin_[0]) * self.km_per_degree_[0],
+            (coords[:, 1] - self.origin_[1]) * self.km_per_degree_[1],
+        ])
+
+    def _kdtree(self):
+        if getattr(self, "_tree", None) is None:
+            from scipy.spatial import cKDTree
+
+            self._tree = cKDTree(self.points_)
+        return self._tree
+
+    def _grid(self):
+        # summed-area table: grid[i, j] = training listings in the cells [0, i) x [0, j)
+        if getattr(self, "_sat", None) is None:
+            shape = np.asarray(self.grid_shape_)
+            cells = np.minimum((self.points_ / self.cell_km_).astype(np.int64), shape - 1)
+            counts = np.bincount(cells[:, 0] * shape[1] + cells[:, 1], minlength=shape[0] * shape[1])
+            self._sat = np.zeros(shape + 1, dtype=np.int32)
+            self._sat[1:, 1:] = counts.reshape(shape).cumsum(axis=0).cumsum(axis=1)
+        return self._sat
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_tree", None)
+        state.pop("_sat", None)
+        return state
+
+    def fit(self, X, y=None):
+        self.fit_transform(X, y)
+        return self
+
+    def fit_transform(self, X, y=None):
+        if y is None:
+            raise ValueError("SpatialNeighbourhoodTransformer needs the prices (y) at fit time")
+        coords = np.asarray(X, dtype=np.float64).reshape(len(X), 2)
+        if len(coords) <= self.n_neighbors:
+            raise ValueError(f"At least {self.n_neighbors + 1} training listings are needed, got {len(coords)}")
+        self.n_features_in_ = 2
+        self.fill_coords_ = np.nanmedian(coords, axis=0)
+        self.origin_ = np.nanmin(coords, axis=0)
+        # equirectangular projection: fine over a city
+        self.km_per_degree_ = np.array([110.574, 111.320 * np.cos(np.radians(self.fill_coords_[0]))])
+        self._tree, self._sat = None, None
+        self.points_ = self._to_km(coords).astype(np.float32)
+        self.prices_ = np.asarray(y, dtype=np.float32)
+
+        extent = self.points_.max(axis=0).astype(np.float64)
+        self.cell_km_ = max(self.grid_km, float(extent.max()) / self.MAX_GRID_CELLS)
+        self.grid_shape_ = tuple(int(c) for c in np.floor(extent / self.cell_km_) + 1)
+        return self._features(self.points_, leave_out=True)
+
+    def transform(self, X):
+        return self._features(self._to_km(X), leave_out=False)
+
+    def _features(self, points, leave_out):
+        out = np.empty((len(points), len(self.radii_km) + 2))
+        for start in range(0, len(points), self.chunk_size):
+            end = min(start + self.chunk_size, len(points))
+            out[start:end] = self._chunk_features(points[start:end], np.arange(start, end) if leave_out else None)
+        return out
+
+    def _chunk_features(self, points, rows):
+        # rows: indices of these points among the training listings (left out), or None
+        columns = []
+        grid = self._grid()
+        cells = np.floor(points / self.cell_km_).astype(np.int64)
+        n_rows, n_cols = self.grid_shape_
+        for radius in self.radii_km:
+            half = int(round(radius / self.cell_km_))
+            i0, i1 = np.clip(cells[:, 0] - half, 0, n_rows), np.clip(cells[:, 0] + half + 1, 0, n_rows)
+            j0, j1 = np.clip(cells[:, 1] - half, 0, n_cols), np.clip(cells[:, 1] + half + 1, 0, n_cols)
+            count = grid[i1, j1] - grid[i0, j1] - grid[i1, j0] + grid[i0, j0]
+            columns.append(count - (1 if rows is not None else 0))
+
+        k = self.n_neighbors
+        workers = -1 if self.n_jobs is None else self.n_jobs
+        if rows is None:
+            distances, neighbours = self._kdtree().query(points, k=k, workers=workers)
+        else:
+            # one more neighbour, then drop the listing itself (or the farthest, when listings
+            # at the same coordinates hid it)
+            distances, neighbours = self._kdtree().query(points, k=k + 1, workers=workers)
+            is_self = neighbours == rows[:, None]
+            is_self[~is_self.any(axis=1), -1] = True
+            keep = ~is_self
+            distances = distances[keep].reshape(len(points), k)
+            neighbours = neighbours[keep].reshape(len(points), k)
+        distances = distances.reshape(len(points), k)
+        neighbours = neighbours.reshape(len(points), k)
+        columns.append(np.median(self.prices_[neighbours], axis=1))
+        columns.append(distances[:, -1])
+        return np.column_stack(columns)
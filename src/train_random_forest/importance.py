@@ -0,0 +1,126 @@
+"""
+Permutation importance of the original columns of the model input
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error
+
+
+# The importance of a column is the increase of the validation MAE when its values are
+# shuffled between rows. Columns are those of the table, not of the transformed matrix:
+# the transformed columns produced from one column (the one-hot borough, the TF-IDF or
+# hashed words of the name) are shuffled together, with the same permutation. Shuffles
+# (column x repeat) run in a thread pool on a sample of at most max_rows validation rows;
+# the unshuffled score comes from the predictions of the validation split already made.
+IMPORTANCE_TABLE = "feature_importance.csv"
+IMPORTANCE_PLOT = "feature_importance.png"
+
+
+def column_groups(preprocessor):
+    """
+    Transformed columns of every original column, from a fitted ColumnTransformer
+
+    Columns used by several transformers are one group: with the spatial features, latitude
+    and longitude (imputed as is, and turned into neighbourhood features together) are only
+    shuffled as "latitude+longitude", never on their own, which would leave their signal in
+    the other group and count them twice.
+
+    :return: dict column name (or "+"-joined names) -> np.ndarray of column indices in the
+        transformed matrix
+    """
+    entries = []  # [original columns, transformed column indices]
+    for name, _, columns in preprocessor.transformers_:
+        out = preprocessor.output_indices_[name]
+        indices = np.arange(out.start, out.stop)
+        if len(indices) == 0:
+            continue  # dropped (remainder)
+        if isinstance(columns, str):
+            columns = [columns]
+        if len(columns) == len(indices):  # one output column per input column
+            entries.extend([[column], indices[i: i + 1]] for i, column in enumerate(columns))
+        else:
+            entries.append([list(columns), indices])
+
+    # Merge the entries sharing an original column
+    groups = []
+    for columns, indices in entries:
+        for group in [g for g in groups if set(g[0]) & set(columns)]:
+            groups.remove(group)
+            columns = group[0] + [c for c in columns if c not in group[0]]
+            indices = np.concatenate([group[1], indices])
+        groups.append([columns, indices])
+    return {"+".join(columns): np.sort(indices) for columns, indices in groups}
+
+
+def permutation_importance(model, X, y, groups, baseline_pred, n_repeats=5, max_rows=5000, random_seed=42,
+                           n_jobs=1):
+    """
+    Grouped permutation importance on a sample of the validation rows
+
+    :param model: fitted estimator taking the transformed matrix
+    :param X: transformed validation matrix (dense, sparse or memory-mapped)
+    :param y: validation target
+    :param groups: see column_groups()
+    :param baseline_pred: predictions of the model on all the rows of X
+    :param max_rows: rows sampled from X (bounds the run time)
+    :param n_jobs: shuffles predicted at the same time (-1: all CPUs); the model itself
+        predicts on one thread meanwhile
+    :return: DataFrame with the columns feature, importance (mean MAE increase), std,
+        sorted by importance
+    """
+    rng = np.random.default_rng(random_seed)
+    y = np.asarray(y)
+    rows = np.arange(len(y))
+    if len(rows) > max_rows:
+        rows = np.sort(rng.choice(len(rows), size=max_rows, replace=False))
+    X_sample = X[rows]
+    X_sample = X_sample.toarray() if hasattr(X_sample, "toarray") else np.array(X_sample)
+    y_sample = y[rows]
+    baseline_mae = mean_absolute_error(y_sample, np.asarray(baseline_pred)[rows])
+    # One seed per shuffle, so the result does not depend on the order the threads run in
+    tasks = [(name, seed) for name in groups for seed in rng.integers(np.iinfo(np.int32).max, size=n_repeats)]
+
+    def shuffled_mae(task):
+        name, seed = task
+        X_shuffled = X_sample.copy()
+        columns = groups[name]
+        X_shuffled[:, columns] = X_sample[np.random.default_rng(seed).permutation(len(rows))][:, columns]
+        return mean_absolute_error(y_sample, model.predict(X_shuffled))
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    model_n_jobs = getattr(model, "n_jobs", None)
+    if model_n_jobs is not None:
+        model.n_jobs = 1  # parallel across shuffles instead of within a prediction
+    try:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            scores = list(pool.map(shuffled_mae, tasks))
+    finally:
+        if model_n_jobs is not None:
+            model.n_jobs = model_n_jobs
+
+    increase = np.array(scores).reshape(len(groups), n_repeats) - baseline_mae
+    return pd.DataFrame({
+        "feature": list(groups),
+        "importance": increase.mean(axis=1),
+        "std": increase.std(axis=1),
+    }).sort_values("importance", ascending=False, ignore_index=True)
+
+
+def plot_importance(importances):
+    """
+    Horizontal bar chart of a permutation_importance() table
+
+    :return: matplotlib Figure
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 10))
+    ordered = importances.iloc[::-1]
+    ax.barh(ordered["feature"], ordered["importance"], xerr=ordered["std"], color="r", align="center")
+    ax.set_xlabel("Increase of the validation MAE when shuffled")
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,148 @@
+"""
+Out-of-core training of the random forest, for trainval tables larger than memory
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.tree import DecisionTreeRegressor
+
+from wandb_utils.intermediate import iter_table
+
+
+# The table is streamed twice, chunksize rows at a time, and never loaded whole:
+#   1. a uniform sample of at most sample_rows train rows is kept (reservoir), on which the
+#      preprocessor is fitted
+#   2. every chunk is transformed and written to memory-mapped float32 matrices on disk
+#      (X_train.npy, y_train.npy, X_val.npy, y_val.npy)
+# Every tree is then fitted on its own bootstrap sample of max_samples rows, read from the
+# memory-mapped train matrix, and the trees are assembled into a RandomForestRegressor
+# (exported like any other). Peak memory depends on chunksize, sample_rows and max_samples
+# (times the number of trees fitted in parallel), not on the number of rows.
+TARGET = "price"
+
+
+def validation_mask(n_rows, val_size, random_seed):
+    """
+    Rows of the validation split (drawn uniformly, not stratified)
+
+    :param val_size: fraction of the rows (< 1) or number of rows
+    :return: boolean np.ndarray of n_rows
+    """
+    n_val = int(round(val_size * n_rows)) if val_size < 1 else int(val_size)
+    is_val = np.zeros(n_rows, dtype=bool)
+    is_val[np.random.default_rng(random_seed).choice(n_rows, size=n_val, replace=False)] = True
+    return is_val
+
+
+def _chunks(path, chunksize, is_val):
+    # (chunk indexed by row number in the table, validation mask of its rows) of the table
+    start = 0
+    for chunk in iter_table(path, chunksize):
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        yield chunk, is_val[start: start + len(chunk)]
+        start += len(chunk)
+    if start != len(is_val):
+        raise ValueError(f"{path} has {start} rows, expected {len(is_val)}: it changed while training")
+
+
+def sample_train_rows(path, chunksize, is_val, sample_rows, random_seed):
+    """
+    Uniform sample (without replacement) of at most sample_rows train rows, in one pass
+
+    :return: (features DataFrame, target Series), in the order of the table
+    """
+    rng = np.random.default_rng(random_seed)
+    sample = None
+    for chunk, chunk_is_val in _chunks(path, chunksize, is_val):
+        chunk = chunk[~chunk_is_val]
+        chunk = chunk.assign(_key=rng.random(len(chunk)))
+        sample = chunk if sample is None else pd.concat([sample, chunk])
+        sample = sample.nsmallest(sample_rows, "_key")
+    sample = sample.sort_index(kind="stable").drop(columns="_key").reset_index(drop=True)
+    return sample, sample.pop(TARGET)
+
+
+def write_features(preprocessor, path, chunksize, is_val, directory):
+    """
+    Transform the table chunk by chunk with the fitted preprocessor, into memory-mapped
+    .npy matrices of the train and validation rows (float32; sparse output is densified a
+    chunk at a time)
+
+    :param directory: where the matrices are written
+    :return: (X_train, y_train, X_val, y_val), opened read-only
+    """
+    n_val = int(is_val.sum())
+    sizes = {"train": len(is_val) - n_val, "val": n_val}
+    files, offsets = {}, {"train": 0, "val": 0}
+    for chunk, chunk_is_val in _chunks(path, chunksize, is_val):
+        y = chunk.pop(TARGET).to_numpy(dtype=np.float32)
+        Xt = preprocessor.transform(chunk)
+        Xt = Xt.toarray() if hasattr(Xt, "toarray") else np.asarray(Xt)
+        if not files:
+            for split, size in sizes.items():
+                files[f"X_{split}"] = np.lib.format.open_memmap(
+                    os.path.join(directory, f"X_{split}.npy"), mode="w+", dtype=np.float32, shape=(size, Xt.shape[1])
+                )
+                files[f"y_{split}"] = np.lib.format.open_memmap(
+                    os.path.join(directory, f"y_{split}.npy"), mode="w+", dtype=np.float32, shape=(size,)
+                )
+        for split, rows in (("train", ~chunk_is_val), ("val", chunk_is_val)):
+            n = int(rows.sum())
+            files[f"X_{split}"][offsets[split]: offsets[split] + n] = Xt[rows]
+            files[f"y_{split}"][offsets[split]: offsets[split] + n] = y[rows]
+            offsets[split] += n
+    for array in files.values():
+        array.flush()
+    del files
+    return tuple(
+        np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ("X_train", "y_train", "X_val", "y_val")
+    )
+
+
+def fit_forest(forest, X, y, max_samples, random_seed, n_jobs=1):
+    """
+    Fit the trees of an (unfitted) RandomForestRegressor one bootstrap sample at a time:
+    each tree reads max_samples rows drawn with replacement from X (sorted, so the
+    memory-mapped file is read in order), instead of weighting all the rows of X
+
+    :param forest: RandomForestRegressor, whose tree parameters and n_estimators are used
+    :param X: train matrix (e.g. memory-mapped), float32
+    :param max_samples: rows per tree
+    :param n_jobs: trees fitted at the same time (threads; each holds its sample)
+    :return: forest, fitted
+    """
+    if not forest.bootstrap:
+        raise ValueError("Out-of-core training samples rows with replacement: it requires bootstrap=True")
+    n_rows = len(X)
+    max_samples = min(max_samples, n_rows)
+    tree_params = {name: getattr(forest, name) for name in forest.estimator_params if name != "random_state"}
+    # One seed per tree for its sample and its splits, as the forest draws them
+    seeds = np.random.RandomState(random_seed).randint(np.iinfo(np.int32).max, size=forest.n_estimators)
+
+    def fit_tree(seed):
+        rows = np.sort(np.random.default_rng(seed).integers(0, n_rows, size=max_samples))
+        return DecisionTreeRegressor(**tree_params, random_state=seed).fit(np.asarray(X[rows]), np.asarray(y[rows]))
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        trees = list(pool.map(fit_tree, seeds))
+
+    forest.estimator_ = DecisionTreeRegressor(**tree_params)
+    forest.estimators_ = trees
+    forest.n_features_in_ = X.shape[1]
+    forest.n_outputs_ = 1
+    return forest
+
+
+def predict_chunked(model, X, chunksize):
+    """
+    Predictions of a (memory-mapped or sparse) matrix, chunksize rows at a time
+    """
+    chunks = (X[i: i + chunksize] for i in range(0, X.shape[0], chunksize))
+    return np.concatenate(
+        [model.predict(chunk if hasattr(chunk, "toarray") else np.asarray(chunk)) for chunk in chunks]
+        or [np.empty(0)]
+    )
@@ -3,35 +3,39 @@
 This script trains a Random Forest
 """
 import argparse
+import contextlib
 import logging
 import os
 import shutil
-import matplotlib.pyplot as plt
+import tempfile
+import time
 
-import mlflow
 import json
 
 import pandas as pd
 import numpy as np
+import sklearn
 from sklearn.compose import ColumnTransformer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.impute import SimpleImputer
-from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import OrdinalEncoder, FunctionTransformer, OneHotEncoder
 
-# import wandb
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_absolute_error
+import wandb
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.pipeline import Pipeline, make_pipeline
 
+from wandb_utils.compact_forest import COMPACT_DIR, save_compact
+from wandb_utils.feature_cache import FeatureCache
+from wandb_utils.instrumentation import StepMetrics
+from wandb_utils.intermediate import (
+    CATEGORIES, count_rows, fetch_table, is_split_reference, load_split_reference, read_table,
+)
+from wandb_utils.log_artifact import log_artifact
 
-def delta_date_feature(dates):
-    """
-    Given a 2d array containing dates (in any format recognized by pd.to_datetime), it returns the delta in days
-    between each date and the most recent date in its column
-    """
-    date_sanitized = pd.DataFrame(dates).apply(pd.to_datetime)
-    return date_sanitized.apply(lambda d: (d.max() -d).dt.days, axis=0).to_numpy()
+from feature_engineering import DeltaDateTransformer, HashedTextTransformer, SpatialNeighbourhoodTransformer
+from importance import IMPORTANCE_PLOT, IMPORTANCE_TABLE, column_groups, permutation_importance, plot_importance
+from out_of_core import fit_forest, predict_chunked, sample_train_rows, validation_mask, write_features
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
@@ -40,113 +44,324 @@ logger = logging.getLogger()
 
 def go(args):
 
-    # run = wandb.init(job_type="train_random_forest")
+    run = wandb.init(job_type="train_random_forest")
     run.config.update(args)
 
-    # Get the Random Forest configuration and update W&B
+    # Get the configuration of the model (the parameters of the estimator of args.engine) and update W&B
     with open(args.rf_config) as fp:
         rf_config = json.load(fp)
     run.config.update(rf_config)
 
-    # Fix the random seed for the Random Forest, so we get reproducible results
+    # Fix the random seed of the model, so we get reproducible results
     rf_config['random_state'] = args.random_seed
 
-    # Use run.use_artifact(...).file() to get the train and validation artifact
-    # and save the returned path in train_local_pat
-    trainval_local_path = run.use_artifact(args.trainval_artifact).file()
-   
-    X = pd.read_csv(trainval_local_path)
-    y = X.pop("price")  # this removes the column "price" from X and puts it into y
-
-    logger.info(f"Minimum price: {y.min()}, Maximum price: {y.max()}")
-
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=args.val_size, stratify=X[args.stratify_by], random_state=args.random_seed
-    )
-
-    logger.info("Preparing sklearn pipeline")
-
-    sk_pipe, processed_features = get_inference_pipeline(rf_config, args.max_tfidf_features)
-
-    # Then fit it to the X_train, y_train data
-    logger.info("Fitting")
-
-    ######################################
-    # Fit the pipeline sk_pipe by calling the .fit method on X_train and y_train
-    # YOUR CODE HERE
-    ######################################
-
-    # Compute r2 and MAE
-    logger.info("Scoring")
-    r_squared = sk_pipe.score(X_val, y_val)
-
-    y_pred = sk_pipe.predict(X_val)
-    mae = mean_absolute_error(y_val, y_pred)
-
-    logger.info(f"Score: {r_squared}")
-    logger.info(f"MAE: {mae}")
-
-    logger.info("Exporting model")
-
-    # Save model package in the MLFlow sklearn format
-    if os.path.exists("random_forest_dir"):
-        shutil.rmtree("random_forest_dir")
-
-    ######################################
-    # Save the sk_pipe pipeline as a mlflow.sklearn model in the directory "random_forest_dir"
-    # HINT: use mlflow.sklearn.save_model
-    mlflow.sklearn.save_model(
-        # YOUR CODE HERE
-        input_example = X_train.iloc[:5]
-    )
-    ######################################
-
+    preprocessing = {
+        "max_tfidf_features": args.max_tfidf_features,
+        "text_features": args.text_features,
+        "hashing_features": args.hashing_features,
+        "hashing_idf": args.hashing_idf == "true",
+        "spatial_features": args.spatial_features == "true",
+    }
+
+    with StepMetrics("train_random_forest") as metrics, contextlib.ExitStack() as stack:
+        # Get the train and validation artifact (a table, or a split reference to the
+        # cleaned data: only the rows of the split are then loaded)
+        trainval_local_path = fetch_table(run, args.trainval_artifact)
+
+        if args.out_of_core == "true":
+            # The table is streamed, the features are memory-mapped from the step directory
+            # (not /tmp, which may be in memory) and removed at the end
+            features_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="features_", dir="."))
+            sk_pipe, X_example, Xt_val, y_val = train_out_of_core(
+                args, rf_config, preprocessing, trainval_local_path, features_dir, metrics
+            )
+            model = sk_pipe.steps[-1][1]
+            oob_curve = []
+        else:
+            with metrics.stage("read") as stage:
+                X = read_table(trainval_local_path)
+                y = X.pop("price")  # this removes the column "price" from X and puts it into y
+                stage.rows_out = len(X)
+            metrics.rows_in = len(X)
+
+            logger.info(f"Minimum price: {y.min()}, Maximum price: {y.max()}")
+
+            from sklearn.model_selection import train_test_split  # slow to import: only for this mode
+
+            X_train, X_val, y_train, y_val = train_test_split(
+                X, y, test_size=args.val_size, stratify=X[args.stratify_by], random_state=args.random_seed
+            )
+            X_example = X_train.iloc[:5]
+
+            logger.info("Preparing sklearn pipeline")
+
+            sk_pipe, _ = get_inference_pipeline(rf_config, **preprocessing, engine=args.engine)
+            model = sk_pipe.steps[-1][1]
+
+            # The transformed matrices only depend on the data, the split and the preprocessing:
+            # when only the forest changes they come from the feature cache
+            cache, cache_key = None, None
+            if args.feature_cache_dir:
+                cache = FeatureCache(args.feature_cache_dir, max_bytes=args.feature_cache_max_mb * 2**20)
+                split = {"val_size": args.val_size, "random_seed": args.random_seed, "stratify_by": args.stratify_by}
+                params = {**preprocessing, **split}
+                if args.engine != "random_forest":  # the preprocessor output is then always dense
+                    params["engine"] = args.engine
+                cache_key = feature_cache_key(cache, trainval_local_path, params)
+            with metrics.stage("preprocess", rows_in=len(X_train)):
+                Xt_train, Xt_val = fit_preprocessor(sk_pipe, X_train, y_train, X_val, cache, cache_key)
+
+            # Then fit it to the X_train, y_train data
+            logger.info("Fitting")
+
+            ######################################
+            # Fit the model of sk_pipe on the transformed train split
+            with metrics.stage("fit", rows_in=len(X_train)):
+                if args.growth_step > 0 and args.engine == "random_forest":
+                    # Grow the forest growth_step trees at a time until the OOB error plateaus
+                    oob_curve = grow_forest(
+                        model, Xt_train, y_train, args.growth_step, args.oob_tol, args.fit_time_budget_s,
+                    )
+                else:
+                    model.fit(Xt_train, y_train)
+                    oob_curve = []
+            ######################################
+
+        # Trees of the forest, or boosting iterations (fewer than max_iter with early stopping)
+        n_trees = len(model.estimators_) if args.engine == "random_forest" else model.n_iter_
+        if oob_curve:
+            logger.info(f"Grown to {n_trees} of at most {rf_config.get('n_estimators', 100)} trees")
+            for point in oob_curve:
+                run.log(point)
+            run.summary["oob_r2"] = oob_curve[-1]["oob_r2"]
+        run.summary["n_estimators"] = n_trees
+
+        # Compute r2 and MAE
+        logger.info("Scoring")
+        with metrics.stage("predict", rows_in=len(y_val)) as stage:
+            y_pred = predict_chunked(model, Xt_val, args.chunksize)
+            r_squared = r2_score(y_val, y_pred)
+            mae = mean_absolute_error(y_val, y_pred)
+            stage.rows_out = len(y_pred)
+
+        logger.info(f"Score: {r_squared}")
+        logger.info(f"MAE: {mae}")
+
+        logger.info("Exporting model")
+
+        # Save model package in the MLFlow sklearn format
+        if os.path.exists("random_forest_dir"):
+            shutil.rmtree("random_forest_dir")
+
+        ######################################
+        # Save the sk_pipe pipeline as a mlflow.sklearn model in the directory "random_forest_dir"
+        # HINT: use mlflow.sklearn.save_model
+        # feature_engineering.py ships with the model so its fitted transformers can be unpickled
+        with metrics.stage("export"):
+            if args.export_format in ("mlflow", "both"):
+                import mlflow.sklearn  # slow to import: only when exporting in this format
+
+                mlflow.sklearn.save_model(
+                    sk_pipe,
+                    "random_forest_dir",
+                    code_paths=["feature_engineering.py"],
+                    input_example = X_example
+                )
+            # Flat tree arrays + pickled preprocessor in random_forest_dir/compact, loaded
+            # much faster than the pickled pipeline (see wandb_utils.compact_forest)
+            if args.export_format in ("compact", "both"):
+                save_compact(
+                    sk_pipe, os.path.join("random_forest_dir", COMPACT_DIR), code_paths=["feature_engineering.py"]
+                )
+        ######################################
+
+
+        # Permutation importance of the columns of the table, on a sample of the validation split,
+        # saved with the model
+        logger.info("Computing the feature importance")
+        with metrics.stage("feature_importance", rows_in=min(len(y_val), args.importance_max_rows)):
+            importances = permutation_importance(
+                model, Xt_val, y_val, column_groups(sk_pipe["preprocessor"]), y_pred,
+                n_repeats=args.importance_repeats, max_rows=args.importance_max_rows,
+                random_seed=args.random_seed, n_jobs=args.importance_n_jobs,
+            )
+            importances.to_csv(os.path.join("random_forest_dir", IMPORTANCE_TABLE), index=False)
+            fig_feat_imp = plot_importance(importances)
+            fig_feat_imp.savefig(os.path.join("random_forest_dir", IMPORTANCE_PLOT))
+
+        # Upload the model we just exported to W&B (and to the local artifact store)
+        log_artifact(
+            args.output_artifact,
+            'model_export',
+            'Trained ranfom forest artifact',
+            'random_forest_dir',
+            run,
+            metadata={**rf_config, "engine": args.engine, "n_estimators": n_trees},
+        )
+
+        ######################################
+        # Here we save variable r_squared under the "r2" key
+        run.summary['r2'] = r_squared
+        # Now save the variable mae under the key "mae".
+        run.summary['mae'] = mae
+        ######################################
+
+        # Upload to W&B the feture importance visualization
+        run.log(
+            {
+              "feature_importance": wandb.Image(fig_feat_imp),
+              "feature_importance_table": wandb.Table(dataframe=importances),
+            }
+        )
+        metrics.rows_out = len(y_pred)
+
+
+def train_out_of_core(args, rf_config, preprocessing, table_path, features_dir, metrics):
+    """
+    Fit the pipeline without loading the table (see out_of_core.py): the preprocessor on a
+    sample of the train rows, the forest on bootstrap samples of the memory-mapped features
 
-    # Upload the model we just exported to W&B
-    artifact = wandb.Artifact(
-        args.output_artifact,
-        type = 'model_export',
-        description = 'Trained ranfom forest artifact',
-        metadata = rf_config
+    :return: (fitted sk_pipe, 5 rows of input example, validation matrix, validation target)
+    """
+    with metrics.stage("read") as stage:
+        n_rows = count_rows(table_path)
+        is_val = validation_mask(n_rows, args.val_size, args.random_seed)
+        X_sample, y_sample = sample_train_rows(
+            table_path, args.chunksize, is_val, args.max_samples_per_tree, args.random_seed
+        )
+        stage.rows_out = len(X_sample)
+    metrics.rows_in = n_rows
+    logger.info(f"{n_rows} rows, {int(is_val.sum())} for validation; preprocessor fitted on {len(X_sample)}")
+
+    sk_pipe, _ = get_inference_pipeline(rf_config, **preprocessing, engine=args.engine)
+    with metrics.stage("preprocess", rows_in=n_rows):
+        sk_pipe["preprocessor"].fit(X_sample, y_sample)
+        X_train, y_train, Xt_val, y_val = write_features(
+            sk_pipe["preprocessor"], table_path, args.chunksize, is_val, features_dir
+        )
+    logger.info(f"Fitting on {min(args.max_samples_per_tree, len(X_train))} of {len(X_train)} rows per tree")
+
+    with metrics.stage("fit", rows_in=len(X_train)):
+        fit_forest(sk_pipe["random_forest"], X_train, y_train, args.max_samples_per_tree, args.random_seed,
+                   n_jobs=rf_config.get("n_jobs"))
+    return sk_pipe, X_sample.iloc[:5], Xt_val, y_val
+
+
+def table_files(path):
+    # The files a table is read from: a split reference reads its index and source table
+    if is_split_reference(path):
+        reference = load_split_reference(path)
+        return [reference["index"], reference["source"]]
+    return [path]
+
+
+def feature_cache_key(cache, table_path, params):
+    """
+    Feature cache key of the matrices computed from a table with the given preprocessing
+    and split parameters (the preprocessing code, the table schema of intermediate.py and
+    the scikit-learn version are included)
+    """
+    import wandb_utils.intermediate
+
+    step_dir = os.path.dirname(os.path.abspath(__file__))
+    return cache.key(
+        table_files(table_path),
+        {**params, "sklearn": sklearn.__version__},
+        code_paths=[
+            os.path.join(step_dir, "run.py"),
+            os.path.join(step_dir, "feature_engineering.py"),
+            # read_table types and categories (CATEGORIES, CSV_DTYPES) the preprocessor sees
+            wandb_utils.intermediate.__file__,
+        ],
     )
-    artifact.add_dir('random_forest_dir')
-    run.log_artifact(artifact)
 
-    # Plot feature importance
-    fig_feat_imp = plot_feature_importance(sk_pipe, processed_features)
-
-    ######################################
-    # Here we save variable r_squared under the "r2" key
-    run.summary['r2'] = r_squared
-    # Now save the variable mae under the key "mae".
-    # YOUR CODE HERE
-    ######################################
-
-    # Upload to W&B the feture importance visualization
-    run.log(
-        {
-          "feature_importance": wandb.Image(fig_feat_imp),
-        }
-    )
 
+def fit_preprocessor(sk_pipe, X_train, y_train, X_val, cache=None, cache_key=None):
+    """
+    Fit the preprocessor of sk_pipe on the train split and transform both splits, or take
+    the fitted preprocessor and the (memory-mapped) matrices from the feature cache
 
-def plot_feature_importance(pipe, feat_names):
-    # We collect the feature importance for all non-nlp features first
-    feat_imp = pipe["random_forest"].feature_importances_[: len(feat_names)-1]
-    # For the NLP feature we sum across all the TF-IDF dimensions into a global
-    # NLP importance
-    nlp_importance = sum(pipe["random_forest"].feature_importances_[len(feat_names) - 1:])
-    feat_imp = np.append(feat_imp, nlp_importance)
-    fig_feat_imp, sub_feat_imp = plt.subplots(figsize=(10, 10))
-    # idx = np.argsort(feat_imp)[::-1]
-    sub_feat_imp.bar(range(feat_imp.shape[0]), feat_imp, color="r", align="center")
-    _ = sub_feat_imp.set_xticks(range(feat_imp.shape[0]))
-    _ = sub_feat_imp.set_xticklabels(np.array(feat_names), rotation=90)
-    fig_feat_imp.tight_layout()
-    return fig_feat_imp
+    :return: (transformed train split, transformed validation split)
+    """
+    if cache is not None:
+        entry = cache.load(cache_key)
+        if entry is not None:
+            matrices, preprocessor = entry
+            sk_pipe.steps[0] = ("preprocessor", preprocessor)
+            return matrices["train"], matrices["val"]
+
+    preprocessor = sk_pipe["preprocessor"]
+    Xt_train = preprocessor.fit_transform(X_train, y_train)
+    Xt_val = preprocessor.transform(X_val)
+    if cache is not None:
+        cache.store(cache_key, {"train": Xt_train, "val": Xt_val}, preprocessor)
+    return Xt_train, Xt_val
+
+
+def grow_forest(forest, X, y, growth_step, tol, time_budget_s=0.0):
+    """
+    Fit a random forest growth_step trees at a time (warm start), up to its n_estimators,
+    and stop when the OOB error stops improving or the time budget is spent
 
+    The OOB mean squared error is computed after every increment. Growth stops when it
+    decreased by less than tol (relative) over the last increment, or when the next
+    increment would end after time_budget_s seconds (0: no budget). The trees of the last
+    increment are kept.
 
-def get_inference_pipeline(rf_config, max_tfidf_features):
+    :param forest: an unfitted RandomForestRegressor with bootstrap=True
+    :param tol: minimum relative decrease of the OOB error per increment
+    :return: OOB curve, a list of dicts (n_estimators, oob_mse, oob_r2, fit_s) per increment
+    """
+    if not forest.bootstrap:
+        raise ValueError("Growing the forest on its OOB error requires bootstrap=True")
+    max_trees = forest.n_estimators
+    forest.set_params(warm_start=True, oob_score=True)
+
+    curve = []
+    start = time.perf_counter()
+    n_trees = 0
+    while n_trees < max_trees:
+        n_trees = min(n_trees + growth_step, max_trees)
+        forest.set_params(n_estimators=n_trees)
+        forest.fit(X, y)
+        oob_mse = float(np.mean((np.asarray(y) - forest.oob_prediction_) ** 2))
+        elapsed = time.perf_counter() - start
+        curve.append({
+            "n_estimators": n_trees, "oob_mse": oob_mse, "oob_r2": float(forest.oob_score_), "fit_s": elapsed
+        })
+        logger.info(f"{n_trees} trees: OOB MSE {oob_mse:.1f}, OOB r2 {forest.oob_score_:.4f} ({elapsed:.1f}s)")
+
+        if n_trees >= max_trees:
+            break
+        if len(curve) > 1:
+            previous = curve[-2]["oob_mse"]
+            if previous - oob_mse < tol * previous:
+                logger.info(f"OOB error improved by less than {tol:.2%}: stopping at {n_trees} trees")
+                break
+        increment_s = elapsed - (curve[-2]["fit_s"] if len(curve) > 1 else 0.0)
+        if time_budget_s > 0 and elapsed + increment_s > time_budget_s:
+            logger.info(f"Fit time budget of {time_budget_s}s reached: stopping at {n_trees} trees")
+            break
+
+    # The exported model is a plain forest of the trees grown
+    forest.set_params(warm_start=False)
+    return curve
+
+
+# Features of the listing "name": a fitted TF-IDF vocabulary of max_tfidf_features words, or
+# hashed word n-grams (no vocabulary, sparse, see HashedTextTransformer)
+TEXT_FEATURES = ("tfidf", "hashing")
+
+# Model of the pipeline (also the name of its step): a random forest, or histogram-based
+# gradient boosting (features binned into at most 255 bins, dense input only)
+ENGINES = {
+    "random_forest": RandomForestRegressor,
+    "hist_gradient_boosting": HistGradientBoostingRegressor,
+}
+
+
+def get_inference_pipeline(rf_config, max_tfidf_features, text_features="tfidf", hashing_features=1024,
+                           hashing_idf=True, engine="random_forest", spatial_features=False):
     # Let's handle the categorical features first
     # Ordinal categorical are categorical values for which the order is meaningful, for example
     # for room type: 'Entire home/apt' > 'Private room' > 'Shared room'
@@ -155,14 +370,20 @@ def get_inference_pipeline(rf_config, max_tfidf_features):
     # NOTE: we do not need to impute room_type because the type of the room
     # is mandatory on the websites, so missing values are not possible in production
     # (nor during training). That is not true for neighbourhood_group
-    ordinal_categorical_preproc = OrdinalEncoder()
+    # The categories are those of the schema, not the ones seen in the training rows: a rare
+    # category missing from them (e.g. from the sample the out-of-core preprocessor is fitted
+    # on) must still be encoded. Values outside of the schema get -1 / no one-hot column.
+    ordinal_categorical_preproc = OrdinalEncoder(
+        categories=[CATEGORIES["room_type"]], handle_unknown="use_encoded_value", unknown_value=-1
+    )
 
     ######################################
     # Build a pipeline with two steps:
     # 1 - A SimpleImputer(strategy="most_frequent") to impute missing values
     # 2 - A OneHotEncoder() step to encode the variable
     non_ordinal_categorical_preproc = make_pipeline(
-        # YOUR CODE HERE
+        SimpleImputer(strategy="most_frequent"),
+        OneHotEncoder(categories=[CATEGORIES["neighbourhood_group"]], handle_unknown="ignore")
     )
     ######################################
 
@@ -181,26 +402,39 @@ def get_inference_pipeline(rf_config, max_tfidf_features):
 
     # A MINIMAL FEATURE ENGINEERING step:
     # we create a feature that represents the number of days passed since the last review
-    # First we impute the missing review date with an old date (because there hasn't been
-    # a review for a long time), and then we create a new feature from it,
-    date_imputer = make_pipeline(
-        SimpleImputer(strategy='constant', fill_value='2010-01-01'),
-        FunctionTransformer(delta_date_feature, check_inverse=False, validate=False)
-    )
+    # The missing review dates are imputed with an old date (because there hasn't been
+    # a review for a long time), and the reference "most recent" date is learned at fit
+    # time so single listings get the same feature at inference time
+    date_imputer = DeltaDateTransformer(fill_value='2010-01-01')
 
     # Some minimal NLP for the "name" column
-    reshape_to_1d = FunctionTransformer(np.reshape, kw_args={"newshape": -1})
-    name_tfidf = make_pipeline(
-        SimpleImputer(strategy="constant", fill_value=""),
-        reshape_to_1d,
-        TfidfVectorizer(
-            binary=False,
-            max_features=max_tfidf_features,
-            stop_words='english'
-        ),
-    )
+    if text_features == "hashing":
+        name_tfidf = HashedTextTransformer(n_features=hashing_features, use_idf=hashing_idf)
+    elif text_features == "tfidf":
+        # The vectorizer takes a 1d array of texts: ravel the (n, 1) column (a view, no copy)
+        name_tfidf = make_pipeline(
+            SimpleImputer(strategy="constant", fill_value=""),
+            FunctionTransformer(np.ravel),
+            TfidfVectorizer(
+                binary=False,
+                max_features=max_tfidf_features,
+                stop_words='english'
+            ),
+        )
+    else:
+        raise ValueError(f"text_features must be one of {TEXT_FEATURES}, got {text_features!r}")
+
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {tuple(ENGINES)}, got {engine!r}")
+
+    # Density and prices of the neighbourhood of the listing (see SpatialNeighbourhoodTransformer):
+    # listings within 0.5 and 1 km, median price and distance of the 10 nearest listings
+    spatial = []
+    if spatial_features:
+        spatial = [("spatial", SpatialNeighbourhoodTransformer(), ["latitude", "longitude"])]
 
     # Let's put everything together
+    # (gradient boosting does not take sparse matrices: the output is then always dense)
     preprocessor = ColumnTransformer(
         transformers=[
             ("ordinal_cat", ordinal_categorical_preproc, ordinal_categorical),
@@ -208,24 +442,29 @@ def get_inference_pipeline(rf_config, max_tfidf_features):
             ("impute_zero", zero_imputer, zero_imputed),
             ("transform_date", date_imputer, ["last_review"]),
             ("transform_name", name_tfidf, ["name"])
-        ],
+        ] + spatial,
         remainder="drop",  # This drops the columns that we do not transform
+        sparse_threshold=0.3 if engine == "random_forest" else 0.0,
     )
 
     processed_features = ordinal_categorical + non_ordinal_categorical + zero_imputed + ["last_review", "name"]
+    if spatial_features:
+        processed_features.append("latitude+longitude")
 
-    # Create random forest
-    random_forest = RandomForestRegressor(**rf_config)
+    # Create random forest (or the model of the engine)
+    random_forest = ENGINES[engine](**rf_config)
 
     ######################################
     # Create the inference pipeline. The pipeline must have 2 steps: 
     # 1 - a step called "preprocessor" applying the ColumnTransformer instance that we saved in the `preprocessor` variable
     # 2 - a step called "random_forest" with the random forest instance that we just saved in the `random_forest` variable.
+    #     (for the other engines, the step is named after the engine)
     # HINT: Use the explicit Pipeline constructor so you can assign the names to the steps, do not use make_pipeline
 
     sk_pipe = Pipeline(
         steps =[
-        # YOUR CODE HERE
+            ("preprocessor", preprocessor),
+            (engine, random_forest),
         ]
     )
 
@@ -279,6 +518,53 @@ if __name__ == "__main__":
         type=int
     )
 
+    parser.add_argument(
+        "--text_features",
+        type=str,
+        help="Features of the listing name: tfidf (fitted vocabulary of max_tfidf_features words) "
+        "or hashing (hashed word n-grams, no vocabulary, sparse)",
+        choices=TEXT_FEATURES,
+        default="tfidf",
+    )
+
+    parser.add_argument(
+        "--hashing_features",
+        type=int,
+        help="Number of hashed n-gram columns in hashing mode",
+        default=1024,
+    )
+
+    parser.add_argument(
+        "--hashing_idf",
+        type=str,
+        help="Weight the hashed n-grams by their IDF (learned at fit time)",
+        choices=["true", "false"],
+        default="true",
+    )
+
+    parser.add_argument(
+        "--spatial_features",
+        type=str,
+        help="Add features of the neighbourhood of the listing: number of training listings nearby, "
+        "median price of the nearest ones (learned at fit time)",
+        choices=["true", "false"],
+        default="false",
+    )
+
+    parser.add_argument(
+        "--feature_cache_dir",
+        type=str,
+        help="Directory of the cache of transformed feature matrices (empty to disable)",
+        default="feature_cache",
+    )
+
+    parser.add_argument(
+        "--feature_cache_max_mb",
+        type=int,
+        help="Size above which the least recently used cache entries are removed",
+        default=2048,
+    )
+
     parser.add_argument(
         "--output_artifact",
         type=str,
@@ -286,8 +572,96 @@ if __name__ == "__main__":
         required=True,
     )
 
+    parser.add_argument(
+        "--export_format",
+        type=str,
+        help="mlflow: pickled sklearn pipeline (mlflow.sklearn); compact: flat memory-mapped tree "
+        "arrays in random_forest_dir/compact; both",
+        choices=["mlflow", "compact", "both"],
+        default="both",
+    )
+
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="Model of the pipeline: random_forest (RandomForestRegressor) or hist_gradient_boosting "
+        "(HistGradientBoostingRegressor); rf_config holds the parameters of its estimator",
+        choices=list(ENGINES),
+        default="random_forest",
+    )
+
+    parser.add_argument(
+        "--growth_step",
+        type=int,
+        help="Grow the forest this many trees at a time until its OOB error plateaus "
+        "(at most n_estimators trees; 0 fits all of them at once; random_forest engine only)",
+        default=0,
+    )
+
+    parser.add_argument(
+        "--oob_tol",
+        type=float,
+        help="Growth stops when the OOB error decreased by less than this fraction over an increment",
+        default=0.002,
+    )
+
+    parser.add_argument(
+        "--fit_time_budget_s",
+        type=float,
+        help="Growth stops before an increment that would end after this many seconds (0: no budget)",
+        default=0.0,
+    )
+
+    parser.add_argument(
+        "--out_of_core",
+        type=str,
+        choices=["true", "false"],
+        default="false",
+        help="Stream the table instead of loading it, and fit every tree on a bootstrap sample of "
+        "max_samples_per_tree rows of memory-mapped features (random_forest engine, no stratification)",
+    )
+
+    parser.add_argument(
+        "--max_samples_per_tree",
+        type=int,
+        help="Out-of-core mode: rows of every bootstrap sample (and of the preprocessor fit sample)",
+        default=200000,
+    )
+
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        help="Rows read and transformed at a time in out-of-core mode, and predicted at a time",
+        default=100000,
+    )
+
+    parser.add_argument(
+        "--importance_max_rows",
+        type=int,
+        help="Validation rows sampled for the permutation importance",
+        default=5000,
+    )
+
+    parser.add_argument(
+        "--importance_repeats",
+        type=int,
+        help="Shuffles of every column for the permutation importance",
+        default=5,
+    )
+
+    parser.add_argument(
+        "--importance_n_jobs",
+        type=int,
+        help="Shuffles predicted in parallel for the permutation importance (-1 for all CPUs)",
+        default=-1,
+    )
+
     args = parser.parse_args()
 
-    go(args)
+    if args.out_of_core == "true" and args.engine != "random_forest":
+        parser.error("--out_of_core requires --engine random_forest")
+    if args.out_of_core == "true" and args.spatial_features == "true":
+        # the rows the preprocessor is fitted on would be their own neighbours when transformed
+        parser.error("--spatial_features is not supported with --out_of_core")
 
-print(f"MAE: {mae}, R2: {r2}, RMSE: {rmse}")
\ No newline at end of file
+    go(args)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+This script runs a hyperparameter sweep of the Random Forest, fitting the preprocessor
+only once per distinct preprocessing configuration
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import wandb
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from wandb_utils.instrumentation import StepMetrics
+from wandb_utils.intermediate import fetch_table, read_table
+from wandb_utils.feature_cache import FeatureCache
+from run import TEXT_FEATURES, feature_cache_key, fit_preprocessor, get_inference_pipeline
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logger = logging.getLogger()
+
+# Sweep keys that change the ColumnTransformer; every other key goes to RandomForestRegressor
+PREPROCESSING_PARAMS = ("max_tfidf_features", "text_features", "hashing_features", "hashing_idf", "spatial_features")
+
+# Transformed matrices shared with the worker processes of the current preprocessing group
+_matrices = {}
+
+
+def expand_grid(sweep_config):
+    """
+    Expand {"param": [values, ...], ...} into the list of all configurations
+
+    :param sweep_config: dict of parameter name -> list of values (scalars are fixed values)
+    :return: list of dicts
+    """
+    keys = sorted(sweep_config)
+    values = [v if isinstance(v, list) else [v] for v in (sweep_config[k] for k in keys)]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def group_by_preprocessing(configs, default_preprocessing):
+    """
+    Group configurations by their preprocessing parameters
+
+    :param configs: list of configurations (see expand_grid)
+    :param default_preprocessing: value of every PREPROCESSING_PARAMS key when not swept
+    :return: dict of preprocessing params (as a sorted tuple of items) -> list of RF param dicts
+    """
+    groups = {}
+    for config in configs:
+        prep = dict(default_preprocessing)
+        prep.update({k: config[k] for k in PREPROCESSING_PARAMS if k in config})
+        rf_params = {k: v for k, v in config.items() if k not in PREPROCESSING_PARAMS}
+        groups.setdefault(tuple(sorted(prep.items())), []).append(rf_params)
+    return groups
+
+
+def _init_worker(X_train, y_train, X_val, y_val):
+    _matrices.update(X_train=X_train, y_train=y_train, X_val=X_val, y_val=y_val)
+
+
+def _fit_one(rf_config):
+    start = time.perf_counter()
+    model = RandomForestRegressor(**rf_config).fit(_matrices["X_train"], _matrices["y_train"])
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(_matrices["X_val"])
+    predict_time = time.perf_counter() - start
+
+    return {
+        "mae": mean_absolute_error(_matrices["y_val"], y_pred),
+        "r2": r2_score(_matrices["y_val"], y_pred),
+        "fit_time": fit_time,
+        "predict_time": predict_time,
+    }
+
+
+def run_sweep(X_train, y_train, X_val, y_val, base_rf_config, sweep_config, default_preprocessing, n_jobs,
+              cache=None, cache_key=None):
+    """
+    Fit every configuration of the sweep and return the results ranked by validation MAE
+
+    Each distinct preprocessing configuration is fitted once (or its matrices are taken from
+    the feature cache); the RF fits of the group then run in a process pool sharing the
+    transformed matrices. `n_jobs` is the total CPU budget, split between concurrent fits
+    and the n_jobs of each forest. `cache_key(prep)` gives the feature cache key of a
+    preprocessing configuration.
+    """
+    cpu_budget = n_jobs if n_jobs > 0 else os.cpu_count()
+    groups = group_by_preprocessing(expand_grid(sweep_config), default_preprocessing)
+    logger.info(
+        f"Sweeping {sum(len(g) for g in groups.values())} configurations "
+        f"in {len(groups)} preprocessing group(s) with a budget of {cpu_budget} CPUs"
+    )
+
+    results = []
+    for prep, rf_params_list in groups.items():
+        prep = dict(prep)
+
+        start = time.perf_counter()
+        sk_pipe, _ = get_inference_pipeline(base_rf_config, **prep)
+        Xt_train, Xt_val = fit_preprocessor(
+            sk_pipe, X_train, y_train, X_val, cache, cache_key(prep) if cache is not None else None
+        )
+        preprocess_time = time.perf_counter() - start
+        logger.info(f"Preprocessor {prep} fitted in {preprocess_time:.2f}s")
+
+        workers = min(cpu_budget, len(rf_params_list))
+        rf_configs = [
+            {**base_rf_config, **rf_params, "n_jobs": max(1, cpu_budget // workers)}
+            for rf_params in rf_params_list
+        ]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(Xt_train, y_train.to_numpy(), Xt_val, y_val.to_numpy()),
+        ) as pool:
+            for rf_params, scores in zip(rf_params_list, pool.map(_fit_one, rf_configs)):
+                results.append({**prep, **rf_params, **scores, "preprocess_time": preprocess_time})
+
+    ranked = pd.DataFrame(results).sort_values("mae").reset_index(drop=True)
+    ranked.insert(0, "rank", ranked.index + 1)
+    return ranked
+
+
+def go(args):
+
+    run = wandb.init(job_type="sweep_random_forest")
+    run.config.update(args)
+
+    with open(args.rf_config) as fp:
+        rf_config = json.load(fp)
+    rf_config['random_state'] = args.random_seed
+
+    with open(args.sweep_config) as fp:
+        sweep_config = json.load(fp)
+    run.config.update({"sweep": sweep_config})
+
+    with StepMetrics("sweep_random_forest") as metrics:
+        trainval_local_path = fetch_table(run, args.trainval_artifact)
+        with metrics.stage("read") as stage:
+            X = read_table(trainval_local_path)
+            y = X.pop("price")
+            stage.rows_out = len(X)
+        metrics.rows_in = len(X)
+
+        X_train, X_val, y_train, y_val = train_test_split(
+            X, y, test_size=args.val_size, stratify=X[args.stratify_by], random_state=args.random_seed
+        )
+
+        # preprocessing and the fits of every configuration (CPU time includes the pool workers)
+        with metrics.stage("sweep", rows_in=len(X_train)) as stage:
+            default_preprocessing = {
+                "max_tfidf_features": args.max_tfidf_features,
+                "text_features": args.text_features,
+                "hashing_features": args.hashing_features,
+                "hashing_idf": args.hashing_idf == "true",
+                "spatial_features": args.spatial_features == "true",
+            }
+            cache = None
+            if args.feature_cache_dir:
+                cache = FeatureCache(args.feature_cache_dir, max_bytes=args.feature_cache_max_mb * 2**20)
+            split = {"val_size": args.val_size, "random_seed": args.random_seed, "stratify_by": args.stratify_by}
+            ranked = run_sweep(
+                X_train, y_train, X_val, y_val, rf_config, sweep_config, default_preprocessing, args.n_jobs,
+                cache=cache,
+                cache_key=lambda prep: feature_cache_key(cache, trainval_local_path, {**prep, **split}),
+            )
+            stage.rows_out = len(ranked)
+
+        with metrics.stage("write", rows_in=len(ranked)):
+            ranked.to_csv(args.output, index=False)
+        metrics.rows_out = len(ranked)
+    logger.info(f"Sweep results written to {args.output}\n{ranked.head(10).to_string(index=False)}")
+
+    run.log({"sweep_results": wandb.Table(dataframe=ranked)})
+    best = ranked.iloc[0]
+    run.summary['best_mae'] = best["mae"]
+    run.summary['best_r2'] = best["r2"]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Random forest hyperparameter sweep")
+
+    parser.add_argument(
+        "--trainval_artifact",
+        type=str,
+        help="Artifact containing the training dataset. It will be split into train and validation"
+    )
+
+    parser.add_argument(
+        "--val_size",
+        type=float,
+        help="Size of the validation split. Fraction of the dataset, or number of items",
+    )
+
+    parser.add_argument(
+        "--random_seed",
+        type=int,
+        help="Seed for random number generator",
+        default=42,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--stratify_by",
+        type=str,
+        help="Column to use for stratification",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--rf_config",
+        help="Base random forest configuration (JSON file); swept parameters override it",
+        default="{}",
+    )
+
+    parser.add_argument(
+        "--sweep_config",
+        help="JSON file mapping parameter names to lists of values, e.g. "
+        '{"n_estimators": [50, 100], "max_depth": [10, 15], "max_tfidf_features": [5, 10]}; '
+        f"preprocessing keys: {', '.join(PREPROCESSING_PARAMS)}",
+        required=True,
+    )
+
+    parser.add_argument(
+        "--max_tfidf_features",
+        help="Maximum number of words to consider for the TFIDF (when not swept)",
+        default=10,
+        type=int
+    )
+
+    parser.add_argument(
+        "--text_features",
+        type=str,
+        help="Features of the listing name (when not swept): tfidf or hashing",
+        choices=TEXT_FEATURES,
+        default="tfidf",
+    )
+
+    parser.add_argument(
+        "--hashing_features",
+        type=int,
+        help="Number of hashed n-gram columns in hashing mode (when not swept)",
+        default=1024,
+    )
+
+    parser.add_argument(
+        "--hashing_idf",
+        type=str,
+        help="Weight the hashed n-grams by their IDF (when not swept)",
+        choices=["true", "false"],
+        default="true",
+    )
+
+    parser.add_argument(
+        "--spatial_features",
+        type=str,
+        help="Add features of the neighbourhood of the listing (when not swept)",
+        choices=["true", "false"],
+        default="false",
+    )
+
+    parser.add_argument(
+        "--feature_cache_dir",
+        type=str,
+        help="Directory of the cache of transformed feature matrices (empty to disable)",
+        default="feature_cache",
+    )
+
+    parser.add_argument(
+        "--feature_cache_max_mb",
+        type=int,
+        help="Size above which the least recently used cache entries are removed",
+        default=2048,
+    )
+
+    parser.add_argument(
+        "--n_jobs",
+        type=int,
+        help="Total number of CPUs the sweep may use (-1 for all)",
+        default=-1,
+    )
+
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Path of the ranked results table (CSV)",
+        default="sweep_results.csv",
+    )
+
+    args = parser.parse_args()
+
+    go(args)
@@ -0,0 +1,181 @@
+# step_cache.py — content-addressed cache of pipeline step outputs
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process locking
+    fcntl = None
+
+# the file digests are shared with the caches of components/wandb_utils
+_COMPONENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components")
+if _COMPONENTS_DIR not in sys.path:
+    sys.path.insert(0, _COMPONENTS_DIR)
+from wandb_utils.file_digest import DigestMemo  # noqa: E402
+
+_SOURCE_SUFFIXES = (".py", ".yml", ".yaml")
+_SOURCE_NAMES = ("MLproject",)
+
+
+class StepCache:
+    """
+    Local cache of step outputs keyed by a hash of the step's inputs, parameters and source.
+
+    Layout (under `root`):
+      <step>/<key>/manifest.json   what was stored and when
+      <step>/<key>/files/<rel>     copies of the step outputs, relative to `project_root`
+      file_hashes.json             digests memoized by (size, mtime) so unchanged
+                                   inputs are not re-read on every run
+      locks/<step>-<key>.lock      held while an entry is looked up, computed and stored
+
+    The cache can be shared by concurrent pipeline runs (e.g. the jobs of a parallel
+    multirun): a run holding the lock of an entry computes it, the others wait and then
+    restore it, so a step shared by all the runs (e.g. download) runs once.
+    """
+
+    def __init__(self, root: str, project_root: str):
+        self.root = root
+        self.project_root = project_root
+        self.hits = []
+        self.misses = []
+        # steps scheduled concurrently share the digest memo
+        self._memo = DigestMemo(os.path.join(root, "file_hashes.json"))
+
+    # ---------- hashing ----------
+    def _digest(self, path: str) -> str:
+        return self._memo.digest(path)
+
+    def _source_files(self, source_dirs):
+        files = []
+        for d in source_dirs:
+            d = os.path.join(self.project_root, d)
+            for name in sorted(os.listdir(d)):
+                p = os.path.join(d, name)
+                if os.path.isfile(p) and (name.endswith(_SOURCE_SUFFIXES) or name in _SOURCE_NAMES):
+                    files.append(p)
+        return files
+
+    def key(self, step: str, parameters: dict, source_dirs, inputs) -> str:
+        """
+        Compute the cache key of a step run.
+
+        Args:
+            step: step name (e.g. "basic_cleaning")
+            parameters: parameters passed to the step entry point
+            source_dirs: directories (relative to the project root) holding the step code
+            inputs: files (relative to the project root) the step may read; missing ones are
+                    recorded as absent so that creating them later invalidates the entry
+        """
+        payload = self._payload(step, parameters, source_dirs, inputs)
+        self._memo.save()
+
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def _payload(self, step: str, parameters: dict, source_dirs, inputs) -> dict:
+        payload = {
+            "step": step,
+            "parameters": {k: str(v) for k, v in sorted(parameters.items())},
+            "source": {
+                os.path.relpath(p, self.project_root): self._digest(p)
+                for p in self._source_files(source_dirs)
+            },
+            "inputs": {},
+        }
+        for rel in inputs:
+            p = os.path.join(self.project_root, rel)
+            payload["inputs"][rel] = self._digest(p) if os.path.isfile(p) else None
+        return payload
+
+    # ---------- lookup / store ----------
+    def _entry(self, step: str, key: str) -> str:
+        return os.path.join(self.root, step, key)
+
+    @contextlib.contextmanager
+    def lock(self, step: str, key: str):
+        """Exclusive inter-process lock of the entry (step, key), held for the body."""
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(self.root, "locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{step}-{key}.lock"), "w") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def restore(self, step: str, key: str) -> bool:
+        """Copy the cached outputs of (step, key) back in place. Returns False on a miss."""
+        entry = self._entry(step, key)
+        manifest_path = os.path.join(entry, "manifest.json")
+        if not os.path.exists(manifest_path):
+            self.misses.append(step)
+            print(f"[cache] MISS {step} (key {key[:12]})")
+            return False
+
+        with open(manifest_path) as fp:
+            manifest = json.load(fp)
+        for rel in manifest["outputs"]:
+            dst = os.path.join(self.project_root, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(os.path.join(entry, "files", rel), dst)
+
+        self.hits.append(step)
+        print(f"[cache] HIT  {step} (key {key[:12]}) restored {len(manifest['outputs'])} output(s)")
+        return True
+
+    def store(self, step: str, key: str, outputs, parameters: dict = None) -> None:
+        """Save the outputs of a successful step run under (step, key)."""
+        entry = self._entry(step, key)
+        tmp = f"{entry}.tmp.{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+
+        for rel in outputs:
+            src = os.path.join(self.project_root, rel)
+            if not os.path.isfile(src):
+                print(f"[cache] not storing {step}: expected output {rel} is missing")
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+            dst = os.path.join(tmp, "files", rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst)
+
+        os.makedirs(tmp, exist_ok=True)
+        with open(os.path.join(tmp, "manifest.json"), "w") as fp:
+            json.dump(
+                {
+                    "step": step,
+                    "key": key,
+                    "parameters": {k: str(v) for k, v in (parameters or {}).items()},
+                    "outputs": list(outputs),
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                },
+                fp,
+                indent=2,
+            )
+
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+
+    def invalidate(self, steps=None) -> None:
+        """Drop cached entries for the given steps (all steps if None)."""
+        if steps is None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._memo.clear()
+            print(f"[cache] invalidated all entries in {self.root}")
+            return
+        for step in steps:
+            shutil.rmtree(os.path.join(self.root, step), ignore_errors=True)
+            print(f"[cache] invalidated {step}")
+
+    def report(self) -> str:
+        return (
+            f"Step cache: {len(self.hits)} hit(s) {self.hits}, "
+            f"{len(self.misses)} miss(es) {self.misses}"
+        )
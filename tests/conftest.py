@@ -0,0 +1,36 @@
+"""
+Unit tests of the pipeline code (run from the project root: python -m pytest tests)
+
+The data tests of the data_check step live in src/data_check and run inside that step.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "components"))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def load_module(relative_path, name):
+    """
+    Import a step script (every step has its own run.py) under a unique module name
+
+    :param relative_path: path of the script from the project root
+    """
+    directory = os.path.join(PROJECT_ROOT, os.path.dirname(relative_path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)  # step-local modules, e.g. feature_engineering
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PROJECT_ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def store(tmp_path):
+    from wandb_utils.artifact_store import ArtifactStore
+
+    return ArtifactStore(str(tmp_path / "artifacts"))
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+
+def test_versions_and_latest(store, tmp_path):
+    data = tmp_path / "clean_sample.csv"
+    v0 = store.put("clean_sample.csv", _write(data, "a\n1\n"), "clean_data")
+    v1 = store.put("clean_sample.csv", _write(data, "a\n2\n"), "clean_data")
+
+    assert (v0["version"], v1["version"]) == ("v0", "v1")
+    assert open(store.find("clean_sample.csv:latest")).read() == "a\n2\n"
+    assert open(store.find("clean_sample.csv:v0")).read() == "a\n1\n"
+    assert store.find("clean_sample.csv") == store.find("clean_sample.csv:latest")
+    assert [r["version"] for r in store.versions("clean_sample.csv")] == ["v0", "v1"]
+
+
+def test_same_content_is_not_a_new_version(store, tmp_path):
+    path = _write(tmp_path / "clean_sample.csv", "a\n1\n")
+    assert store.put("clean_sample.csv", path)["version"] == "v0"
+    assert store.put("clean_sample.csv", path)["version"] == "v0"
+    # The content is stored once, under any name
+    other = store.put("copy.csv", path)
+    assert other["digest"] == store.lookup("clean_sample.csv")["digest"]
+
+
+def test_missing_artifacts(store):
+    assert store.lookup("nothing.csv:latest") is None
+    assert store.find("nothing.csv:v0") is None
+    assert store.versions("nothing.csv") == []
+
+
+def test_unknown_version_or_alias(store, tmp_path):
+    store.put("clean_sample.csv", _write(tmp_path / "clean_sample.csv", "a\n1\n"))
+    assert store.find("clean_sample.csv:v1") is None
+    assert store.find("clean_sample.csv:prod") is None
+
+
+def test_aliases(store, tmp_path):
+    data = tmp_path / "clean_sample.csv"
+    store.put("clean_sample.csv", _write(data, "a\n1\n"))
+    store.put("clean_sample.csv", _write(data, "a\n2\n"), aliases=("latest", "candidate"))
+
+    assert store.lookup("clean_sample.csv:candidate")["version"] == "v1"
+    store.alias("clean_sample.csv:v0", "prod")
+    assert store.lookup("clean_sample.csv:prod")["version"] == "v0"
+    with pytest.raises(FileNotFoundError):
+        store.alias("clean_sample.csv:v9", "prod")
+
+
+def test_reference_stays_on_the_first_version(store, tmp_path):
+    # basic_cleaning logs every sketch with default_aliases=("reference",)
+    sketch = tmp_path / "clean_sample.parquet.sketch.json"
+    for content in ("{}", '{"n_rows": 2}', '{"n_rows": 3}'):
+        store.put(sketch.name, _write(sketch, content), default_aliases=("reference",))
+    assert store.lookup(f"{sketch.name}:reference")["version"] == "v0"
+    assert store.lookup(f"{sketch.name}:latest")["version"] == "v2"
+
+    # Until it is moved explicitly
+    store.alias(f"{sketch.name}:v2", "reference")
+    store.put(sketch.name, _write(sketch, '{"n_rows": 4}'), default_aliases=("reference",))
+    assert store.lookup(f"{sketch.name}:reference")["version"] == "v2"
+
+
+def test_directory_artifact(store, tmp_path):
+    model = tmp_path / "random_forest_dir"
+    _write(model / "MLmodel", "flavors: {}\n")
+    _write(model / "compact" / "meta.json", "{}")
+    record = store.put("random_forest_export", str(model), "model_export")
+
+    found = store.find("random_forest_export:latest")
+    assert record["is_dir"] and os.path.isdir(found)
+    assert open(os.path.join(found, "compact", "meta.json")).read() == "{}"
+    assert store.find("random_forest_export:v0") == found  # built once
+
+
+def test_stores_are_independent(tmp_path):
+    from wandb_utils.artifact_store import ArtifactStore
+
+    path = _write(tmp_path / "raw.csv", "a\n")
+    ArtifactStore(str(tmp_path / "one")).put("raw.csv", path)
+    assert ArtifactStore(str(tmp_path / "two")).find("raw.csv") is None
+
+
+def test_default_store_follows_the_environment(tmp_path, monkeypatch):
+    from wandb_utils.artifact_store import STORE_ENV, default_store
+
+    monkeypatch.setenv(STORE_ENV, str(tmp_path / "run_store"))
+    assert default_store().root == str(tmp_path / "run_store")
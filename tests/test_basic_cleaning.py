@@ -0,0 +1,30 @@
+import pandas as pd
+
+from conftest import load_module
+
+cleaning = load_module("src/basic_cleaning/run.py", "basic_cleaning_run")
+
+
+def _counts():
+    return {"rows": 0, "price": 0, "nyc": 0, "nyc_skipped": False}
+
+
+def test_filters_accumulate_over_chunks():
+    df = pd.DataFrame({
+        "price": [5, 50, 60, 400],
+        "latitude": [40.7, 40.7, 10.0, 40.7],
+        "longitude": [-73.9, -73.9, -73.9, -73.9],
+    })
+    counts = _counts()
+    kept = [cleaning._apply_filters(df.iloc[i: i + 2], 10, 350, counts) for i in (0, 2)]
+
+    assert pd.concat(kept)["price"].tolist() == [50]
+    assert counts == {"rows": 4, "price": 2, "nyc": 1, "nyc_skipped": False}
+
+
+def test_chunks_without_coordinates_skip_the_nyc_filter():
+    counts = _counts()
+    for _ in range(2):
+        cleaning._apply_filters(pd.DataFrame({"price": [5, 50]}), 10, 350, counts)
+
+    assert counts == {"rows": 4, "price": 2, "nyc": 0, "nyc_skipped": True}
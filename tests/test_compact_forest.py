@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+from conftest import PROJECT_ROOT, load_module
+from wandb_utils.compact_forest import COMPACT_DIR, load_compact, save_compact
+from wandb_utils.intermediate import read_table
+
+train = load_module("src/train_random_forest/run.py", "train_random_forest_run")
+
+
+@pytest.fixture(scope="module")
+def listings():
+    df = read_table(f"{PROJECT_ROOT}/clean_sample.csv").sample(4000, random_state=0).reset_index(drop=True)
+    y = df.pop("price")
+    return df.iloc[:3000], y.iloc[:3000], df.iloc[3000:], y.iloc[3000:]
+
+
+def _config(engine):
+    if engine == "random_forest":
+        return {"n_estimators": 10, "max_depth": 8, "random_state": 0}
+    return {"max_iter": 30, "max_leaf_nodes": 15, "random_state": 0}
+
+
+@pytest.mark.parametrize("engine", list(train.ENGINES))
+@pytest.mark.parametrize("text_features", ["tfidf", "hashing"])
+def test_predictions_match_sklearn(tmp_path, listings, engine, text_features):
+    X_train, y_train, X_test, _ = listings
+    pipe, _ = train.get_inference_pipeline(
+        _config(engine), 5, text_features=text_features, hashing_features=64, engine=engine
+    )
+    pipe.fit(X_train, y_train)
+
+    code_paths = [f"{PROJECT_ROOT}/src/train_random_forest/feature_engineering.py"]
+    path = save_compact(pipe, str(tmp_path / COMPACT_DIR), code_paths=code_paths)
+    for mmap in (True, False):
+        compact = load_compact(str(tmp_path), mmap=mmap)  # the model directory holding compact/
+        np.testing.assert_allclose(compact.predict(X_test), pipe.predict(X_test), rtol=1e-5, atol=1e-4)
+    # Single rows, as when serving
+    np.testing.assert_allclose(load_compact(path).predict(X_test.iloc[:1]), pipe.predict(X_test.iloc[:1]), rtol=1e-5)
+
+
+def test_missing_values_follow_the_learned_direction(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 3))
+    y = X[:, 0] * 3 + np.where(rng.random(2000) < 0.2, 5.0, 0.0)
+    X[y > 4, 1] = np.nan  # missing values carry signal
+    pipe = Pipeline([
+        ("preprocessor", FunctionTransformer()),
+        ("model", HistGradientBoostingRegressor(max_iter=20, random_state=0)),
+    ]).fit(X, y)
+
+    compact = load_compact(save_compact(pipe, str(tmp_path / COMPACT_DIR)))
+    np.testing.assert_allclose(compact.predict(X), pipe.predict(X), rtol=1e-5, atol=1e-6)
+
+
+def test_wrong_number_of_features(tmp_path):
+    X = pd.DataFrame({"a": [0.0, 1.0, 2.0, 3.0]})
+    pipe = Pipeline([("preprocessor", FunctionTransformer()), ("model", RandomForestRegressor(n_estimators=2))])
+    compact = load_compact(save_compact(pipe.fit(X, [0, 1, 2, 3]), str(tmp_path / COMPACT_DIR)))
+    with pytest.raises(ValueError, match="Expected 1 features"):
+        compact.forest.predict(np.zeros((2, 3)))
+
+
+def test_unsupported_model(tmp_path):
+    from sklearn.linear_model import LinearRegression
+
+    pipe = Pipeline([("preprocessor", FunctionTransformer()), ("model", LinearRegression())])
+    pipe.fit([[0.0], [1.0]], [0, 1])
+    with pytest.raises(ValueError, match="cannot be exported"):
+        save_compact(pipe, str(tmp_path / COMPACT_DIR))
@@ -0,0 +1,111 @@
+import os
+import time
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.preprocessing import StandardScaler
+
+from wandb_utils.feature_cache import FeatureCache
+
+
+@pytest.fixture
+def data(tmp_path):
+    path = tmp_path / "trainval.csv"
+    path.write_text("a,b\n1,2\n")
+    code = tmp_path / "run.py"
+    code.write_text("print('v1')\n")
+    return str(path), str(code)
+
+
+def _key(cache, data, params=None):
+    data_path, code_path = data
+    return cache.key([data_path], params or {"max_tfidf_features": 5, "val_size": 0.2}, code_paths=[code_path])
+
+
+def test_key_changes_with_data_parameters_and_code(tmp_path, data):
+    cache = FeatureCache(str(tmp_path / "cache"))
+    key = _key(cache, data)
+    assert _key(FeatureCache(str(tmp_path / "cache")), data) == key
+    assert _key(cache, data, {"max_tfidf_features": 10, "val_size": 0.2}) != key
+
+    data_path, code_path = data
+    with open(code_path, "w") as fp:
+        fp.write("print('v2')\n")
+    code_key = _key(cache, data)
+    assert code_key != key
+    with open(data_path, "w") as fp:
+        fp.write("a,b\n1,3\n")
+    assert _key(cache, data) not in (key, code_key)
+
+
+def test_hit_returns_what_was_stored(tmp_path, data):
+    cache = FeatureCache(str(tmp_path / "cache"))
+    key = _key(cache, data)
+    assert cache.load(key) is None
+
+    dense = np.arange(12, dtype=np.float64).reshape(4, 3)
+    sparse = sp.random(5, 20, density=0.2, format="csr", random_state=0)
+    preprocessor = StandardScaler().fit(dense)
+    cache.store(key, {"train": dense, "val": sparse}, preprocessor)
+
+    matrices, cached_preprocessor = cache.load(key)
+    assert isinstance(matrices["train"], np.memmap)
+    np.testing.assert_array_equal(matrices["train"], dense)
+    assert sp.issparse(matrices["val"])
+    np.testing.assert_array_equal(matrices["val"].toarray(), sparse.toarray())
+    np.testing.assert_array_equal(cached_preprocessor.transform(dense), preprocessor.transform(dense))
+
+    # Another parameter value misses
+    assert cache.load(_key(cache, data, {"max_tfidf_features": 10})) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, data):
+    matrix = np.zeros((1000, 100))  # ~0.8 MB per entry
+    cache = FeatureCache(str(tmp_path / "cache"), max_bytes=2.5 * matrix.nbytes)  # two entries fit
+    keys = [_key(cache, data, {"max_tfidf_features": i}) for i in range(3)]
+    cache.store(keys[0], {"train": matrix}, None)
+    cache.store(keys[1], {"train": matrix}, None)
+    # Use the first entry: the second one is now the least recently used
+    past = time.time() - 60
+    os.utime(os.path.join(cache.root, keys[1], "manifest.json"), (past, past))
+    assert cache.load(keys[0]) is not None
+
+    cache.store(keys[2], {"train": matrix}, None)
+
+    assert [key for key, _, _ in cache.entries()] == [keys[0], keys[2]]
+    assert cache.load(keys[1]) is None
+
+
+def test_training_reuses_the_cached_preprocessing(tmp_path):
+    from conftest import PROJECT_ROOT, load_module
+    from wandb_utils.intermediate import read_table
+
+    train = load_module("src/train_random_forest/run.py", "train_random_forest_run")
+    X = read_table(f"{PROJECT_ROOT}/clean_sample.csv").iloc[:2000]
+    y = X.pop("price")
+    cache = FeatureCache(str(tmp_path / "cache"))
+    key = train.feature_cache_key(cache, f"{PROJECT_ROOT}/clean_sample.csv", {"max_tfidf_features": 5})
+
+    results = []
+    for _ in range(2):  # miss, then hit
+        sk_pipe, _ = train.get_inference_pipeline({"n_estimators": 2}, 5)
+        results.append(train.fit_preprocessor(sk_pipe, X.iloc[:1500], y.iloc[:1500], X.iloc[1500:], cache, key))
+        sk_pipe.steps[-1][1].fit(results[-1][0], y.iloc[:1500])
+        assert sk_pipe.predict(X.iloc[1500:]).shape == (500,)  # the preprocessor is fitted either way
+
+    for miss, hit in zip(*results):
+        np.testing.assert_allclose(hit.toarray() if sp.issparse(hit) else hit,
+                                   miss.toarray() if sp.issparse(miss) else miss)
+
+
+def test_training_key_covers_the_table_schema(tmp_path):
+    from conftest import PROJECT_ROOT, load_module
+    import wandb_utils.intermediate
+
+    train = load_module("src/train_random_forest/run.py", "train_random_forest_run")
+    cache = FeatureCache(str(tmp_path / "cache"))
+    calls = []
+    cache.key = lambda data_paths, params, code_paths=(): calls.append(list(code_paths))
+    train.feature_cache_key(cache, f"{PROJECT_ROOT}/clean_sample.csv", {})
+    assert wandb_utils.intermediate.__file__ in calls[0]
@@ -0,0 +1,29 @@
+import hashlib
+import os
+
+from wandb_utils.file_digest import DigestMemo, file_digest
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a,b\n" * 400_000)  # several blocks
+    assert file_digest(str(path)) == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_memo_rereads_changed_files_only(tmp_path, monkeypatch):
+    path = tmp_path / "data.csv"
+    path.write_text("a\n1\n")
+    memo = DigestMemo(str(tmp_path / "memo" / "file_hashes.json"))
+    digest = memo.digest(str(path))
+    memo.save()
+
+    # A new memo reads the saved digests: the unchanged file is not read again
+    reads = []
+    monkeypatch.setattr("wandb_utils.file_digest.file_digest", lambda p: reads.append(p) or "read")
+    memo = DigestMemo(str(tmp_path / "memo" / "file_hashes.json"))
+    assert memo.digest(str(path)) == digest
+    assert reads == []
+
+    path.write_text("a\n22\n")
+    assert memo.digest(str(path)) == "read"
+    assert reads == [os.path.abspath(str(path))]
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from wandb_utils.hash_split import SPLIT_CODES, assign_splits
+
+
+def _listings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id": rng.permutation(10 * n)[:n],
+        "neighbourhood_group": rng.choice(["Bronx", "Brooklyn", "Manhattan"], size=n),
+    })
+
+
+def test_split_of_a_listing_depends_only_on_its_id():
+    df = _listings(1000)
+    codes = assign_splits(df, 42, 0.2, 0.2)
+
+    # Another neighbourhood_group, other rows around it, other chunks: same split
+    moved = df.assign(neighbourhood_group="Queens")
+    assert np.array_equal(assign_splits(moved, 42, 0.2, 0.2), codes)
+    chunked = np.concatenate([assign_splits(df.iloc[i: i + 97], 42, 0.2, 0.2) for i in range(0, len(df), 97)])
+    assert np.array_equal(chunked, codes)
+    assert not np.array_equal(assign_splits(df, 43, 0.2, 0.2), codes)
+
+
+def test_split_sizes():
+    codes = assign_splits(_listings(100_000), 42, 0.2, 0.1)
+    assert abs(np.mean(codes == SPLIT_CODES["test"]) - 0.2) < 0.01
+    assert abs(np.mean(codes == SPLIT_CODES["val"]) - 0.1) < 0.01
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import DagScheduler, Step
+
+
+def _step(name, inputs=(), outputs=(), log=None, fail=False, duration=0.0):
+    def run(results):
+        if log is not None:
+            log.append(("start", name, sorted(results)))
+        time.sleep(duration)
+        if fail:
+            raise RuntimeError(f"{name} broke")
+        if log is not None:
+            log.append(("end", name))
+        return name.upper()
+
+    return Step(name, run, inputs, outputs)
+
+
+def test_order_follows_artifacts_not_declaration():
+    steps = [
+        _step("check", inputs=["clean"]),
+        _step("clean", inputs=["raw"], outputs=["clean"]),
+        _step("download", outputs=["raw"]),
+    ]
+    scheduler = DagScheduler(steps)
+    assert scheduler.order == ["download", "clean", "check"]
+    assert scheduler.dependencies == {"check": ["clean"], "clean": ["download"], "download": []}
+
+
+def test_steps_see_the_results_of_their_upstream_steps():
+    log = []
+    scheduler = DagScheduler([
+        _step("download", outputs=["raw"], log=log),
+        _step("clean", inputs=["raw"], outputs=["clean"], log=log),
+    ])
+    assert scheduler.run() == {"download": "ok", "clean": "ok"}
+    assert ("start", "clean", ["download"]) in log
+    assert scheduler.results == {"download": "DOWNLOAD", "clean": "CLEAN"}
+
+
+def test_failure_skips_downstream_steps_only():
+    scheduler = DagScheduler([
+        _step("download", outputs=["raw"]),
+        _step("clean", inputs=["raw"], outputs=["clean"], fail=True),
+        _step("check", inputs=["clean"]),
+        _step("split", inputs=["clean"], outputs=["trainval"]),
+        _step("train", inputs=["trainval"]),
+        _step("report", inputs=["raw"]),  # independent branch
+    ])
+    status = scheduler.run()
+    assert status == {
+        "download": "ok", "clean": "failed", "check": "skipped", "split": "skipped", "train": "skipped",
+        "report": "ok",
+    }
+    assert scheduler.failed() == ["clean"]
+    assert str(scheduler.errors["clean"]) == "clean broke"
+
+
+def test_independent_steps_run_concurrently():
+    running, peak = set(), []
+    lock = threading.Lock()
+
+    def run_factory(name):
+        def run(results):
+            with lock:
+                running.add(name)
+                peak.append(len(running))
+            time.sleep(0.1)
+            with lock:
+                running.discard(name)
+        return run
+
+    steps = [Step("download", run_factory("download"), outputs=["raw"])]
+    steps += [Step(f"check_{i}", run_factory(f"check_{i}"), inputs=["raw"]) for i in range(3)]
+    assert set(DagScheduler(steps, max_workers=2).run().values()) == {"ok"}
+    assert max(peak) == 2
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        DagScheduler([_step("a", inputs=["y"], outputs=["x"]), _step("b", inputs=["x"], outputs=["y"])])
+    with pytest.raises(ValueError, match="produced by both"):
+        DagScheduler([_step("a", outputs=["x"]), _step("b", outputs=["x"])])
+    with pytest.raises(ValueError, match="declared twice"):
+        DagScheduler([_step("a"), _step("a")])
@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import load_module
+
+serve = load_module("components/serve_model/run.py", "serve_model_run")
+
+
+class _Model:
+    """Stands in for the pipeline: the price is the number of nights, and a negative one fails"""
+    feature_names_in_ = np.array(["minimum_nights", "room_type"])
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, X):
+        self.batches.append(len(X))
+        if (X["minimum_nights"] < 0).any():
+            raise ValueError("negative minimum_nights")
+        return X["minimum_nights"].to_numpy(dtype=float)
+
+
+def _submit_together(batcher, requests):
+    # Submits every request from its own thread, like concurrent HTTP clients
+    results = [None] * len(requests)
+
+    def submit(i):
+        try:
+            results[i] = batcher.submit(requests[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _batcher(model, max_batch_size):
+    prepare, predict = serve.make_predict_fn(model)
+    # The batch waits (up to 10 s) until it holds max_batch_size rows
+    return serve.MicroBatcher(predict, max_batch_size, 10_000, serve.ServingStats(), prepare_fn=prepare)
+
+
+def test_bad_request_fails_alone_in_its_batch():
+    model = _Model()
+    batcher = _batcher(model, max_batch_size=2)
+    good = [{"minimum_nights": 3, "room_type": "Private room"}]
+    bad = [{"minimum_nights": -1, "room_type": "Private room"}]
+
+    results = _submit_together(batcher, [good, bad])
+
+    assert results[0] == [3.0]
+    assert isinstance(results[1], ValueError)
+    assert model.batches[0] == 2  # scored together first, then one by one
+    assert batcher.stats.snapshot()["batches"] == 1
+
+
+@pytest.mark.parametrize("bad", [
+    [{"room_type": "Private room"}],  # missing field
+    [{"minimum_nights": "three", "room_type": "Private room"}],  # wrong type
+    ["not a listing"],
+])
+def test_malformed_request_is_rejected_before_batching(bad):
+    model = _Model()
+    batcher = _batcher(model, max_batch_size=2)
+    good = [{"minimum_nights": 3, "room_type": "Entire home/apt"}, {"minimum_nights": 5, "room_type": "Shared room"}]
+
+    results = _submit_together(batcher, [good, bad])
+
+    assert results[0] == [3.0, 5.0]
+    assert isinstance(results[1], ValueError)
+    assert model.batches == [2]
+
+
+def test_prepare_applies_training_schema():
+    prepare, _ = serve.make_predict_fn(_Model())
+    X = prepare([{"room_type": "Private room", "minimum_nights": 2, "extra": 1}])
+    assert list(X.columns) == ["minimum_nights", "room_type"]
+    assert isinstance(X["room_type"].dtype, pd.CategoricalDtype)
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from step_cache import StepCache
+
+
+@pytest.fixture
+def project(tmp_path):
+    # A project with the code of one step, its input and the cache
+    root = tmp_path / "project"
+    (root / "step").mkdir(parents=True)
+    (root / "step" / "run.py").write_text("print('v1')\n")
+    (root / "data.csv").write_text("a,b\n1,2\n")
+    return root
+
+
+def _cache(project):
+    return StepCache(str(project / ".step_cache"), str(project))
+
+
+def _key(cache, parameters=None, inputs=("data.csv",)):
+    return cache.key("clean", parameters or {"min_price": 10}, ["step"], list(inputs))
+
+
+def test_key_is_stable(project):
+    assert _key(_cache(project)) == _key(_cache(project))
+
+
+@pytest.mark.parametrize("change", ["parameter", "input", "source", "new input"])
+def test_key_changes_with_what_the_step_depends_on(project, change):
+    cache = _cache(project)
+    key = _key(cache, inputs=("data.csv", "extra.csv"))
+    parameters = {"min_price": 10}
+    if change == "parameter":
+        parameters = {"min_price": 20}
+    elif change == "input":
+        (project / "data.csv").write_text("a,b\n1,3\n")
+    elif change == "source":
+        (project / "step" / "run.py").write_text("print('v2')\n")
+    else:
+        (project / "extra.csv").write_text("c\n")  # recorded as absent before
+    assert _key(cache, parameters, inputs=("data.csv", "extra.csv")) != key
+
+
+def test_key_ignores_files_that_are_not_code(project):
+    cache = _cache(project)
+    key = _key(cache)
+    (project / "step" / "notes.txt").write_text("not code\n")
+    assert _key(cache) == key
+
+
+def test_store_then_restore(project):
+    cache = _cache(project)
+    key = _key(cache)
+    assert not cache.restore("clean", key)
+
+    out = project / "step" / "clean.csv"
+    out.write_text("cleaned\n")
+    cache.store("clean", key, ["step/clean.csv"], {"min_price": 10})
+    out.unlink()
+
+    assert cache.restore("clean", key)
+    assert out.read_text() == "cleaned\n"
+    assert (cache.hits, cache.misses) == (["clean"], ["clean"])
+
+    # Another parameter value is another entry
+    assert not cache.restore("clean", _key(cache, {"min_price": 20}))
+
+
+def test_missing_output_is_not_stored(project):
+    cache = _cache(project)
+    key = _key(cache)
+    cache.store("clean", key, ["step/never_written.csv"])
+    assert not cache.restore("clean", key)
+    assert not os.path.exists(os.path.join(cache.root, "clean", key))
+
+
+def test_invalidate(project):
+    cache = _cache(project)
+    key = _key(cache)
+    (project / "step" / "clean.csv").write_text("cleaned\n")
+    cache.store("clean", key, ["step/clean.csv"])
+    cache.invalidate(["clean"])
+    assert not cache.restore("clean", key)